@@ -25,6 +25,15 @@ import data.__all_models
 
 target_metadata = SqlAlchemyBase.metadata
 
+# Таблицы, которых нет в моделях: поисковый индекс (миграция d3a7c5e9f412) с его служебными
+# таблицами и триггерами и статистика SQLite (ANALYZE)
+excluded_prefixes = ('users_fts', 'sqlite_')
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """ Функция исключает из autogenerate объекты базы данных, которых нет в моделях """
+    return not (name or '').startswith(excluded_prefixes)
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -47,6 +56,7 @@ def run_migrations_offline():
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -70,7 +80,8 @@ def run_migrations_online():
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata,
+            include_object=include_object
         )
 
         with context.begin_transaction():
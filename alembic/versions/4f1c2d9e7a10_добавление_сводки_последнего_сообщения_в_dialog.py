@@ -0,0 +1,59 @@
+"""Добавление сводки последнего сообщения и счетчиков непрочитанных в модель Dialog
+
+Revision ID: 4f1c2d9e7a10
+Revises: b3ed175f432a
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f1c2d9e7a10'
+down_revision = 'b3ed175f432a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('dialogs') as batch_op:
+        batch_op.add_column(sa.Column('last_message_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('last_message_preview', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('last_message_date', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('unread1', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('unread2', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.create_foreign_key('fk_dialogs_last_message_id', 'messages',
+                                    ['last_message_id'], ['id'])
+        batch_op.create_index('ix_dialogs_last_message_date', ['last_message_date'])
+
+    # Заполнение сводки по уже существующим сообщениям
+    op.execute("""
+        UPDATE dialogs SET last_message_id = (
+            SELECT messages.id FROM messages WHERE messages.dialog_id = dialogs.id
+            ORDER BY messages.send_date DESC, messages.id DESC LIMIT 1
+        )
+    """)
+    op.execute("""
+        UPDATE dialogs SET
+            last_message_preview = (SELECT substr(messages.content, 1, 100) FROM messages
+                                    WHERE messages.id = dialogs.last_message_id),
+            last_message_date = (SELECT messages.send_date FROM messages
+                                 WHERE messages.id = dialogs.last_message_id),
+            unread1 = (SELECT count(*) FROM messages WHERE messages.dialog_id = dialogs.id
+                       AND messages.id_from != dialogs.id1 AND NOT coalesce(messages.is_read, 0)),
+            unread2 = (SELECT count(*) FROM messages WHERE messages.dialog_id = dialogs.id
+                       AND messages.id_from != dialogs.id2 AND NOT coalesce(messages.is_read, 0))
+    """)
+    #
+
+
+def downgrade():
+    with op.batch_alter_table('dialogs') as batch_op:
+        batch_op.drop_index('ix_dialogs_last_message_date')
+        batch_op.drop_constraint('fk_dialogs_last_message_id', type_='foreignkey')
+        batch_op.drop_column('unread2')
+        batch_op.drop_column('unread1')
+        batch_op.drop_column('last_message_date')
+        batch_op.drop_column('last_message_preview')
+        batch_op.drop_column('last_message_id')
@@ -0,0 +1,36 @@
+"""Добавление счетчика непрочитанных диалогов в модель User
+
+Revision ID: 9a6e3b1f52c4
+Revises: 4f1c2d9e7a10
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a6e3b1f52c4'
+down_revision = '4f1c2d9e7a10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('unread_dialogs_amount', sa.Integer(), nullable=False,
+                                     server_default='0'))
+
+    # Заполнение счетчика по уже существующим диалогам
+    op.execute("""
+        UPDATE users SET unread_dialogs_amount = (
+            SELECT count(*) FROM dialogs
+            WHERE (dialogs.id1 = users.id AND dialogs.unread1 > 0)
+               OR (dialogs.id2 = users.id AND dialogs.unread2 > 0)
+        )
+    """)
+    #
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('unread_dialogs_amount')
@@ -0,0 +1,42 @@
+"""Очередь отправки писем
+
+Revision ID: a8d2e5f17c30
+Revises: f7c3a9e2b514
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8d2e5f17c30'
+down_revision = 'f7c3a9e2b514'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('mail_outbox',
+                    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+                    sa.Column('subject', sa.String(), nullable=False),
+                    sa.Column('sender', sa.String(), nullable=False),
+                    sa.Column('recipients', sa.String(), nullable=False),
+                    sa.Column('html', sa.Text(), nullable=False),
+                    sa.Column('status', sa.String(), nullable=False),
+                    sa.Column('attempts', sa.Integer(), nullable=False),
+                    sa.Column('next_attempt', sa.Float(), nullable=False),
+                    sa.Column('locked_by', sa.String(), nullable=True),
+                    sa.Column('locked_at', sa.Float(), nullable=True),
+                    sa.Column('last_error', sa.String(), nullable=True),
+                    sa.Column('create_date', sa.DateTime(), nullable=True),
+                    sa.Column('sent_date', sa.DateTime(), nullable=True),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_mail_outbox_status_next_attempt', 'mail_outbox',
+                    ['status', 'next_attempt'])
+
+
+def downgrade():
+    op.drop_index('ix_mail_outbox_status_next_attempt', table_name='mail_outbox')
+    op.drop_table('mail_outbox')
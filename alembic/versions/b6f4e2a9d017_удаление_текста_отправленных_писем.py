@@ -0,0 +1,30 @@
+"""Удаление текста отправленных писем
+
+Revision ID: b6f4e2a9d017
+Revises: a8d2e5f17c30
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6f4e2a9d017'
+down_revision = 'a8d2e5f17c30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('mail_outbox') as batch_op:
+        batch_op.alter_column('html', existing_type=sa.Text(), nullable=True)
+
+    op.execute("UPDATE mail_outbox SET html = NULL WHERE status = 'sent'")
+
+
+def downgrade():
+    op.execute("UPDATE mail_outbox SET html = '' WHERE html IS NULL")
+
+    with op.batch_alter_table('mail_outbox') as batch_op:
+        batch_op.alter_column('html', existing_type=sa.Text(), nullable=False)
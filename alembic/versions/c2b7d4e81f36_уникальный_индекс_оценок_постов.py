@@ -0,0 +1,33 @@
+"""Уникальный индекс оценок постов (post_id, user_id)
+
+Revision ID: c2b7d4e81f36
+Revises: 9a6e3b1f52c4
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2b7d4e81f36'
+down_revision = '9a6e3b1f52c4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Удаление повторных оценок (остается последняя) и оценок удаленных постов
+    op.execute("""
+        DELETE FROM post_rate WHERE post_id IS NULL OR id NOT IN (
+            SELECT max(id) FROM post_rate GROUP BY post_id, user_id
+        )
+    """)
+    #
+
+    op.create_index('ix_post_rate_post_id_user_id', 'post_rate', ['post_id', 'user_id'],
+                    unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_post_rate_post_id_user_id', table_name='post_rate')
@@ -0,0 +1,32 @@
+"""Пересчет счетчиков оценок постов по таблице post_rate
+
+Revision ID: c9e1f7a3b258
+Revises: b6f4e2a9d017
+Create Date: 2026-10-18 21:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9e1f7a3b258'
+down_revision = 'b6f4e2a9d017'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # После удаления повторных оценок (c2b7d4e81f36) счетчики постов учитывали и удаленные оценки
+    op.execute("""
+        UPDATE posts SET
+            likes = (SELECT count(*) FROM post_rate
+                     WHERE post_rate.post_id = posts.id AND post_rate.value = 1),
+            dislikes = (SELECT count(*) FROM post_rate
+                        WHERE post_rate.post_id = posts.id AND post_rate.value = -1)
+    """)
+    #
+
+
+def downgrade():
+    pass  # Прежние значения счетчиков были неверными, восстанавливать их не нужно
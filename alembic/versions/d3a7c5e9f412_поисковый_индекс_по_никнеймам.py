@@ -0,0 +1,61 @@
+"""Поисковый индекс по никнеймам пользователей (FTS5, trigram)
+
+Revision ID: d3a7c5e9f412
+Revises: c9e1f7a3b258
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.exc import OperationalError
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a7c5e9f412'
+down_revision = 'c9e1f7a3b258'
+branch_labels = None
+depends_on = None
+
+FTS_TABLE = 'users_fts'
+
+# Индекс хранит только ссылки на строки таблицы users и обновляется триггерами при регистрации,
+# изменении никнейма и удалении пользователя
+index_ddl = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(nickname, content='users', content_rowid='id', "
+    f"tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON users BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, nickname) VALUES (new.id, new.nickname); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON users BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, nickname) VALUES ('delete', old.id, old.nickname); "
+    f"END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF nickname ON users BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, nickname) VALUES ('delete', old.id, old.nickname); "
+    f"INSERT INTO {FTS_TABLE}(rowid, nickname) VALUES (new.id, new.nickname); END",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"  # Индексация существующих записей
+]
+
+
+def upgrade():
+    connection = op.get_bind()
+    if connection.dialect.name != 'sqlite':  # В других базах данных поиск работает через LIKE
+        return
+    if connection.execute(sa.text("SELECT name FROM sqlite_master WHERE name = :name"),
+                          {'name': FTS_TABLE}).first():  # Индекс уже создан при запуске сервера
+        return
+
+    try:
+        for statement in index_ddl:
+            op.execute(statement)
+    except OperationalError as e:  # Старая версия SQLite без FTS5 или токенизатора trigram
+        if 'fts5' not in str(e) and 'tokenizer' not in str(e):
+            raise
+        print(f'Поисковый индекс по никнеймам недоступен: {e}')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    for trigger in ('insert', 'delete', 'update'):
+        op.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{trigger}')
+    op.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
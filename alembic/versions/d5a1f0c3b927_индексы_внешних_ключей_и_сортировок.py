@@ -0,0 +1,48 @@
+"""Индексы внешних ключей и полей сортировки
+
+Revision ID: d5a1f0c3b927
+Revises: c2b7d4e81f36
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5a1f0c3b927'
+down_revision = 'c2b7d4e81f36'
+branch_labels = None
+depends_on = None
+
+# (название индекса, таблица, колонки)
+indexes = [
+    ('ix_messages_dialog_id_send_date_id', 'messages', ['dialog_id', 'send_date', 'id']),
+    ('ix_messages_id_to_is_read', 'messages', ['id_to', 'is_read']),
+    ('ix_dialogs_id1_id2', 'dialogs', ['id1', 'id2']),
+    ('ix_dialogs_id2_id1', 'dialogs', ['id2', 'id1']),
+    ('ix_friends_id1_id2', 'friends', ['id1', 'id2']),
+    ('ix_friends_id2_id1', 'friends', ['id2', 'id1']),
+    ('ix_friendship_offers_id_to_is_answered', 'friendship_offers', ['id_to', 'is_answered']),
+    ('ix_friendship_offers_id_from_id_to', 'friendship_offers', ['id_from', 'id_to']),
+    ('ix_post_rate_user_id', 'post_rate', ['user_id']),
+    ('ix_posts_author_create_date_id', 'posts', ['author', 'create_date', 'id']),
+    ('ix_posts_create_date_id', 'posts', ['create_date', 'id']),
+    ('ix_posts_likes_id', 'posts', ['likes', 'id']),
+    ('ix_posts_dislikes_id', 'posts', ['dislikes', 'id']),
+    ('ix_posts_to_tags_post_id_tag_id', 'posts_to_tags', ['post_id', 'tag_id']),
+    ('ix_posts_to_tags_tag_id_post_id', 'posts_to_tags', ['tag_id', 'post_id']),
+    ('ix_notifications_user_id_id', 'notifications', ['user_id', 'id']),
+]
+
+
+def upgrade():
+    for name, table, columns in indexes:
+        op.create_index(name, table, columns)
+    if op.get_bind().dialect.name in ('sqlite', 'postgresql'):
+        op.execute('ANALYZE')  # Статистика для выбора индексов планировщиком
+
+
+def downgrade():
+    for name, table, columns in reversed(indexes):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,31 @@
+"""Удаление поля sid из модели User
+
+Revision ID: e4b8c1a6d293
+Revises: d5a1f0c3b927
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b8c1a6d293'
+down_revision = 'd5a1f0c3b927'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite 3.35+ удаляет столбец без пересоздания таблицы (пересоздание удалило бы триггеры
+    # поискового индекса users_fts)
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite' or bind.dialect.dbapi.sqlite_version_info >= (3, 35):
+        op.drop_column('users', 'sid')
+    else:
+        with op.batch_alter_table('users') as batch_op:
+            batch_op.drop_column('sid')
+
+
+def downgrade():
+    op.add_column('users', sa.Column('sid', sa.String(), nullable=True))
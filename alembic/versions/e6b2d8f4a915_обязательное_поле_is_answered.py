@@ -0,0 +1,29 @@
+"""Обязательное поле is_answered в модели FriendshipOffer
+
+Revision ID: e6b2d8f4a915
+Revises: d3a7c5e9f412
+Create Date: 2026-10-18 22:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6b2d8f4a915'
+down_revision = 'd3a7c5e9f412'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # NULL в поле сортировки ломает keyset-пагинацию подписчиков (сравнение с NULL - не истина)
+    op.execute('UPDATE friendship_offers SET is_answered = 0 WHERE is_answered IS NULL')
+
+    with op.batch_alter_table('friendship_offers') as batch_op:
+        batch_op.alter_column('is_answered', existing_type=sa.Boolean(), nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('friendship_offers') as batch_op:
+        batch_op.alter_column('is_answered', existing_type=sa.Boolean(), nullable=True)
@@ -0,0 +1,30 @@
+"""Хранилище медиафайлов
+
+Revision ID: f7c3a9e2b514
+Revises: e4b8c1a6d293
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7c3a9e2b514'
+down_revision = 'e4b8c1a6d293'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('media',
+                    sa.Column('key', sa.String(length=64), nullable=False),
+                    sa.Column('size', sa.Integer(), nullable=False),
+                    sa.Column('refcount', sa.Integer(), nullable=False, server_default='0'),
+                    sa.Column('create_date', sa.DateTime(), nullable=True),
+                    sa.PrimaryKeyConstraint('key')
+                    )
+
+
+def downgrade():
+    op.drop_table('media')
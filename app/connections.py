@@ -0,0 +1,95 @@
+import time
+import threading
+
+
+class ConnectionRegistry:
+    """
+    Класс-реестр подключений к WebSocket серверу (в памяти процесса).
+    Хранит все подключения (sid) с их данными, а также множество sid каждого пользователя
+    (вкладки, устройства). Добавление, удаление и проверка подключения выполняются за O(1)
+    и не требуют обращений к базе данных. Счетчики реестра используются для мониторинга
+    """
+
+    def __init__(self):
+        self.sockets = {}  # sid: {'user_id', 'connected_at', 'transport'}
+        self.users = {}  # user_id: множество sid подключений пользователя
+        self.lock = threading.Lock()
+
+        # Счетчики для мониторинга
+        self.started_at = time.time()
+        self.connects_total = 0
+        self.disconnects_total = 0
+        self.peak_connections = 0
+        self.anonymous_connections = 0
+        #
+
+    def __len__(self) -> int:
+        return len(self.sockets)
+
+    def __contains__(self, sid: str) -> bool:
+        return sid in self.sockets
+
+    def add(self, sid: str, user_id=None, transport=None):
+        """
+        Метод регистрирует подключение
+        :param sid: sid подключения
+        :param user_id: id пользователя (None - пользователь не авторизован)
+        :param transport: Транспорт подключения (websocket, polling)
+        """
+
+        with self.lock:
+            self.sockets[sid] = {'user_id': user_id, 'connected_at': time.time(),
+                                 'transport': transport}
+            if user_id is not None:
+                self.users.setdefault(user_id, set()).add(sid)
+            else:
+                self.anonymous_connections += 1
+
+            self.connects_total += 1
+            self.peak_connections = max(self.peak_connections, len(self.sockets))
+
+    def remove(self, sid: str):
+        """ Метод удаляет подключение. Возвращает id пользователя (None, если его нет) """
+
+        with self.lock:
+            info = self.sockets.pop(sid, None)
+            if info is None:  # Подключение уже удалено
+                return None
+            self.disconnects_total += 1
+
+            user_id = info['user_id']
+            sids = self.users.get(user_id)
+            if user_id is None:
+                self.anonymous_connections -= 1
+            elif sids is not None:
+                sids.discard(sid)
+                if not sids:  # Последнее подключение пользователя закрыто
+                    del self.users[user_id]
+        return user_id
+
+    def get(self, sid: str):
+        """ Метод возвращает данные подключения (None, если подключения нет) """
+        return self.sockets.get(sid)
+
+    def sids(self, user_id: int) -> set:
+        """ Метод возвращает множество sid подключений пользователя """
+        return set(self.users.get(user_id, ()))
+
+    def is_online(self, user_id: int) -> bool:
+        """ Метод проверяет, есть ли у пользователя открытые подключения """
+        return user_id in self.users
+
+    def online_users(self) -> list:
+        """ Метод возвращает список id подключенных пользователей """
+        return list(self.users)
+
+    def stats(self) -> dict:
+        """ Метод возвращает счетчики реестра для мониторинга """
+
+        with self.lock:
+            return {'connections': len(self.sockets), 'users_online': len(self.users),
+                    'anonymous_connections': self.anonymous_connections,
+                    'peak_connections': self.peak_connections,
+                    'connects_total': self.connects_total,
+                    'disconnects_total': self.disconnects_total,
+                    'uptime': time.time() - self.started_at}
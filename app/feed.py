@@ -0,0 +1,71 @@
+from sqlalchemy import exists
+from sqlalchemy.orm import Query, Session, selectinload
+
+from app.forms import sort_types
+from data.models.post import Post, association_table
+
+sortable_fields = [field for field, _ in sort_types]  # Поля, по которым можно сортировать ленту
+sort_directions = ['asc', 'desc']
+default_state = {'tags': [], 'sort': 'create_date', 'order': 'desc'}
+
+
+def feed_state(tags, sort, order) -> dict:
+    """
+    Функция возвращает проверенные параметры отображения ленты (фильтрация и сортировка).
+    Некорректные значения заменяются значениями по умолчанию
+    :param tags: Список id тегов (строки или числа)
+    :param sort: Поле сортировки
+    :param order: Направление сортировки
+    :return: Словарь с ключами tags (отсортированный список id тегов), sort и order
+    """
+
+    tags = sorted({int(tag) for tag in tags or [] if str(tag).isdigit()})
+    return {'tags': tags,
+            'sort': sort if sort in sortable_fields else default_state['sort'],
+            'order': order if order in sort_directions else default_state['order']}
+
+
+def feed_state_args(state: dict) -> dict:
+    """ Функция возвращает параметры запроса для ссылок ленты (без значений по умолчанию) """
+    return {key: value for key, value in state.items() if value != default_state[key]}
+
+
+def suitable_posts_query(session: Session, tags: list) -> Query:
+    """
+    Функция строит запрос постов, подходящих под условия отбора. Посты при этом не загружаются
+    :param session: Сессия общения с базой данных
+    :param tags: Список id тегов. Пост подходит, если у него есть хотя бы один из указанных тегов
+    :return: Объект Query с фильтрацией на стороне базы данных
+    """
+
+    query = session.query(Post).options(*post_card_options())
+
+    if tags:  # Фильтрация по тегам через полусоединение с таблицей posts_to_tags
+        tag_ids = [int(tag) for tag in tags]
+        query = query.filter(exists().where(association_table.c.post_id == Post.id,
+                                            association_table.c.tag_id.in_(tag_ids)))
+
+    return query
+
+
+def post_card_options() -> list:
+    """ Функция возвращает опции загрузки связей, нужных карточке поста (автор и теги) """
+    return [selectinload(Post.user), selectinload(Post.tags)]
+
+
+def post_tag_ids(session: Session, post_ids: list) -> set:
+    """ Функция возвращает id тегов постов (без загрузки самих постов) """
+    return {tag_id for tag_id, in session.query(association_table.c.tag_id).filter(
+        association_table.c.post_id.in_(post_ids)).distinct()}
+
+
+def feed_order(field: str, sort_type: str) -> list:
+    """
+    Функция возвращает порядок сортировки постов для пагинации
+    :param field: Поле модели Post, по которому сортируются посты
+    :param sort_type: Направление сортировки ('asc' или 'desc')
+    :return: Список пар (колонка, направление сортировки)
+    """
+
+    # Сортировка по id нужна для однозначного порядка постов с одинаковым значением поля
+    return [(getattr(Post, field), sort_type), (Post.id, sort_type)]
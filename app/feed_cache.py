@@ -0,0 +1,74 @@
+import time
+import threading
+
+from collections import OrderedDict
+
+
+class FeedCache:
+    """
+    Класс-кэш страниц ленты новостей (LRU с ограниченным временем жизни записей).
+    Хранит id постов страницы и данные пагинации по ключу (теги, поле и направление сортировки,
+    страница, курсор). Записи сбрасываются при изменении постов с соответствующими тегами
+    """
+
+    def __init__(self, max_size=256, ttl=30):
+        """
+        :param max_size: Максимальное количество страниц в кэше
+        :param ttl: Время жизни страницы в секундах
+        """
+
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self.entries = OrderedDict()  # ключ: (время сохранения, данные страницы)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(state: dict, page: int, cursor=None) -> tuple:
+        """ Метод возвращает ключ страницы ленты по параметрам отображения (feed_state) """
+        return tuple(state['tags']), state['sort'], state['order'], page, cursor
+
+    def get(self, key: tuple):
+        """ Метод возвращает данные страницы из кэша (None, если их нет или они устарели) """
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self.ttl:
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: tuple, value: dict):
+        """ Метод сохраняет данные страницы в кэш (вытесняя давно не использованные страницы) """
+
+        with self.lock:
+            self.entries[key] = (time.time(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, tags, fields=None, unfiltered=True):
+        """
+        Метод сбрасывает страницы ленты, на которые могло повлиять изменение поста
+        :param tags: id тегов измененного поста
+        :param fields: Поля сортировки, которых коснулось изменение (None - любые)
+        :param unfiltered: Сбрасывать ли страницы ленты без фильтрации по тегам
+        """
+
+        tags = set(tags)
+        with self.lock:
+            for key in list(self.entries):
+                key_tags, sort = key[0], key[1]
+                if fields is not None and sort not in fields:
+                    continue
+                if (not key_tags and unfiltered) or tags.intersection(key_tags):
+                    del self.entries[key]
+
+    def clear(self):
+        """ Метод полностью очищает кэш """
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,122 @@
+import io
+import threading
+
+from eventlet import tpool
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Форматы, которые принимаются при загрузке
+allowed_formats = {'JPEG', 'PNG', 'GIF', 'WEBP', 'BMP'}
+
+# Варианты изображения: название - наибольшая сторона в пикселях
+variants = {'thumb': 128, 'medium': 800, 'original': 2048}
+
+# Форматы сохранения: расширение - (формат Pillow, параметры сохранения)
+output_formats = {
+    'jpg': ('JPEG', {'progressive': True, 'optimize': True}),  # Прогрессивный JPEG для всех
+    'webp': ('WEBP', {'method': 4})  # WebP для браузеров, которые его поддерживают
+}
+
+
+class ImageError(ValueError):
+    """ Исключение для загруженных файлов, которые не являются допустимыми изображениями """
+    pass
+
+
+class ImagePipeline:
+    """
+    Класс обработки загружаемых изображений (аватары, картинки постов).
+    Изображение проверяется, декодируется, поворачивается по EXIF и сохраняется в нескольких
+    размерах (variants) в прогрессивном JPEG и WebP в хранилище медиафайлов (MediaStore) под
+    ключом - хэшем содержимого, поэтому одинаковые загрузки не обрабатываются повторно.
+    Обработка выполняется в пуле системных потоков (eventlet.tpool), чтобы декодирование
+    и сжатие не блокировали остальные запросы сервера
+    """
+
+    def __init__(self, store, workers=4, max_bytes=10 * 1024 * 1024, max_pixels=40_000_000,
+                 quality=85):
+        """
+        :param store: Хранилище медиафайлов (MediaStore)
+        :param workers: Максимальное количество одновременно обрабатываемых изображений
+        :param max_bytes: Максимальный размер загружаемого файла в байтах
+        :param max_pixels: Максимальное количество пикселей изображения (защита от
+                           "декомпрессионных бомб")
+        :param quality: Качество сжатия JPEG и WebP
+        """
+
+        self.store = store
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.quality = quality
+
+        self.slots = threading.BoundedSemaphore(workers)
+
+    def process(self, session, file) -> str:
+        """
+        Метод обрабатывает загруженный файл и сохраняет все варианты изображения в хранилище
+        (или добавляет ссылку на уже загруженное такое же изображение)
+        :param session: Сессия общения с базой данных
+        :param file: Загруженный файл (FileStorage)
+        :return: Ключ изображения в хранилище для сохранения в базе данных
+        """
+
+        data = file.read(self.max_bytes + 1)
+        if not data:
+            raise ImageError('Файл пустой')
+        if len(data) > self.max_bytes:
+            raise ImageError(f'Файл больше {self.max_bytes // (1024 * 1024)} МБ')
+
+        return self.store.put(session, data, self.build)
+
+    def build(self, data: bytes) -> dict:
+        """ Метод возвращает файлы вариантов изображения {имя файла: содержимое} """
+
+        with self.slots:  # Ограничение количества одновременно обрабатываемых изображений
+            return tpool.execute(self.encode_variants, data)
+
+    def encode_variants(self, data: bytes) -> dict:
+        """ Метод декодирует изображение и сжимает его варианты (выполняется в пуле потоков) """
+
+        image = self.decode(data)
+
+        files = {}
+        for variant, size in variants.items():
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)  # Уменьшение с сохранением пропорций
+
+            for ext, (image_format, options) in output_formats.items():
+                buffer = io.BytesIO()
+                resized.save(buffer, image_format, quality=self.quality, **options)
+                files[variant_name(variant, ext == 'webp')] = buffer.getvalue()
+
+        return files
+
+    def decode(self, data: bytes) -> Image.Image:
+        """ Метод проверяет и декодирует изображение. Возвращает изображение в режиме RGB """
+
+        try:
+            image = Image.open(io.BytesIO(data))
+        except (UnidentifiedImageError, OSError):
+            raise ImageError('Файл не является изображением')
+
+        if image.format not in allowed_formats:
+            raise ImageError(f'Неподдерживаемый формат изображения: {image.format}')
+        if image.width * image.height > self.max_pixels:
+            raise ImageError('Слишком большое разрешение изображения')
+
+        try:
+            image.load()
+        except (OSError, SyntaxError):  # Поврежденный или обрезанный файл
+            raise ImageError('Файл изображения поврежден')
+
+        image = ImageOps.exif_transpose(image)  # Поворот фотографий с телефонов
+        if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:  # Прозрачный фон - белый
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            return background
+        return image.convert('RGB')
+
+
+def variant_name(variant='medium', webp=False) -> str:
+    """ Функция возвращает имя файла варианта изображения в хранилище (thumb.jpg, medium.webp) """
+    return f'{variant}.{"webp" if webp else "jpg"}'
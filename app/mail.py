@@ -1,22 +1,206 @@
+import json
+import time
+import uuid
+import random
+import smtplib
+import threading
+import datetime as dt
+
 from flask import Flask
 from flask_mail import Message, Mail
-from threading import Thread
+from sqlalchemy import and_, or_, select
+
+from data import db_session
+from data.models.mail import OutgoingMail
+
+
+class MailOutbox:
+    """
+    Класс очереди отправки писем. Письмо сохраняется в таблицу mail_outbox в запросе, а отправляют
+    его фоновые обработчики (ограниченное количество): пачками, через постоянное SMTP соединение
+    каждого обработчика. При ошибке отправка повторяется с экспоненциально растущей задержкой.
+    Письма не теряются при перезапуске сервера (могут быть отправлены повторно, если сервер
+    остановился во время отправки пачки)
+    """
+
+    def __init__(self, mail: Mail, workers=2, batch_size=20, max_attempts=6, retry_delay=30,
+                 max_retry_delay=3600, poll_interval=10, keepalive=60, lock_timeout=300,
+                 keep_sent=7 * 24 * 60 * 60):
+        """
+        :param mail: Объект Flask-Mail
+        :param workers: Количество обработчиков (одновременных SMTP соединений)
+        :param batch_size: Количество писем, которое обработчик берет из очереди за раз
+        :param max_attempts: Количество попыток отправки письма
+        :param retry_delay: Задержка перед второй попыткой в секундах (дальше удваивается)
+        :param max_retry_delay: Максимальная задержка между попытками в секундах
+        :param poll_interval: Интервал проверки очереди в секундах (если новых писем не было)
+        :param keepalive: Время, в течение которого неиспользуемое SMTP соединение не закрывается
+        :param lock_timeout: Время, после которого письмо, взятое остановившимся обработчиком,
+                             снова отправляется, в секундах
+        :param keep_sent: Время хранения отправленных писем в секундах
+        """
+
+        self.mail = mail
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.poll_interval = poll_interval
+        self.keepalive = keepalive
+        self.lock_timeout = lock_timeout
+        self.keep_sent = keep_sent
+
+        self.app = None
+        self.threads = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()  # Сигнал обработчикам о новых письмах
+        self.purged_at = 0
+
+    def init_app(self, app: Flask):
+        """ Метод подключает очередь к приложению (обработчики работают в его контексте) """
+        self.app = app
+
+    def send_email(self, subject: str, sender: str, recipients: list, html_body: str):
+        """ Метод добавляет письмо в очередь отправки """
+
+        session = db_session.create_session()
+        session.add(OutgoingMail(subject=subject, sender=sender, recipients=json.dumps(recipients),
+                                 html=html_body))
+        session.commit()
+
+        self.start()
+        self.wakeup.set()
+
+    def start(self):
+        """ Метод запускает фоновые обработчики (если они еще не запущены) """
+
+        with self.lock:
+            while len(self.threads) < self.workers:
+                thread = threading.Thread(target=self.run, daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def run(self):
+        """ Метод фонового обработчика. Отправляет письма из очереди, пока она не опустеет """
+
+        connection, used_at = None, 0
+        with self.app.app_context():
+            while True:
+                try:
+                    rows = self.claim()
+                    if rows:
+                        connection = self.send_batch(rows, connection)
+                        used_at = time.time()
+                        continue
+
+                    if connection is not None and time.time() - used_at > self.keepalive:
+                        connection = self.close(connection)  # Закрытие простаивающего соединения
+                    self.purge()
+                except Exception:  # Ошибка базы данных не должна останавливать обработчик
+                    self.app.logger.exception('Mail outbox worker error')
+                finally:
+                    db_session.remove_session()
+
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+
+    def claim(self) -> list:
+        """ Метод берет из очереди пачку писем, готовых к отправке, и помечает их как отправляемые """
+
+        session = db_session.create_session()
+        now, token = time.time(), uuid.uuid4().hex
+
+        ready = or_(and_(OutgoingMail.status == 'pending', OutgoingMail.next_attempt <= now),
+                    and_(OutgoingMail.status == 'sending',  # Письма остановившихся обработчиков
+                         OutgoingMail.locked_at < now - self.lock_timeout))
+        ids = select(OutgoingMail.id).where(ready).order_by(OutgoingMail.id).limit(self.batch_size)
+
+        # Условие ready повторяется в UPDATE, чтобы одно письмо не взяли два обработчика
+        session.query(OutgoingMail).filter(OutgoingMail.id.in_(ids), ready).update(
+            {OutgoingMail.status: 'sending', OutgoingMail.locked_by: token,
+             OutgoingMail.locked_at: now}, synchronize_session=False)
+        session.commit()
+
+        return session.query(OutgoingMail).filter(OutgoingMail.locked_by == token,
+                                                  OutgoingMail.status == 'sending').all()
+
+    def send_batch(self, rows: list, connection):
+        """
+        Метод отправляет пачку писем через одно SMTP соединение. Результат каждого письма
+        сохраняется сразу, чтобы ошибка следующего письма не привела к повторной отправке.
+        Возвращает соединение
+        """
+
+        session = db_session.create_session()
+        for i, row in enumerate(rows):
+            try:
+                message = Message(row.subject, sender=row.sender,
+                                  recipients=json.loads(row.recipients))
+                message.html = row.html
+
+                if connection is None:
+                    connection = self.mail.connect()
+                    connection.host = None  # Соединение еще не открыто (для close при ошибке)
+                    connection.__enter__()
+                connection.send(message)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused,
+                    smtplib.SMTPDataError) as e:  # Ошибка конкретного письма (например, адреса)
+                self.retry(row, e)
+            except OSError as e:  # Соединение потеряно (smtplib.SMTPException - подкласс OSError)
+                # Остальные письма пачки вернутся в очередь без потери попытки
+                connection = self.close(connection)
+                self.retry(row, e)
+                for other in rows[i + 1:]:
+                    other.status, other.locked_by = 'pending', None
+                session.commit()
+                break
+            except Exception as e:  # Письмо, которое нельзя отправить (BadHeaderError и др.)
+                self.retry(row, e)
+            else:
+                row.status, row.locked_by, row.sent_date = 'sent', None, dt.datetime.now()
+                row.html = None  # Текст отправленного письма не хранится (в нем ссылки с токенами)
+
+            session.commit()
+
+        return connection
+
+    def retry(self, row: OutgoingMail, error: Exception):
+        """ Метод откладывает повторную отправку письма (или помечает его неотправленным) """
 
+        row.attempts += 1
+        row.locked_by = None
+        row.last_error = f'{type(error).__name__}: {error}'[:500]
 
-def send_async_email(app: Flask, mail: Mail, msg: Message):
-    """ Асинхронная функция отправки сообщение на почту """
+        if row.attempts >= self.max_attempts:
+            row.status = 'failed'
+            return
 
-    with app.app_context():
-        mail.send(msg)
+        delay = min(self.retry_delay * 2 ** (row.attempts - 1), self.max_retry_delay)
+        row.status = 'pending'
+        row.next_attempt = time.time() + delay * random.uniform(0.8, 1.2)  # Разброс для пачек
 
+    @staticmethod
+    def close(connection):
+        """ Метод закрывает SMTP соединение (ошибки закрытия игнорируются). Возвращает None """
 
-def send_email(app: Flask, mail: Mail, subject: str, sender: str, recipients: list, html_body: str):
-    """ Генерация сообщения для отправки на почту """
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except OSError:
+                pass
+        return None
 
-    msg = Message(subject, sender=sender, recipients=recipients)
-    msg.html = html_body
-    Thread(target=send_async_email, args=(app, mail, msg)).start()
+    def purge(self):
+        """ Метод удаляет давно отправленные письма (не чаще раза в час) """
 
+        if time.time() - self.purged_at < 60 * 60:
+            return
+        self.purged_at = time.time()
 
-if __name__ == '__main__':
-    pass
+        session = db_session.create_session()
+        session.query(OutgoingMail).filter(
+            OutgoingMail.status == 'sent',
+            OutgoingMail.sent_date < dt.datetime.now() - dt.timedelta(seconds=self.keep_sent)
+        ).delete(synchronize_session=False)
+        session.commit()
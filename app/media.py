@@ -0,0 +1,294 @@
+import os
+import shutil
+import hashlib
+import mimetypes
+import threading
+
+from flask import Response, request, send_file
+from sqlalchemy import event, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from data.models.media import Media
+from app.rating import upsert_functions
+
+KEY_LENGTH = 64  # Длина ключа (sha256 в шестнадцатеричном виде)
+MAX_AGE = 365 * 24 * 60 * 60  # Время кэширования файлов браузером (содержимое ключа не меняется)
+DELETED_KEYS = 'media_deleted_keys'  # Ключ session.info с ключами, файлы которых нужно удалить
+WRITTEN_KEYS = 'media_written_keys'  # Ключ session.info с ключами, файлы которых записаны сессией
+
+
+def media_key(data: bytes) -> str:
+    """ Функция возвращает ключ хранилища для содержимого файла """
+    return hashlib.sha256(data).hexdigest()
+
+
+def is_media_key(name) -> bool:
+    """ Функция проверяет, что имя является ключом хранилища медиафайлов """
+    return bool(name) and len(name) == KEY_LENGTH and all(c in '0123456789abcdef' for c in name)
+
+
+def shard(key: str) -> str:
+    """ Функция возвращает путь ключа с разбиением по подпапкам (ab/cd/abcd...) """
+    return f'{key[:2]}/{key[2:4]}/{key}'
+
+
+class LocalBackend:
+    """
+    Класс-хранилище файлов на локальном диске. Файлы ключа хранятся в папке root/ab/cd/<ключ>,
+    чтобы в одной папке не оказывалось слишком много файлов
+    """
+
+    def __init__(self, root='media', send=send_file):
+        """
+        :param root: Корневая папка хранилища
+        :param send: Функция отдачи файла (path, mimetype, etag, max_age) -> Response
+        """
+
+        self.root = root
+        self.send = send
+
+    def path(self, key: str, name: str) -> str:
+        """ Метод возвращает путь к файлу ключа """
+        return os.path.join(self.root, shard(key), name)
+
+    def write(self, key: str, name: str, data: bytes, content_type=None):
+        """ Метод сохраняет файл (через временный файл, чтобы не отдать недописанный файл) """
+
+        path = self.path(key, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    def exists(self, key: str, name: str) -> bool:
+        """ Метод проверяет, что файл существует """
+        return os.path.exists(self.path(key, name))
+
+    def delete(self, key: str):
+        """ Метод удаляет все файлы ключа """
+        shutil.rmtree(os.path.join(self.root, shard(key)), ignore_errors=True)
+
+    def response(self, key: str, name: str, mimetype: str, etag: str) -> Response:
+        """ Метод возвращает ответ с содержимым файла """
+        path = self.path(key, name)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        return self.send(os.path.abspath(path), mimetype=mimetype, etag=etag, max_age=MAX_AGE)
+
+
+class S3Backend:
+    """
+    Класс-хранилище файлов в S3-совместимом хранилище (AWS S3, MinIO и т.д.).
+    Для проверки без облака можно указать endpoint_url локального сервера (MinIO, moto_server)
+    """
+
+    def __init__(self, bucket: str, prefix='', client=None, **client_options):
+        """
+        :param bucket: Название бакета
+        :param prefix: Префикс ключей объектов в бакете
+        :param client: Клиент S3 (по умолчанию создается boto3.client('s3', **client_options))
+        :param client_options: Параметры клиента boto3 (endpoint_url, region_name и т.д.)
+        """
+
+        if client is None:
+            import boto3  # Необязательная зависимость, нужна только для этого хранилища
+            client = boto3.client('s3', **client_options)
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = client
+
+    def object_key(self, key: str, name: str) -> str:
+        """ Метод возвращает ключ объекта в бакете """
+        return f'{self.prefix}{shard(key)}/{name}'
+
+    def write(self, key: str, name: str, data: bytes, content_type=None):
+        """ Метод сохраняет файл в бакет """
+        self.client.put_object(Bucket=self.bucket, Key=self.object_key(key, name), Body=data,
+                               ContentType=content_type or 'application/octet-stream',
+                               CacheControl=f'public, max-age={MAX_AGE}, immutable')
+
+    def exists(self, key: str, name: str) -> bool:
+        """ Метод проверяет, что файл существует """
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.object_key(key, name))
+        except self.client.exceptions.ClientError:
+            return False
+        return True
+
+    def delete(self, key: str):
+        """ Метод удаляет все файлы ключа """
+
+        prefix = f'{self.prefix}{shard(key)}/'
+        objects = self.client.list_objects_v2(Bucket=self.bucket, Prefix=prefix).get('Contents', [])
+        if objects:
+            self.client.delete_objects(Bucket=self.bucket, Delete={
+                'Objects': [{'Key': item['Key']} for item in objects]})
+
+    def response(self, key: str, name: str, mimetype: str, etag: str) -> Response:
+        """ Метод возвращает ответ с содержимым файла (потоком из бакета) """
+
+        try:
+            item = self.client.get_object(Bucket=self.bucket, Key=self.object_key(key, name))
+        except self.client.exceptions.NoSuchKey:
+            raise FileNotFoundError(f'{key}/{name}')
+
+        response = Response(item['Body'].iter_chunks(), mimetype=mimetype,
+                            headers={'Content-Length': str(item['ContentLength'])})
+        response.set_etag(etag)
+        return response
+
+
+class MediaStore:
+    """
+    Класс хранилища медиафайлов с адресацией по содержимому. Ключ - SHA-256 загруженного файла,
+    под ключом хранятся производные файлы (например, размеры изображения). Количество ссылок
+    на ключ хранится в таблице media: повторная загрузка того же файла только увеличивает счетчик,
+    а файлы удаляются после освобождения последней ссылки
+    """
+
+    def __init__(self, backend):
+        """ :param backend: Хранилище файлов (LocalBackend, S3Backend) """
+
+        self.backend = backend
+
+        # Файлы удаляются после сохранения транзакции, в которой удалена запись ключа, и после
+        # отката (или закрытия сессии без сохранения) транзакции, в которой они были записаны
+        event.listen(Session, 'after_commit', self.delete_released)
+        event.listen(Session, 'after_transaction_end', self.delete_written)
+
+    def put(self, session, data: bytes, build) -> str:
+        """
+        Метод сохраняет файл (или добавляет ссылку на уже сохраненный) и возвращает его ключ.
+        Файлы создаются до изменения таблицы media, чтобы во время их создания база данных
+        не была заблокирована на запись
+        :param session: Сессия общения с базой данных (изменения сохраняет вызывающий код)
+        :param data: Содержимое загруженного файла
+        :param build: Функция, возвращающая словарь {имя файла: содержимое} для сохранения под
+                      ключом. Вызывается только если такого содержимого еще нет в хранилище
+        :return: Ключ
+        """
+
+        key = media_key(data)
+        with session.no_autoflush:  # Только чтение: изменения сессии не записываются раньше времени
+            exists = session.query(Media.key).filter(Media.key == key).first() is not None
+        if exists and self.acquire(session, key):  # Такой файл уже загружался
+            return key
+
+        files = build(data)
+        for name, content in files.items():
+            self.backend.write(key, name, content, mimetypes.guess_type(name)[0])
+        session.info.setdefault(WRITTEN_KEYS, set()).add(key)  # Удаляются при откате транзакции
+        session.info.get(DELETED_KEYS, set()).discard(key)  # Ключ снова используется
+
+        values = {'key': key, 'size': sum(map(len, files.values())), 'refcount': 1}
+        upsert = upsert_functions.get(session.get_bind().dialect.name)
+        if upsert:  # Одновременная загрузка того же файла - ссылка добавляется к его записи
+            statement = upsert(Media).values(**values).on_conflict_do_nothing(
+                index_elements=['key'])
+            if session.execute(statement).rowcount == 0:
+                self.acquire(session, key)
+        else:
+            try:
+                with session.begin_nested():
+                    session.add(Media(**values))
+            except IntegrityError:
+                self.acquire(session, key)
+
+        return key
+
+    @staticmethod
+    def acquire(session, key: str) -> bool:
+        """ Метод добавляет ссылку на ключ. Возвращает False, если ключа нет в хранилище """
+        return session.query(Media).filter(Media.key == key).update(
+            {Media.refcount: Media.refcount + 1}, synchronize_session=False) == 1
+
+    @staticmethod
+    def release(session, key: str):
+        """
+        Метод удаляет ссылку на ключ. Файлы удаляются вместе с последней ссылкой, но только
+        после сохранения изменений сессии (при откате транзакции файлы остаются)
+        """
+
+        session.query(Media).filter(Media.key == key, Media.refcount > 0).update(
+            {Media.refcount: Media.refcount - 1}, synchronize_session=False)
+
+        if session.query(Media).filter(Media.key == key, Media.refcount <= 0).delete(
+                synchronize_session=False):
+            session.info.setdefault(DELETED_KEYS, set()).add(key)
+
+    def delete_released(self, session):
+        """ Метод удаляет файлы ключей, записи которых удалены (обработчик события after_commit) """
+
+        if session.in_nested_transaction():  # Сохранена только точка сохранения (savepoint)
+            return
+        session.info.pop(WRITTEN_KEYS, None)  # Записи ключей сохранены вместе с транзакцией
+        self.delete_unused(session, session.info.pop(DELETED_KEYS, ()))
+
+    def delete_written(self, session, transaction):
+        """
+        Метод удаляет файлы, записанные в несохраненной транзакции, и отменяет удаление файлов
+        освобожденных в ней ключей (обработчик события after_transaction_end). После сохранения
+        транзакции ключи уже убраны из сессии обработчиком delete_released
+        """
+
+        if transaction.parent is not None:  # Завершена вложенная транзакция
+            return
+        session.info.pop(DELETED_KEYS, None)
+        self.delete_unused(session, session.info.pop(WRITTEN_KEYS, ()))
+
+    def delete_unused(self, session, keys):
+        """
+        Метод удаляет файлы ключей, у которых нет записи в таблице media. Другой запрос мог
+        загрузить тот же файл заново, пока транзакция сессии сохранялась, поэтому наличие
+        записи проверяется отдельным соединением (сессия в этот момент вне транзакции)
+        """
+
+        if not keys:
+            return
+        with session.get_bind().connect() as connection:
+            used = set(connection.execute(select(Media.key).where(Media.key.in_(keys))).scalars())
+        for key in set(keys) - used:
+            self.backend.delete(key)
+
+    def response(self, key: str, name: str) -> Response:
+        """
+        Метод возвращает ответ с файлом ключа. Содержимое по адресу никогда не меняется, поэтому
+        файл кэшируется навсегда (immutable), а ETag строится из ключа без чтения файла
+        """
+
+        if not is_media_key(key) or not name or name != os.path.basename(name):
+            raise FileNotFoundError(f'{key}/{name}')
+
+        etag = f'{key[:16]}-{name}'
+        if request.if_none_match.contains(etag):  # Файл уже есть у браузера
+            response = Response(status=304)
+            response.set_etag(etag)
+        else:
+            mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            response = self.backend.response(key, name, mimetype, etag)
+
+        response.cache_control.public = True
+        response.cache_control.max_age = MAX_AGE
+        response.cache_control.immutable = True
+        return response
+
+
+def create_backend(config: dict, send=send_file):
+    """
+    Функция создает хранилище файлов по настройкам приложения (MEDIA_*)
+    :param config: Настройки приложения
+    :param send: Функция отдачи файлов локального хранилища
+    :return: Объект LocalBackend или S3Backend
+    """
+
+    if config.get('MEDIA_BACKEND', 'local') == 's3':
+        options = {'endpoint_url': config.get('MEDIA_S3_ENDPOINT_URL'),
+                   'region_name': config.get('MEDIA_S3_REGION')}
+        return S3Backend(config['MEDIA_S3_BUCKET'], config.get('MEDIA_S3_PREFIX', ''),
+                         **{name: value for name, value in options.items() if value})
+    return LocalBackend(config.get('MEDIA_ROOT', 'media'), send)
@@ -0,0 +1,135 @@
+import json
+import time
+import logging
+
+from flask import Flask, g, has_request_context
+from flask_socketio import SocketIO
+
+from data import db_session
+from data.models.user import Notification
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationCenter:
+    """
+    Класс доставки уведомлений пользователям. Уведомление отправляется через WebSocket,
+    а в базе данных сохраняется только если пользователь не в сети (ограниченная очередь с TTL).
+    Уведомления, созданные во время обработки запроса, доставляются одной пачкой после него
+    """
+
+    def __init__(self, socket: SocketIO, backlog_size=100, backlog_ttl=600, clustered=False):
+        """
+        :param socket: WebSocket сервер
+        :param backlog_size: Максимальное количество уведомлений, доставляемых пользователю при
+                             подключении (более старые отбрасываются)
+        :param backlog_ttl: Время хранения недоставленного уведомления в секундах
+        :param clustered: Работает ли сервер в нескольких процессах (через очередь сообщений).
+                          В этом случае пользователь может быть подключен к другому процессу,
+                          поэтому уведомление сохраняется, только если его доставку не
+                          подтвердил ни один процесс (DeliveryMixin)
+        """
+
+        self.socket = socket
+        self.backlog_size = backlog_size
+        self.backlog_ttl = backlog_ttl
+        self.clustered = clustered
+
+    def init_app(self, app: Flask):
+        """ Метод подключает отправку накопленных за запрос уведомлений к приложению """
+        app.teardown_request(self.deliver_request_notifications)
+
+    def push(self, user_id: int, room, name: str, data, online: bool):
+        """
+        Метод отправляет уведомление пользователю (в конце запроса, если он обрабатывается)
+        :param user_id: id пользователя
+        :param room: Комната WebSocket пользователя
+        :param name: Название уведомления
+        :param data: Данные уведомления (должны сериализоваться в json)
+        :param online: Подключен ли пользователь к WebSocket серверу
+        """
+
+        item = (user_id, room, {'name': name, 'data': data, 'timestamp': time.time()}, online)
+
+        if has_request_context():  # Уведомление отправится после завершения запроса
+            g.setdefault('notifications', []).append(item)
+        else:
+            self.deliver([item])
+
+    def deliver(self, items: list):
+        """ Метод доставляет уведомления (список кортежей (user_id, room, payload, online)) """
+
+        offline, remote = [], []
+        for user_id, room, payload, online in items:
+            if online:  # Доставка напрямую в комнату пользователя
+                self.socket.emit('notification', payload, room=room)
+            elif self.clustered:  # Пользователь может быть подключен к другому процессу
+                remote.append((user_id, room, payload))
+            else:  # Сохранение в базе данных до подключения пользователя
+                offline.append((user_id, payload))
+
+        if remote:  # Сохраняются только уведомления, которые не доставил ни один процесс
+            self.socket.server.manager.deliver(
+                [(room, 'notification', payload) for user_id, room, payload in remote],
+                lambda missed: self.store_missed([remote[i] for i in missed]))
+        if offline:  # Все недоставленные уведомления сохраняются одним INSERT и одним коммитом
+            self.store(offline)
+
+    def store_missed(self, items: list):
+        """ Метод сохраняет уведомления, доставку которых не подтвердил ни один процесс """
+
+        try:
+            self.store([(user_id, payload) for user_id, room, payload in items])
+        except Exception:  # Вызывается в фоновой задаче менеджера очереди
+            logger.exception('Notification store error')
+
+    def deliver_request_notifications(self, exception=None):
+        """ Обработчик завершения запроса. Доставляет накопленные за запрос уведомления """
+
+        items = g.pop('notifications', [])
+        if items and exception is None:  # При ошибке в запросе уведомления не отправляются
+            try:
+                self.deliver(items)
+            except Exception:  # Ответ уже сформирован, ошибка доставки его не меняет
+                logger.exception('Notification delivery error')
+
+    def store(self, items: list):
+        """
+        Метод сохраняет недоставленные уведомления (список пар (user_id, payload)). Используется
+        отдельная сессия: сессия запроса может содержать несохраненные изменения, а метод
+        вызывается уже после обработки запроса
+        """
+
+        with db_session.new_session() as session, session.begin():
+            session.bulk_insert_mappings(Notification, [
+                {'user_id': user_id, 'name': payload['name'], 'data': json.dumps(payload['data']),
+                 'timestamp': payload['timestamp']} for user_id, payload in items
+            ])
+
+            # Удаление устаревших уведомлений (чтобы очередь не росла бесконечно)
+            session.query(Notification).filter(
+                Notification.timestamp < time.time() - self.backlog_ttl).delete(
+                synchronize_session=False)
+
+    def flush(self, user_id: int, room):
+        """ Метод отправляет пользователю все накопленные уведомления одним сообщением """
+
+        with db_session.new_session() as session, session.begin():
+            rows = session.query(Notification.id, Notification.name, Notification.data,
+                                 Notification.timestamp).filter(
+                Notification.user_id == user_id,
+                Notification.timestamp > time.time() - self.backlog_ttl
+            ).order_by(Notification.id.desc()).limit(self.backlog_size).all()
+
+            if not rows:
+                return
+
+            # Удаление доставленных, а также устаревших и не поместившихся в очередь уведомлений
+            session.query(Notification).filter(Notification.user_id == user_id,
+                                               Notification.id <= rows[0].id).delete(
+                synchronize_session=False)
+            #
+
+        payloads = [{'name': row.name, 'data': json.loads(row.data), 'timestamp': row.timestamp}
+                    for row in reversed(rows)]
+        self.socket.emit('notifications', payloads, room=room)
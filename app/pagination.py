@@ -0,0 +1,98 @@
+import json
+import math
+import base64
+import datetime as dt
+
+from sqlalchemy import asc, desc, and_, or_, tuple_
+from sqlalchemy.orm import Query
+
+sort_functions = {'asc': asc, 'desc': desc}
+
+
+def encode_cursor(values) -> str:
+    """ Функция кодирует значения полей сортировки последнего объекта страницы в непрозрачный курсор """
+
+    def default(value):
+        """ Внутренняя функция сериализации дат """
+        if isinstance(value, dt.datetime):
+            return {'dt': value.isoformat()}
+        raise TypeError(f'Unsupported cursor value type: {type(value)}')
+
+    data = json.dumps(list(values), default=default, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, length: int) -> list:
+    """ Функция декодирует курсор в список значений. Порождает ValueError в случае ошибки """
+
+    def object_hook(obj):
+        """ Внутренняя функция десериализации дат """
+        return dt.datetime.fromisoformat(obj['dt']) if 'dt' in obj else obj
+
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(data.decode('utf-8'), object_hook=object_hook)
+    except (ValueError, TypeError, UnicodeDecodeError) as e:
+        raise ValueError(f'Incorrect cursor: "{cursor}"') from e
+
+    if not isinstance(values, list) or len(values) != length:
+        raise ValueError(f'Incorrect cursor: "{cursor}". Expected {length} values, got {values}')
+    return values
+
+
+def order_clauses(order: list) -> list:
+    """ Функция преобразует список пар (колонка, направление сортировки) в выражения ORDER BY """
+    return [sort_functions[direction](column) for column, direction in order]
+
+
+def keyset_condition(order: list, values: list):
+    """
+    Функция строит условие "объект находится после курсора" для keyset-пагинации
+    :param order: Список пар (колонка, направление сортировки)
+    :param values: Значения колонок у последнего объекта предыдущей страницы
+    :return: SQL-выражение для фильтрации
+    """
+
+    directions = {direction for _, direction in order}
+    if len(directions) == 1:  # Одинаковое направление - сравнение кортежей (использует индекс)
+        columns, value = tuple_(*[column for column, _ in order]), tuple_(*values)
+        return columns > value if directions == {'asc'} else columns < value
+
+    conditions = []  # Разные направления - (a > x) OR (a = x AND b < y) OR ...
+    for i, (column, direction) in enumerate(order):
+        equal = [c == v for (c, _), v in zip(order[:i], values[:i])]
+        after = column > values[i] if direction == 'asc' else column < values[i]
+        conditions.append(and_(*equal, after))
+    return or_(*conditions)
+
+
+def paginate(query: Query, order: list, page: int, per_page: int, cursor=None,
+             count=True) -> dict:
+    """
+    Функция возвращает страницу объектов запроса. Если указан курсор, то страница выбирается
+    keyset-методом (WHERE по полям сортировки вместо OFFSET), иначе по номеру страницы
+    :param query: Запрос без сортировки
+    :param order: Список пар (колонка, направление сортировки). Последней должна идти
+                  уникальная колонка (обычно id), чтобы порядок был однозначным
+    :param page: Номер страницы (начиная с 0)
+    :param per_page: Количество объектов на странице
+    :param cursor: Курсор, полученный с предыдущей страницы
+    :param count: Необходимость посчитать количество страниц (отдельным COUNT запросом)
+    :return: Словарь с объектами страницы, количеством страниц и курсором следующей страницы
+    """
+
+    columns = [column for column, _ in order]
+    pages_amount = math.ceil(query.order_by(None).count() / per_page) if count else None
+
+    query = query.order_by(None).order_by(*order_clauses(order))
+    if cursor:
+        query = query.filter(keyset_condition(order, decode_cursor(cursor, len(order))))
+    else:
+        query = query.offset(max(page, 0) * per_page)
+
+    # Берется на один объект больше, чтобы узнать, есть ли следующая страница
+    rows = query.add_columns(*columns).limit(per_page + 1).all()
+    next_cursor = encode_cursor(rows[per_page - 1][1:]) if len(rows) > per_page else None
+
+    return {'objects': [row[0] for row in rows[:per_page]], 'pages_amount': pages_amount,
+            'next_cursor': next_cursor}
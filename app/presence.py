@@ -0,0 +1,104 @@
+import time
+import atexit
+import logging
+import threading
+import datetime as dt
+
+from data import db_session
+from data.models.user import User
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceTracker:
+    """
+    Класс учета активности пользователей. Время последней активности хранится в памяти и
+    записывается в базу данных (users.last_seen) одним пакетным UPDATE раз в flush_interval секунд
+    """
+
+    def __init__(self, flush_interval=30, online_timeout=300):
+        """
+        :param flush_interval: Интервал записи накопленных изменений в базу данных в секундах
+        :param online_timeout: Время после последней активности, в течении которого
+                               пользователь считается находящимся в сети, в секундах
+        """
+
+        self.flush_interval = flush_interval
+        self.online_timeout = dt.timedelta(seconds=online_timeout)
+
+        self.last_seen = {}  # user_id: время последней активности
+        self.pending = {}  # Изменения, еще не записанные в базу данных
+        self.lock = threading.Lock()
+        self.thread = None
+
+        atexit.register(self.flush)  # Запись оставшихся изменений при остановке сервера
+
+    def touch(self, user_id: int):
+        """ Метод отмечает активность пользователя (без обращения к базе данных) """
+
+        now = dt.datetime.utcnow()
+        with self.lock:
+            self.last_seen[user_id] = now
+            self.pending[user_id] = now
+
+            if self.thread is None:  # Фоновая запись запускается при первой активности
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def run(self):
+        """ Метод фоновой задачи. Периодически записывает изменения в базу данных """
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:  # Ошибка базы данных не должна останавливать фоновую запись
+                logger.exception('Presence flush error')
+            finally:
+                db_session.remove_session()
+            self.evict()
+
+    def flush(self):
+        """
+        Метод записывает накопленные изменения в базу данных одним пакетным UPDATE.
+        При ошибке изменения возвращаются в очередь и записываются при следующем вызове
+        """
+
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+
+        session = db_session.create_session()
+        try:
+            session.bulk_update_mappings(User, [{'id': user_id, 'last_seen': last_seen}
+                                                for user_id, last_seen in pending.items()])
+            session.commit()
+        except Exception:
+            session.rollback()
+            with self.lock:  # Более новое время активности из очереди не перезаписывается
+                for user_id, last_seen in pending.items():
+                    self.pending[user_id] = max(last_seen, self.pending.get(user_id, last_seen))
+            raise
+
+    def evict(self):
+        """ Метод удаляет из памяти давно неактивных пользователей, время которых уже записано """
+
+        expired = dt.datetime.utcnow() - self.online_timeout
+        with self.lock:
+            for user_id in [user_id for user_id, last_seen in self.last_seen.items()
+                            if last_seen < expired and user_id not in self.pending]:
+                del self.last_seen[user_id]
+
+    def get_last_seen(self, user: User) -> dt.datetime:
+        """ Метод возвращает время последней активности пользователя """
+        return self.last_seen.get(user.id, user.last_seen)
+
+    def is_online(self, user_id: int) -> bool:
+        """ Метод проверяет, находится ли пользователь в сети """
+
+        last_seen = self.last_seen.get(user_id)
+        return last_seen is not None and dt.datetime.utcnow() - last_seen < self.online_timeout
+
+    def online_users(self) -> list:
+        """ Метод возвращает список id пользователей, находящихся в сети """
+        return [user_id for user_id in list(self.last_seen) if self.is_online(user_id)]
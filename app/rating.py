@@ -0,0 +1,208 @@
+import time
+import atexit
+import logging
+import threading
+
+from sqlalchemy import and_, bindparam, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from data import db_session
+from data.models.post import Post, PostRate
+
+# Диалекты, поддерживающие INSERT ... ON CONFLICT DO NOTHING
+upsert_functions = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+logger = logging.getLogger(__name__)
+
+
+class RatingEngine:
+    """
+    Класс изменения оценок постов. Счетчики лайков и дизлайков меняются атомарными UPDATE
+    (likes = likes + delta) без чтения и записи значений в Python. Если задан buffer_interval,
+    изменения счетчиков накапливаются в памяти и записываются одним пакетом раз в buffer_interval
+    секунд (для очень популярных постов)
+    """
+
+    def __init__(self, buffer_interval=0, retries=5, on_flush=None):
+        """
+        :param buffer_interval: Интервал записи накопленных изменений счетчиков в секундах
+                                (0 - изменения записываются сразу, в транзакции оценки)
+        :param retries: Количество попыток изменить оценку при одновременных изменениях
+        :param on_flush: Функция (session, post_ids), вызываемая после записи накопленных
+                         изменений счетчиков постов (например, для сброса кэша)
+        """
+
+        self.buffer_interval = buffer_interval
+        self.retries = retries
+        self.on_flush = on_flush
+
+        self.pending = {}  # post_id: [изменение лайков, изменение дизлайков]
+        self.lock = threading.Lock()
+        self.thread = None
+
+        if buffer_interval:
+            atexit.register(self.flush)  # Запись оставшихся изменений при остановке сервера
+
+    def rate(self, session, post_id: int, user_id: int, value: int) -> dict:
+        """
+        Метод ставит (или снимает, если она уже стоит) оценку пользователя посту
+        :param session: Сессия общения с базой данных
+        :param post_id: id поста
+        :param user_id: id пользователя
+        :param value: Оценка (1 - лайк, -1 - дизлайк)
+        :return: Словарь с новым состоянием оценки и счетчиками поста
+        """
+
+        if value not in (-1, 1):
+            raise ValueError(f"Incorrect value. Expected -1 or 1, got {value}")
+        if not session.query(Post.id).filter(Post.id == post_id).first():
+            raise ValueError(f'There are no posts with id : {post_id}')
+
+        # Изменение оценки по принципу compare-and-swap: UPDATE проходит, только если оценка
+        # не изменилась с момента чтения (иначе попытка повторяется)
+        for _ in range(self.retries):
+            old = session.query(PostRate.value).filter(PostRate.post_id == post_id,
+                                                       PostRate.user_id == user_id).scalar()
+            if old is None:  # Пользователь еще не оценивал пост
+                old, new = 0, value
+                if self.create_rate(session, post_id, user_id, value):
+                    break
+            else:
+                new = 0 if old == value else value
+                if session.query(PostRate).filter(
+                        PostRate.post_id == post_id, PostRate.user_id == user_id,
+                        PostRate.value == old).update({PostRate.value: new},
+                                                      synchronize_session=False):
+                    break
+        else:
+            raise RuntimeError(f'Could not change rate of post {post_id} by user {user_id}')
+        #
+
+        likes, dislikes = int(new == 1) - int(old == 1), int(new == -1) - int(old == -1)
+        if self.buffer_interval:
+            self.buffer(post_id, likes, dislikes)
+        else:
+            self.apply(session, [{'post_id': post_id, 'likes_delta': likes,
+                                  'dislikes_delta': dislikes}])
+
+        counters = self.counters(session, post_id)
+        session.commit()
+
+        return {'is_like': new == 1, 'is_dislike': new == -1, **counters}
+
+    def states(self, session, post_ids: list, user_id: int) -> dict:
+        """
+        Метод возвращает состояние оценок пользователя и счетчики сразу для нескольких постов
+        :param session: Сессия общения с базой данных
+        :param post_ids: Список id постов
+        :param user_id: id пользователя, оценки которого нужны
+        :return: Словарь {id поста: {'is_like', 'is_dislike', 'likes', 'dislikes'}}
+        """
+
+        if not post_ids:
+            return {}
+
+        # Счетчики постов и оценки пользователя загружаются одним запросом
+        rows = session.query(Post.id, Post.likes, Post.dislikes, PostRate.value).outerjoin(
+            PostRate, and_(PostRate.post_id == Post.id, PostRate.user_id == user_id)
+        ).filter(Post.id.in_(post_ids))
+        #
+
+        states = {}
+        for post_id, likes, dislikes, value in rows:
+            pending = self.pending.get(post_id, (0, 0))
+            states[post_id] = {'is_like': value == 1, 'is_dislike': value == -1,
+                               'likes': likes + pending[0], 'dislikes': dislikes + pending[1]}
+        return states
+
+    def counters(self, session, post_id: int) -> dict:
+        """ Метод возвращает счетчики лайков и дизлайков поста с учетом незаписанных изменений """
+
+        likes, dislikes = session.query(Post.likes, Post.dislikes).filter(Post.id == post_id).one()
+        pending = self.pending.get(post_id, (0, 0))
+        return {'likes': likes + pending[0], 'dislikes': dislikes + pending[1]}
+
+    @staticmethod
+    def create_rate(session, post_id: int, user_id: int, value: int) -> bool:
+        """ Метод создает оценку поста. Возвращает False, если оценка уже существует """
+
+        values = {'post_id': post_id, 'user_id': user_id, 'value': value}
+        upsert = upsert_functions.get(session.get_bind().dialect.name)
+
+        if upsert:
+            statement = upsert(PostRate).values(**values).on_conflict_do_nothing(
+                index_elements=['post_id', 'user_id'])
+            return session.execute(statement).rowcount == 1
+
+        try:  # Создание оценки - первая запись в транзакции, поэтому ее можно откатить целиком
+            session.execute(insert(PostRate).values(**values))
+        except IntegrityError:
+            session.rollback()
+            return False
+        return True
+
+    @staticmethod
+    def apply(session, deltas: list):
+        """
+        Метод атомарно изменяет счетчики постов
+        :param session: Сессия общения с базой данных
+        :param deltas: Список словарей с ключами post_id, likes_delta, dislikes_delta
+        """
+
+        statement = update(Post).where(Post.id == bindparam('post_id')).values(
+            likes=Post.likes + bindparam('likes_delta'),
+            dislikes=Post.dislikes + bindparam('dislikes_delta'))
+        session.execute(statement.execution_options(synchronize_session=False), deltas)
+
+    def buffer(self, post_id: int, likes: int, dislikes: int):
+        """ Метод накапливает изменение счетчиков поста в памяти """
+
+        with self.lock:
+            pending = self.pending.setdefault(post_id, [0, 0])
+            pending[0] += likes
+            pending[1] += dislikes
+
+            if self.thread is None:  # Фоновая запись запускается при первом изменении
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def run(self):
+        """ Метод фоновой задачи. Периодически записывает накопленные изменения счетчиков """
+        while True:
+            time.sleep(self.buffer_interval)
+            try:
+                self.flush()
+            except Exception:  # Ошибка базы данных не должна останавливать фоновую запись
+                logger.exception('Rating flush error')
+            finally:
+                db_session.remove_session()
+
+    def flush(self):
+        """
+        Метод записывает накопленные изменения счетчиков одним пакетным UPDATE.
+        При ошибке изменения возвращаются в очередь и записываются при следующем вызове
+        """
+
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        deltas = [{'post_id': post_id, 'likes_delta': likes, 'dislikes_delta': dislikes}
+                  for post_id, (likes, dislikes) in pending.items() if likes or dislikes]
+        if not deltas:
+            return
+
+        session = db_session.create_session()
+        try:
+            self.apply(session, deltas)
+            session.commit()
+        except Exception:
+            session.rollback()
+            with self.lock:  # Изменения складываются с накопленными за время записи
+                for delta in deltas:
+                    pending = self.pending.setdefault(delta['post_id'], [0, 0])
+                    pending[0] += delta['likes_delta']
+                    pending[1] += delta['dislikes_delta']
+            raise
+
+        if self.on_flush is not None:  # Изменения уже записаны (ошибка не вернет их в очередь)
+            self.on_flush(session, [delta['post_id'] for delta in deltas])
@@ -0,0 +1,67 @@
+import sqlalchemy
+
+from flask import g
+from sqlalchemy import literal, select, union_all
+
+from data import db_session
+from data.models.friendship import Friend, FriendshipOffer
+
+
+class RelationMap:
+    """ Класс-карта отношений пользователя с остальными пользователями (друзья, подписчики, заявки) """
+
+    def __init__(self, session, user_id: int):
+        self.user_id = user_id
+
+        # Множества id пользователей для каждого типа отношений
+        self.friends = set()
+        self.subscribers = set()
+        self.offers = set()
+        self.unanswered = set()  # Подписчики, ожидающие ответа на запрос дружбы
+        #
+
+        # Все отношения пользователя загружаются одним запросом
+        query = union_all(
+            select(literal('friend'), Friend.id2, sqlalchemy.false()).where(Friend.id1 == user_id),
+            select(literal('friend'), Friend.id1, sqlalchemy.false()).where(Friend.id2 == user_id),
+            select(literal('subscriber'), FriendshipOffer.id_from,
+                   FriendshipOffer.is_answered).where(FriendshipOffer.id_to == user_id),
+            select(literal('offer'), FriendshipOffer.id_to,
+                   FriendshipOffer.is_answered).where(FriendshipOffer.id_from == user_id)
+        )
+        for relation, other_id, is_answered in session.execute(query):
+            getattr(self, relation + 's').add(other_id)
+            if relation == 'subscriber' and not is_answered:
+                self.unanswered.add(other_id)
+        #
+
+    def relation(self, user_id: int) -> str:
+        """ Метод возвращает тип отношения с пользователем: friend, subscriber, offer или usual """
+
+        if user_id in self.friends:
+            return 'friend'
+        if user_id in self.subscribers:
+            return 'subscriber'
+        if user_id in self.offers:
+            return 'offer'
+        return 'usual'
+
+    def need_answer(self, user_id: int) -> bool:
+        """ Метод проверяет нужно ли отвечать на запрос дружбы от пользователя с user_id """
+        return user_id in self.unanswered
+
+
+def get_relation_map(user_id: int) -> RelationMap:
+    """ Функция возвращает карту отношений пользователя. Карта строится один раз за запрос """
+
+    if 'relation_maps' not in g:
+        g.relation_maps = {}
+    if user_id not in g.relation_maps:
+        g.relation_maps[user_id] = RelationMap(db_session.create_session(), user_id)
+
+    return g.relation_maps[user_id]
+
+
+def reset_relation_maps():
+    """ Функция сбрасывает построенные карты отношений (после изменения дружбы в запросе) """
+    g.pop('relation_maps', None)
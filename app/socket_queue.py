@@ -0,0 +1,183 @@
+import json
+import uuid
+import queue
+import pickle
+import threading
+
+import socketio
+
+local_url = 'local://'  # Адрес очереди внутри процесса (LocalQueueManager)
+
+# Менеджеры внешних очередей по началу адреса (так же их выбирает Flask-SocketIO)
+queue_managers = [(('redis://', 'rediss://'), socketio.RedisManager),
+                  (('kafka://',), socketio.KafkaManager),
+                  (('zmq',), socketio.ZmqManager)]
+
+
+class DeliveryMixin:
+    """
+    Класс-примесь к менеджерам очереди сообщений (PubSubManager): доставка сообщений в комнаты
+    с подтверждением. Сообщения получают все процессы кластера; процесс, к которому подключен
+    участник комнаты, отправляет сообщение клиенту и подтверждает доставку через ту же очередь.
+    Сообщения без подтверждений за ack_timeout секунд передаются обработчику недоставленных
+    """
+
+    ack_timeout = 2  # Время ожидания подтверждений доставки в секундах
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.deliveries = {}  # id доставки: множество номеров доставленных сообщений
+        self.deliveries_lock = threading.Lock()
+
+    def deliver(self, messages: list, on_missed, namespace='/'):
+        """
+        Метод отправляет сообщения в комнаты тех процессов кластера, к которым они подключены
+        :param messages: Список кортежей (комната, событие, данные)
+        :param on_missed: Функция, которая вызывается со списком номеров сообщений, комнат
+                          которых нет ни в одном процессе (не вызывается, если доставлены все)
+        :param namespace: Пространство имен WebSocket
+        """
+
+        delivery_id = uuid.uuid4().hex
+        with self.deliveries_lock:
+            self.deliveries[delivery_id] = set()
+
+        self._publish({'method': 'deliver', 'id': delivery_id, 'host_id': self.host_id,
+                       'namespace': namespace, 'messages': [list(item) for item in messages]})
+        self.server.start_background_task(self._wait_acks, delivery_id, len(messages), on_missed)
+
+    def _wait_acks(self, delivery_id: str, count: int, on_missed):
+        """ Метод фоновой задачи. Ждет подтверждений и передает недоставленные сообщения """
+
+        self.server.sleep(self.ack_timeout)
+        with self.deliveries_lock:
+            delivered = self.deliveries.pop(delivery_id, set())
+
+        missed = [i for i in range(count) if i not in delivered]
+        if missed:
+            on_missed(missed)
+
+    def _listen(self):
+        """ Метод обрабатывает сообщения доставки, остальные передает менеджеру очереди """
+
+        for message in super()._listen():
+            data = decode_message(message)
+            method = data.get('method') if isinstance(data, dict) else None
+            if method == 'deliver':
+                self._handle_deliver(data)
+            elif method == 'deliver_ack':
+                self._handle_deliver_ack(data)
+            else:
+                yield message
+
+    def _handle_deliver(self, data: dict):
+        """ Метод отправляет сообщения в комнаты этого процесса и подтверждает их доставку """
+
+        namespace, delivered = data['namespace'], []
+        for i, (room, event, payload) in enumerate(data['messages']):
+            if namespace in self.rooms and next(self.get_participants(namespace, room), None):
+                socketio.BaseManager.emit(self, event, payload, namespace, room=room)
+                delivered.append(i)
+
+        if delivered:
+            self._publish({'method': 'deliver_ack', 'id': data['id'],
+                           'host_id': data['host_id'], 'delivered': delivered})
+
+    def _handle_deliver_ack(self, data: dict):
+        """ Метод отмечает сообщения, доставку которых подтвердил процесс кластера """
+
+        if data['host_id'] != self.host_id:  # Подтверждение доставки другого процесса
+            return
+        with self.deliveries_lock:
+            if data['id'] in self.deliveries:
+                self.deliveries[data['id']].update(data['delivered'])
+
+
+class LocalQueue(socketio.PubSubManager):
+    """
+    Класс-очередь сообщений WebSocket серверов внутри одного процесса. Заменяет Redis (или другую
+    очередь) при разработке и проверке работы нескольких серверов: все менеджеры процесса,
+    подписанные на один канал, получают сообщения друг друга так же, как через внешнюю очередь
+    """
+
+    name = 'local'
+
+    subscribers = {}  # канал: список очередей подписанных менеджеров
+    lock = threading.Lock()
+
+    def __init__(self, url=local_url, channel='socketio', write_only=False, logger=None):
+        """
+        :param url: Адрес очереди (не используется, оставлен для совместимости с другими очередями)
+        :param channel: Название канала (серверы одного кластера используют один канал)
+        :param write_only: Только отправлять сообщения (процесс без подключенных клиентов)
+        """
+
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.url = url
+
+        # Очередь подписывается сразу, чтобы не пропустить сообщения до запуска фоновой задачи
+        self.queue = queue.Queue()
+        if not write_only:
+            with self.lock:
+                self.subscribers.setdefault(channel, []).append(self.queue)
+
+    def _publish(self, data):
+        """ Метод отправляет сообщение всем менеджерам канала (включая текущий) """
+
+        message = pickle.dumps(data)
+        with self.lock:
+            queues = list(self.subscribers.get(self.channel, []))
+        for subscriber in queues:
+            subscriber.put(message)
+
+    def _listen(self):
+        """ Метод фоновой задачи. Возвращает сообщения канала по мере их поступления """
+        while True:
+            yield self.queue.get()
+
+
+class LocalQueueManager(DeliveryMixin, LocalQueue):
+    """ Класс-очередь сообщений внутри процесса с доставкой в комнаты с подтверждением """
+    pass
+
+
+def socket_options(url=None, channel='socketio') -> dict:
+    """
+    Функция возвращает параметры SocketIO для подключения к очереди сообщений, через которую
+    несколько процессов (и серверов) WebSocket доставляют сообщения клиентам друг друга
+    :param url: Адрес очереди (redis://..., amqp://..., local:// - очередь внутри процесса,
+                None - один процесс без очереди)
+    :param channel: Название канала очереди
+    :return: Словарь параметров для SocketIO
+    """
+
+    if not url:
+        return {}
+    if url.startswith(local_url):
+        return {'client_manager': LocalQueueManager(url, channel=channel)}
+
+    base = next((manager for prefixes, manager in queue_managers if url.startswith(prefixes)),
+                socketio.KombuManager)
+    manager = type(f'Delivery{base.__name__}', (DeliveryMixin, base), {})
+    return {'client_manager': manager(url, channel=channel)}
+
+
+def decode_message(message):
+    """ Функция декодирует сообщение очереди так же, как PubSubManager (dict, pickle или json) """
+
+    if isinstance(message, dict):
+        return message
+    if isinstance(message, bytes):
+        try:
+            return pickle.loads(message)
+        except Exception:
+            pass
+    try:
+        return json.loads(message)
+    except Exception:
+        return None
+
+
+def user_room(user_id: int) -> str:
+    """ Функция возвращает название комнаты WebSocket, в которую входят все сокеты пользователя """
+    return f'user:{user_id}'
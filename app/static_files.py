@@ -0,0 +1,168 @@
+import os
+import gzip
+import zlib
+import mimetypes
+
+from flask import Flask, Response, abort, current_app, request, send_file
+from werkzeug.security import safe_join
+
+try:  # Необязательная зависимость: без нее создаются и отдаются только .gz файлы
+    import brotli
+except ImportError:
+    brotli = None
+
+# Расширения файлов, для которых хранятся сжатые копии (.br, .gz)
+compressible = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map'}
+
+# Кодировки сжатых копий в порядке предпочтения: (Content-Encoding, расширение копии)
+encodings = [('br', '.br'), ('gzip', '.gz')]
+
+# Режимы передачи файла прокси-серверу: заголовок, по которому прокси сам отдает файл
+accel_headers = {'x-accel-redirect': 'X-Accel-Redirect',  # nginx
+                 'x-sendfile': 'X-Sendfile'}  # Apache (mod_xsendfile), lighttpd
+
+
+class StaticFiles:
+    """
+    Класс отдачи статических файлов и медиафайлов. Поддерживает условные запросы
+    (ETag, If-None-Match), запросы части файла (Range), заранее сжатые копии .br и .gz для
+    CSS и JS, а также передачу файла прокси-серверу (X-Accel-Redirect, X-Sendfile).
+    Без прокси файл передает сам сервер (через send_file и wsgi.file_wrapper сервера, если он
+    есть), и greenlet занят на все время передачи: чтобы освободить сервер от передачи больших
+    файлов, нужен accel='x-accel-redirect' (nginx) или 'x-sendfile'
+    """
+
+    def __init__(self, app=None, accel=None, accel_prefix='/protected/'):
+        """
+        :param app: Приложение Flask
+        :param accel: Передача файлов прокси (x-accel-redirect, x-sendfile, None - отдает сервер)
+        :param accel_prefix: Внутренний адрес nginx, соответствующий папке приложения
+                             (для X-Accel-Redirect)
+        """
+
+        if accel is not None and accel not in accel_headers:
+            raise ValueError(f'Unknown accel mode: {accel}. Expected one of {list(accel_headers)}')
+
+        self.accel = accel
+        self.accel_prefix = accel_prefix
+        self.root = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        """ Метод заменяет стандартный обработчик статических файлов приложения """
+
+        self.root = app.root_path
+        app.view_functions['static'] = self.static
+
+    def static(self, filename: str) -> Response:
+        """ Обработчик адресов /static/<filename> """
+
+        path = safe_join(current_app.static_folder, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        return self.send(path, max_age=current_app.get_send_file_max_age(filename))
+
+    def send(self, path: str, mimetype=None, etag=True, max_age=None) -> Response:
+        """
+        Метод возвращает ответ с файлом
+        :param path: Путь к файлу
+        :param mimetype: Тип содержимого (по умолчанию определяется по расширению)
+        :param etag: ETag ответа (True - вычисляется по времени изменения и размеру файла)
+        :param max_age: Время кэширования файла браузером в секундах
+        :return: Объект Response
+        """
+
+        mimetype = mimetype or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        is_compressible = os.path.splitext(path)[1] in compressible
+
+        encoding = None
+        if is_compressible:  # Выбор сжатой копии, которую принимает браузер
+            encoding, path = self.select_encoding(path)
+
+        if self.accel:
+            response = self.accel_response(path, mimetype, etag, max_age)
+        else:  # send_file использует wsgi.file_wrapper сервера (sendfile у gunicorn и др.)
+            response = send_file(path, mimetype=mimetype, etag=etag, max_age=max_age,
+                                 conditional=True)
+
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if is_compressible:
+            response.vary.add('Accept-Encoding')
+        return response
+
+    @staticmethod
+    def select_encoding(path: str) -> tuple:
+        """ Метод возвращает кодировку и путь актуальной сжатой копии файла (если она есть) """
+
+        mtime = os.path.getmtime(path)
+        for encoding, suffix in encodings:
+            if not request.accept_encodings.quality(encoding):
+                continue
+            try:
+                if os.path.getmtime(path + suffix) >= mtime:  # Копия не старее файла
+                    return encoding, path + suffix
+            except OSError:
+                continue
+        return None, path
+
+    def accel_response(self, path: str, mimetype: str, etag, max_age) -> Response:
+        """ Метод возвращает пустой ответ с заголовком, по которому файл отдаст прокси-сервер """
+
+        stat = os.stat(path)
+        response = Response(mimetype=mimetype)
+
+        if self.accel == 'x-sendfile':
+            response.headers[accel_headers[self.accel]] = os.path.abspath(path)
+        else:
+            relative_path = os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, '/')
+            response.headers[accel_headers[self.accel]] = self.accel_prefix + relative_path
+
+        if etag is True:  # ETag в том же формате, что и у send_file
+            etag = f'{stat.st_mtime}-{stat.st_size}-{zlib.adler32(path.encode()) & 0xffffffff}'
+        if etag:
+            response.set_etag(etag)
+        response.last_modified = int(stat.st_mtime)
+        if max_age is not None:
+            response.cache_control.public = True
+            response.cache_control.max_age = max_age
+
+        return response.make_conditional(request)  # 304, если файл уже есть у браузера
+
+
+def precompress(folder: str, min_size=1024) -> int:
+    """
+    Функция создает сжатые копии (.gz, и .br если установлен brotli) текстовых файлов папки.
+    Копии пересоздаются, только если файл изменился
+    :param folder: Папка со статическими файлами
+    :param min_size: Минимальный размер файла для сжатия в байтах
+    :return: Количество созданных копий
+    """
+
+    compressors = {'.gz': lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressors['.br'] = lambda data: brotli.compress(data, quality=11)
+
+    created = 0
+    for root, dirs, files in os.walk(folder):
+        for name in files:
+            path = os.path.join(root, name)
+            if os.path.splitext(name)[1] not in compressible or os.path.getsize(path) < min_size:
+                continue
+
+            mtime, data = os.path.getmtime(path), None
+            for suffix, compress in compressors.items():
+                target = path + suffix
+                if os.path.exists(target) and os.path.getmtime(target) >= mtime:
+                    continue
+
+                if data is None:
+                    with open(path, 'rb') as file:
+                        data = file.read()
+                with open(target, 'wb') as file:
+                    file.write(compress(data))
+                created += 1
+
+    return created
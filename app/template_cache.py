@@ -0,0 +1,89 @@
+import os
+import threading
+
+from flask import Flask, render_template
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup, escape
+
+
+def init_bytecode_cache(app: Flask):
+    """
+    Функция подключает к шаблонам приложения кэш байткода на диске: скомпилированные шаблоны
+    сохраняются в папку TEMPLATE_CACHE_DIR и используются следующими процессами без повторной
+    компиляции. Вызывается при запуске сервера (не при импорте приложения)
+    """
+
+    cache_dir = app.config.get('TEMPLATE_CACHE_DIR', 'cache/jinja')
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+
+def precompile(app: Flask) -> int:
+    """ Функция заранее загружает (и компилирует) все шаблоны приложения. Возвращает их количество """
+
+    names = app.jinja_env.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+class FragmentCache:
+    """
+    Класс-кэш шаблонов, в которых переменные только выводятся ({{ name }}, без условий и
+    фильтров), например шаблона письма. Шаблон рендерится один раз с метками вместо переменных,
+    а дальше результат собирается из готовых частей и экранированных значений. Если шаблон
+    зависит от значений переменных, он каждый раз рендерится обычным образом
+    """
+
+    def __init__(self):
+        self.fragments = {}  # (шаблон, переменные): список частей (None - шаблон не подходит)
+        self.lock = threading.Lock()
+
+    def render(self, template: str, **context) -> str:
+        """ Метод возвращает результат шаблона, как render_template(template, **context) """
+
+        key = template, tuple(sorted(context))
+        with self.lock:
+            if key not in self.fragments:
+                self.fragments[key] = self.split(template, key[1])
+            parts = self.fragments[key]
+
+        if parts is None:
+            return render_template(template, **context)
+        return ''.join(part if isinstance(part, str) else str(escape(context[part[0]]))
+                       for part in parts)
+
+    @staticmethod
+    def split(template: str, names: tuple):
+        """ Метод разбивает шаблон на неизменяемые части и места вывода переменных """
+
+        # Рендер с двумя разными наборами меток и с пустыми значениями: если результаты
+        # отличаются не только метками, шаблон зависит от значений переменных (условия,
+        # фильтры) и кэшировать его нельзя
+        first = {name: Markup(f'@@{i}a@@') for i, name in enumerate(names)}
+        second = {name: Markup(f'@@{i}b@@') for i, name in enumerate(names)}
+        result = render_template(template, **first)
+
+        expected, empty = result, result
+        for name in names:
+            expected = expected.replace(first[name], second[name])
+            empty = empty.replace(first[name], '')
+        if expected != render_template(template, **second) or \
+                empty != render_template(template, **{name: '' for name in names}):
+            return None
+
+        parts = [result]
+        for name in names:  # Разбиение текста по меткам каждой переменной
+            mark, new_parts = str(first[name]), []
+            for part in parts:
+                if not isinstance(part, str):
+                    new_parts.append(part)
+                    continue
+                pieces = part.split(mark)
+                for i, piece in enumerate(pieces):
+                    if i:
+                        new_parts.append((name,))
+                    new_parts.append(piece)
+            parts = new_parts
+
+        return [part for part in parts if part != '']
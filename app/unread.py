@@ -0,0 +1,33 @@
+import time
+
+from data.models.user import User
+
+
+class UnreadCounters:
+    """
+    Класс-кэш количества диалогов с непрочитанными сообщениями у пользователей.
+    Зеркало колонки users.unread_dialogs_amount в памяти процесса
+    """
+
+    def __init__(self, ttl=60):
+        """
+        :param ttl: Время жизни значения в секундах (счетчик могли изменить другие процессы)
+        """
+
+        self.ttl = ttl
+        self.values = {}  # user_id: (количество диалогов, время сохранения)
+
+    def get(self, user: User) -> int:
+        """ Метод возвращает количество диалогов с непрочитанными сообщениями у пользователя """
+
+        value, saved = self.values.get(user.id, (None, 0))
+        if value is None or time.time() - saved > self.ttl:
+            value = self.refresh(user)
+        return value
+
+    def refresh(self, user: User) -> int:
+        """ Метод обновляет значение в кэше из объекта пользователя (после коммита изменений) """
+
+        value = user.unread_dialogs_amount
+        self.values[user.id] = (value, time.time())
+        return value
@@ -2,3 +2,5 @@ from .models import user
 from .models import post
 from .models import friendship
 from .models import dialogs
+from .models import media
+from .models import mail
@@ -1,48 +1,199 @@
+import random
+
 import sqlalchemy as sa
 import sqlalchemy.orm as orm
 from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
 import sqlalchemy.ext.declarative as dec
 
+from app.config import Config
+
 
 SqlAlchemyBase = dec.declarative_base()  # Создаем объект базы данных
 
 __factory = None
+__read_factory = None
+
+engines = {'primary': None, 'replicas': []}  # Основной движок (запись) и движки реплик (чтение)
+
+# Настройки SQLite, выполняемые при открытии каждого соединения
+sqlite_pragmas = {
+    'journal_mode': getattr(Config, 'SQLITE_JOURNAL_MODE', 'WAL'),  # Чтение не ждет записи
+    'synchronous': getattr(Config, 'SQLITE_SYNCHRONOUS', 'NORMAL'),  # fsync только в checkpoint
+    'busy_timeout': getattr(Config, 'SQLITE_BUSY_TIMEOUT', 5000),  # Ожидание блокировки, мс
+    'mmap_size': getattr(Config, 'SQLITE_MMAP_SIZE', 256 * 1024 * 1024),  # Размер mmap, байт
+    'cache_size': getattr(Config, 'SQLITE_CACHE_SIZE', -64 * 1024),  # Кэш страниц (< 0 - КиБ)
+    'temp_store': getattr(Config, 'SQLITE_TEMP_STORE', 'MEMORY')
+}
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """ Функция настраивает новое соединение с SQLite (обработчик события connect) """
+
+    cursor = dbapi_connection.cursor()
+    for name, value in sqlite_pragmas.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+    cursor.close()
+
+
+def unicode_lower(value):
+    """ Функция приводит строку к нижнему регистру с учетом Unicode """
+    return value.lower() if isinstance(value, str) else value
+
+
+def set_sqlite_functions(dbapi_connection, connection_record) -> None:
+    """
+    Функция добавляет функции в SQLite нового соединения (обработчик события connect):
+    unicode_lower - lower для всех алфавитов (встроенная меняет регистр только латинских букв)
+    """
+    dbapi_connection.create_function('unicode_lower', 1, unicode_lower, deterministic=True)
+
+
+def create_engine(url: str, echo=False) -> sa.engine.Engine:
+    """
+    Функция создает движок базы данных с пулом соединений, настроенный под диалект базы данных
+    :param url: Адрес базы данных в формате SQLAlchemy (sqlite:///..., postgresql://...)
+    :param echo: Необходимость отображать запросы sqlalchemy
+    :return: Объект Engine
+    """
+
+    url = sa.engine.make_url(url)
+    print(f"Подключение к базе данных по адресу: {url!r}")
+
+    # Соединения переиспользуются разными потоками (greenlet-ами eventlet), поэтому нужен
+    # пул с ограниченным размером, а не пул на поток
+    options = {'echo': echo, 'poolclass': QueuePool,
+               'pool_size': getattr(Config, 'DB_POOL_SIZE', 10),
+               'max_overflow': getattr(Config, 'DB_MAX_OVERFLOW', 20),
+               'pool_timeout': getattr(Config, 'DB_POOL_TIMEOUT', 30)}
+
+    if url.get_backend_name() == 'sqlite':
+        url = url.update_query_dict({'check_same_thread': 'False'})
+    else:  # Сетевая база данных - проверка соединений, закрытых сервером
+        options['pool_pre_ping'] = True
+        options['pool_recycle'] = getattr(Config, 'DB_POOL_RECYCLE', 1800)
+
+    engine = sa.create_engine(url, **options)
+    if engine.dialect.name == 'sqlite':
+        sa.event.listen(engine, 'connect', set_sqlite_pragmas)
+        sa.event.listen(engine, 'connect', set_sqlite_functions)
+
+    return engine
+
+
+class RoutingSession(Session):
+    """
+    Класс-сессия, направляющая запросы на чтение в реплики, если сессия создана только для чтения
+    (create_read_session), а все изменения и остальные запросы - в основную базу данных.
+    Сессия запоминает, что через нее выполнялись изменения (info['has_writes'])
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        is_select = getattr(clause, 'is_select', False)
+        if self._flushing or (clause is not None and not is_select):
+            self.info['has_writes'] = True
+
+        replicas = engines['replicas']
+        if self.info.get('read_only') and not self.info.get('primary') and replicas and \
+                not self._flushing and is_select:
+            return random.choice(replicas)
+        return engines['primary']
 
 
 def global_init(db_file: str, echo=False) -> None:
     """
-    Функция инициализирует базу данных, выбирает движок, и создает метаданные таблиц
-    :param db_file: Путь к файлу базы данных
+    Функция инициализирует базу данных, выбирает движок, и создает метаданные таблиц.
+    Адрес базы данных берется из Config.DATABASE_URL (если он не указан - используется SQLite
+    файл db_file), адреса реплик для чтения - из Config.DATABASE_REPLICA_URLS
+    :param db_file: Путь к файлу базы данных SQLite
     :param echo: Необходимость отображать запросы sqlalchemy
     :return: None
     """
 
-    global __factory
+    global __factory, __read_factory
 
     if __factory:  # Проверка на созданную сессию
         return
 
-    if not db_file or not db_file.strip():
-        raise ValueError("Excepted path to db file, got nothing instead")
+    url = getattr(Config, 'DATABASE_URL', None)
+    if not url:
+        if not db_file or not db_file.strip():
+            raise ValueError("Excepted path to db file, got nothing instead")
+        url = f"sqlite:///{db_file.strip()}"
 
-    conn_str = f"sqlite:///{db_file.strip()}?check_same_thread=False"
-    print(f"Подключение к базе данных по адресу: {conn_str}")
+    engines['primary'] = create_engine(url, echo=echo)
+    engines['replicas'] = [create_engine(replica, echo=echo)
+                           for replica in getattr(Config, 'DATABASE_REPLICA_URLS', [])]
 
-    engine = sa.create_engine(conn_str, echo=echo)
-    __factory = orm.sessionmaker(bind=engine)
+    # Сессии привязаны к потоку (greenlet-у) и закрываются по окончании запроса (remove_session)
+    __factory = orm.scoped_session(orm.sessionmaker(class_=RoutingSession))
+    __read_factory = orm.scoped_session(orm.sessionmaker(class_=RoutingSession,
+                                                         info={'read_only': True}))
+    #
 
     from . import __all_models  # Загрузка всех моделей
+    from .user_search import init_search_index
 
-    SqlAlchemyBase.metadata.create_all(engine)
+    SqlAlchemyBase.metadata.create_all(engines['primary'])
+    init_search_index(engines['primary'])  # Поисковый индекс по никнеймам пользователей
 
 
 def create_session() -> Session:
     """
-    Функция создают сессию общения с базой данных
+    Функция возвращает сессию общения с базой данных. В пределах одного запроса (потока)
+    возвращается одна и та же сессия
     :return: Объект типа Session для общения с базой данных
     """
 
     global __factory
-    assert isinstance(__factory, orm.sessionmaker), f"Wrong type of __factory. Excepted " \
-                                                    f"orm.sessionmaker, got {type(__factory)}"
+    assert isinstance(__factory, orm.scoped_session), f"Wrong type of __factory. Excepted " \
+                                                      f"orm.scoped_session, got {type(__factory)}"
     return __factory()
+
+
+def create_read_session() -> Session:
+    """
+    Функция возвращает сессию для страниц, которые только читают данные (лента, профили, списки
+    пользователей). Запросы такой сессии выполняются на репликах (если они настроены),
+    поэтому данные могут немного отставать от основной базы данных
+    :return: Объект типа Session для общения с базой данных
+    """
+
+    global __read_factory
+    assert isinstance(__read_factory, orm.scoped_session), f"Wrong type of __read_factory. " \
+                                                           f"Excepted orm.scoped_session, got " \
+                                                           f"{type(__read_factory)}"
+    return __read_factory()
+
+
+def new_session() -> Session:
+    """
+    Функция возвращает отдельную сессию, не связанную с сессией текущего запроса (для работы
+    вне запроса или после него). Сессию закрывает вызывающий код (with new_session() as ...)
+    :return: Объект типа Session для общения с базой данных
+    """
+
+    global __factory
+    assert isinstance(__factory, orm.scoped_session), f"Wrong type of __factory. Excepted " \
+                                                      f"orm.scoped_session, got {type(__factory)}"
+    return __factory.session_factory()
+
+
+def use_primary() -> None:
+    """
+    Функция направляет запросы сессии для чтения текущего запроса в основную базу данных.
+    Используется сразу после изменений пользователя, пока реплики могут их еще не получить
+    """
+    create_read_session().info['primary'] = True
+
+
+def has_writes() -> bool:
+    """ Функция проверяет, выполнялись ли в текущем запросе изменения базы данных """
+    return bool(__factory and __factory.registry.has() and __factory().info.get('has_writes'))
+
+
+def remove_session(exception=None) -> None:
+    """ Функция закрывает сессии текущего запроса и возвращает соединения в пул """
+    for factory in (__factory, __read_factory):
+        if factory:
+            factory.remove()
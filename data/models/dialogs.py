@@ -1,38 +1,116 @@
 import sqlalchemy
 import datetime as dt
 
-from sqlalchemy import orm
+from sqlalchemy import orm, case
+from .user import User
 from ..db_session import SqlAlchemyBase
 from sqlalchemy_serializer import SerializerMixin
 
+PREVIEW_LENGTH = 100  # Длина сохраняемого начала последнего сообщения диалога
+
 
 class Dialog(SqlAlchemyBase, SerializerMixin):
     """ Класс-модель для описания диалогов пользователей в базе данных """
 
     __tablename__ = 'dialogs'
+    __table_args__ = (
+        sqlalchemy.Index('ix_dialogs_id1_id2', 'id1', 'id2'),
+        sqlalchemy.Index('ix_dialogs_id2_id1', 'id2', 'id1'),
+    )
 
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
 
     # Первый участник диалога
     id1 = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('users.id'))
-    user1 = orm.relationship('User', foreign_keys=[id1], lazy='subquery')
+    user1 = orm.relationship('User', foreign_keys=[id1])
     #
 
     # Второй участник диалога
     id2 = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('users.id'))
-    user2 = orm.relationship('User', foreign_keys=[id2], lazy='subquery')
+    user2 = orm.relationship('User', foreign_keys=[id2])
     #
 
     # Все сообщения диалога
     messages = orm.relationship('Message', back_populates='dialog', order_by='Message.send_date',
-                                lazy='dynamic')
+                                foreign_keys='Message.dialog_id', lazy='dynamic')
+
+    # Сводка по диалогу. Обновляется в той же транзакции, что и добавление/чтение сообщений
+    last_message_id = sqlalchemy.Column(sqlalchemy.Integer,
+                                        sqlalchemy.ForeignKey('messages.id', use_alter=True,
+                                                              name='fk_dialogs_last_message_id'))
+    last_message = orm.relationship('Message', foreign_keys=[last_message_id], post_update=True)
+    last_message_preview = sqlalchemy.Column(sqlalchemy.String)
+    last_message_date = sqlalchemy.Column(sqlalchemy.DateTime, index=True)
+    unread1 = sqlalchemy.Column(sqlalchemy.Integer, default=0, nullable=False)  # Непрочитано у id1
+    unread2 = sqlalchemy.Column(sqlalchemy.Integer, default=0, nullable=False)  # Непрочитано у id2
+    #
+
+    @staticmethod
+    def user_dialogs(session, user_id):
+        """ Метод возвращает непустые диалоги пользователя, отсортированные по последней активности """
+        return session.query(Dialog).options(
+            orm.joinedload(Dialog.last_message), orm.selectinload(Dialog.user1),
+            orm.selectinload(Dialog.user2)
+        ).filter(
+            sqlalchemy.or_(Dialog.id1 == user_id, Dialog.id2 == user_id),
+            Dialog.last_message_id.isnot(None)
+        ).order_by(Dialog.last_message_date.desc()).all()
+
+    def unread_column(self, user_id):
+        """ Метод возвращает колонку счетчика непрочитанных сообщений участника диалога """
+        return Dialog.unread1 if int(user_id) == self.id1 else Dialog.unread2
+
+    def add_message(self, message):
+        """ Метод обновляет сводку диалога при добавлении нового сообщения """
+
+        message.send_date = message.send_date or dt.datetime.utcnow()
+
+        self.last_message = message
+        self.last_message_preview = message.content[:PREVIEW_LENGTH]
+        self.last_message_date = message.send_date
+
+        if int(message.id_from) != int(message.id_to):
+            self.change_unread_amount(message.id_to, 1)
+
+    def read_messages(self, user_id, amount=None):
+        """ Метод уменьшает счетчик непрочитанных сообщений участника (обнуляет, если amount=None) """
+        self.change_unread_amount(user_id, -amount if amount else None)
+
+    def change_unread_amount(self, user_id, delta=None):
+        """
+        Метод атомарно изменяет счетчики непрочитанных сообщений диалога и диалогов пользователя
+        на стороне базы данных (без чтения значений и без гонок между запросами)
+        :param user_id: id участника диалога, у которого меняется счетчик
+        :param delta: Изменение счетчика сообщений (None - счетчик обнуляется)
+        """
+
+        session = orm.object_session(self)
+        column = self.unread_column(user_id)
+
+        # Счетчик диалогов пользователя меняется, только если диалог становится непрочитанным
+        # (или прочитанным). Условие проверяется по значению до изменения в том же UPDATE
+        if delta is not None and delta > 0:
+            user_delta, condition = 1, column == 0
+        else:
+            user_delta, condition = -1, column > 0
+            if delta is not None:
+                condition = sqlalchemy.and_(condition, column <= -delta)
+
+        amount = User.unread_dialogs_amount
+        session.query(User).filter(
+            User.id == user_id, sqlalchemy.exists().where(Dialog.id == self.id, condition)
+        ).update({amount: case((amount + user_delta > 0, amount + user_delta), else_=0)},
+                 synchronize_session=False)
+        #
+
+        value = 0 if delta is None else case((column + delta > 0, column + delta), else_=0)
+        session.query(Dialog).filter(Dialog.id == self.id).update({column: value},
+                                                                   synchronize_session=False)
+        session.expire(self, [column.key])
 
     def unread_messages_amount(self, id_from):
         """ Метод возвращает количество непрочитанных сообщений в диалоге """
-
-        unw = filter(lambda message: message.id_from != id_from and not message.is_read,
-                     self.messages)
-        return sum(1 for _ in unw)
+        return self.unread1 if int(id_from) == self.id1 else self.unread2
 
     def unread_messages(self, id_from):
         """ Метод возвращает список непрочитанных сообщений """
@@ -43,22 +121,26 @@ class Message(SqlAlchemyBase, SerializerMixin):
     """ Класс-модель для описания сообщений в диалогах пользователей в базе данных """
 
     __tablename__ = 'messages'
+    __table_args__ = (  # Индексы под страницы диалога (с id для курсора) и непрочитанные сообщения
+        sqlalchemy.Index('ix_messages_dialog_id_send_date_id', 'dialog_id', 'send_date', 'id'),
+        sqlalchemy.Index('ix_messages_id_to_is_read', 'id_to', 'is_read'),
+    )
 
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
 
     # Диалог, к которому привязано сообщение
     dialog_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('dialogs.id'))
-    dialog = orm.relationship('Dialog')
+    dialog = orm.relationship('Dialog', foreign_keys=[dialog_id])
     #
 
     # Пользователь, отправивший сообщение
     id_from = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('users.id'))
-    user_from = orm.relationship('User', foreign_keys=[id_from], lazy='subquery')
+    user_from = orm.relationship('User', foreign_keys=[id_from])
     #
 
     # Пользователь, получивший сообщение
     id_to = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('users.id'))
-    user_to = orm.relationship('User', foreign_keys=[id_to], lazy='subquery')
+    user_to = orm.relationship('User', foreign_keys=[id_to])
     #
 
     # Данные сообщения
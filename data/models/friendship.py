@@ -7,36 +7,44 @@ class FriendshipOffer(SqlAlchemyBase):
     """ Класс-модель для описания предложений дружбы """
 
     __tablename__ = 'friendship_offers'
+    __table_args__ = (
+        sqlalchemy.Index('ix_friendship_offers_id_to_is_answered', 'id_to', 'is_answered'),
+        sqlalchemy.Index('ix_friendship_offers_id_from_id_to', 'id_from', 'id_to'),
+    )
 
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
 
     # Пользователь, отправивший запрос дружбы
     id_from = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('users.id'))
-    user_from = orm.relationship('User', foreign_keys=[id_from], lazy='subquery')
+    user_from = orm.relationship('User', foreign_keys=[id_from])
     #
 
     # Пользователь, получивший запрос дружбы
     id_to = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('users.id'))
-    user_to = orm.relationship('User', foreign_keys=[id_to], lazy='subquery')
+    user_to = orm.relationship('User', foreign_keys=[id_to])
     #
 
     # Состояние ответа на запрос
-    is_answered = sqlalchemy.Column(sqlalchemy.Boolean, default=False)
+    is_answered = sqlalchemy.Column(sqlalchemy.Boolean, default=False, nullable=False)
 
 
 class Friend(SqlAlchemyBase):
     """ Класс-модель для описания друзей """
 
     __tablename__ = 'friends'
+    __table_args__ = (
+        sqlalchemy.Index('ix_friends_id1_id2', 'id1', 'id2'),
+        sqlalchemy.Index('ix_friends_id2_id1', 'id2', 'id1'),
+    )
 
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
 
     # Первый участник дружбы
     id1 = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('users.id'))
-    user1 = orm.relationship('User', foreign_keys=[id1], lazy='subquery')
+    user1 = orm.relationship('User', foreign_keys=[id1])
     #
 
     # Второй участник дружбы
     id2 = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('users.id'))
-    user2 = orm.relationship('User', foreign_keys=[id2], lazy='subquery')
+    user2 = orm.relationship('User', foreign_keys=[id2])
     #
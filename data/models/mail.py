@@ -0,0 +1,36 @@
+import time
+
+import sqlalchemy
+import datetime as dt
+
+from ..db_session import SqlAlchemyBase
+from sqlalchemy_serializer import SerializerMixin
+
+
+class OutgoingMail(SqlAlchemyBase, SerializerMixin):
+    """ Класс-модель. Очередь писем на отправку (письма сохраняются до успешной отправки) """
+
+    __tablename__ = 'mail_outbox'
+    __table_args__ = (sqlalchemy.Index('ix_mail_outbox_status_next_attempt', 'status',
+                                       'next_attempt'),)
+
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
+
+    # Содержимое письма
+    subject = sqlalchemy.Column(sqlalchemy.String, nullable=False)
+    sender = sqlalchemy.Column(sqlalchemy.String, nullable=False)
+    recipients = sqlalchemy.Column(sqlalchemy.String, nullable=False)  # JSON список адресов
+    html = sqlalchemy.Column(sqlalchemy.Text)  # Удаляется после отправки письма
+    #
+
+    # Состояние отправки (pending - ждет отправки, sending - отправляется, sent, failed)
+    status = sqlalchemy.Column(sqlalchemy.String, nullable=False, default='pending')
+    attempts = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)
+    next_attempt = sqlalchemy.Column(sqlalchemy.Float, nullable=False, default=time.time)
+    locked_by = sqlalchemy.Column(sqlalchemy.String)  # Обработчик, который отправляет письмо
+    locked_at = sqlalchemy.Column(sqlalchemy.Float)
+    last_error = sqlalchemy.Column(sqlalchemy.String)
+    #
+
+    create_date = sqlalchemy.Column(sqlalchemy.DateTime, default=dt.datetime.now)
+    sent_date = sqlalchemy.Column(sqlalchemy.DateTime)
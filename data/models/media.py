@@ -0,0 +1,20 @@
+import sqlalchemy
+import datetime as dt
+
+from ..db_session import SqlAlchemyBase
+from sqlalchemy_serializer import SerializerMixin
+
+
+class Media(SqlAlchemyBase, SerializerMixin):
+    """
+    Класс-модель. Таблица загруженных медиафайлов. Ключ - SHA-256 загруженного содержимого,
+    refcount - количество записей (пользователей, постов), которые ссылаются на файл.
+    Одинаковые загрузки хранятся один раз, а файлы удаляются, когда ссылок не остается
+    """
+
+    __tablename__ = 'media'
+
+    key = sqlalchemy.Column(sqlalchemy.String(64), primary_key=True)
+    size = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)
+    refcount = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0, server_default='0')
+    create_date = sqlalchemy.Column(sqlalchemy.DateTime, default=dt.datetime.now)
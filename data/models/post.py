@@ -9,7 +9,9 @@ association_table = sqlalchemy.Table(
     'posts_to_tags',
     SqlAlchemyBase.metadata,
     sqlalchemy.Column('post_id', sqlalchemy.Integer, sqlalchemy.ForeignKey('posts.id')),
-    sqlalchemy.Column('tag_id', sqlalchemy.Integer, sqlalchemy.ForeignKey('tags.id'))
+    sqlalchemy.Column('tag_id', sqlalchemy.Integer, sqlalchemy.ForeignKey('tags.id')),
+    sqlalchemy.Index('ix_posts_to_tags_post_id_tag_id', 'post_id', 'tag_id'),
+    sqlalchemy.Index('ix_posts_to_tags_tag_id_post_id', 'tag_id', 'post_id')
 )
 
 
@@ -17,6 +19,12 @@ class Post(SqlAlchemyBase, SerializerMixin):
     """ Класс-модель. Таблица постов для базы данных """
 
     __tablename__ = 'posts'
+    __table_args__ = (  # Индексы под сортировки ленты и страницы пользователя (с id для курсора)
+        sqlalchemy.Index('ix_posts_author_create_date_id', 'author', 'create_date', 'id'),
+        sqlalchemy.Index('ix_posts_create_date_id', 'create_date', 'id'),
+        sqlalchemy.Index('ix_posts_likes_id', 'likes', 'id'),
+        sqlalchemy.Index('ix_posts_dislikes_id', 'dislikes', 'id'),
+    )
 
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
 
@@ -37,8 +45,8 @@ class Post(SqlAlchemyBase, SerializerMixin):
     #
 
     # Отметки и теги поста
-    rates = orm.relation('PostRate', back_populates='post', lazy='subquery')
-    tags = orm.relation('Tag', secondary='posts_to_tags', backref='post_id', lazy='subquery')
+    rates = orm.relation('PostRate', back_populates='post')
+    tags = orm.relation('Tag', secondary='posts_to_tags', backref='post_id')
     #
 
     create_date = sqlalchemy.Column(sqlalchemy.DateTime, default=dt.datetime.utcnow)
@@ -48,17 +56,21 @@ class PostRate(SqlAlchemyBase, SerializerMixin):
     """ Класс-модель. Таблица связи постов с пользователями и их оценкой поста для базы данных """
 
     __tablename__ = 'post_rate'
+    __table_args__ = (
+        sqlalchemy.Index('ix_post_rate_post_id_user_id', 'post_id', 'user_id', unique=True),
+        sqlalchemy.Index('ix_post_rate_user_id', 'user_id'),
+    )
 
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
 
     # Пост
     post_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('posts.id'))
-    post = orm.relation('Post', lazy='subquery')
+    post = orm.relation('Post')
     #
 
     # Автор поста
     user_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('users.id'))
-    user = orm.relation('User', lazy='subquery')
+    user = orm.relation('User')
     #
 
     value = sqlalchemy.Column(sqlalchemy.Integer)  # Значение оценки поста, данным юзером
@@ -9,6 +9,7 @@ from app.config import Config
 from sqlalchemy import orm
 from flask_login import UserMixin
 from ..db_session import SqlAlchemyBase
+from .friendship import Friend, FriendshipOffer
 from sqlalchemy_serializer import SerializerMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -19,7 +20,6 @@ class User(SqlAlchemyBase, UserMixin, SerializerMixin):
     __tablename__ = 'users'
 
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
-    sid = sqlalchemy.Column(sqlalchemy.String)
 
     # Информация о пользователе
     nickname = sqlalchemy.Column(sqlalchemy.String, nullable=False)
@@ -39,10 +39,12 @@ class User(SqlAlchemyBase, UserMixin, SerializerMixin):
     last_seen = sqlalchemy.Column(sqlalchemy.DateTime, default=dt.datetime.utcnow)
     #
 
+    # Количество диалогов с непрочитанными сообщениями (поддерживается моделью Dialog)
+    unread_dialogs_amount = sqlalchemy.Column(sqlalchemy.Integer, default=0, nullable=False)
+
     # Связи пользователя с различными моделями
-    posts = orm.relation("Post", back_populates="user", order_by='desc(Post.create_date)',
-                         lazy='subquery')
-    rates = orm.relation("PostRate", back_populates="user", lazy='subquery')
+    posts = orm.relation("Post", back_populates="user", order_by='desc(Post.create_date)')
+    rates = orm.relation("PostRate", back_populates="user")
 
     _subscribers = orm.relationship("FriendshipOffer", back_populates='user_to', lazy='dynamic',
                                     primaryjoin='User.id == FriendshipOffer.id_to')
@@ -50,12 +52,12 @@ class User(SqlAlchemyBase, UserMixin, SerializerMixin):
                                primaryjoin='User.id == FriendshipOffer.id_from')
     _friends = orm.relationship('Friend', lazy='dynamic',
                                 primaryjoin='or_(User.id == Friend.id1, User.id == Friend.id2)')
-    _unanswered_ss = orm.relationship("FriendshipOffer", back_populates='user_to', lazy='subquery',
+    _unanswered_ss = orm.relationship("FriendshipOffer", back_populates='user_to',
                                       primaryjoin='User.id == FriendshipOffer.id_to and not '
                                                   'FriendshipOffer.is_answered')
-    dialogs = orm.relationship('Dialog', lazy='subquery',
+    dialogs = orm.relationship('Dialog',
                                primaryjoin='or_(User.id == Dialog.id1, User.id == Dialog.id2)')
-    messages = orm.relationship('Message', back_populates='user_to', lazy='subquery',
+    messages = orm.relationship('Message', back_populates='user_to',
                                 primaryjoin='User.id == Message.id_to')
     notifications = orm.relationship('Notification', back_populates='user', lazy='dynamic')
     #
@@ -68,10 +70,6 @@ class User(SqlAlchemyBase, UserMixin, SerializerMixin):
         """ Метод проверяет пароль """
         return check_password_hash(self.password, password)
 
-    def set_sid(self, sid):
-        """ Метод устанавливает значение sid для подключение к WebSocket серверу """
-        self.sid = sid
-
     def get_token(self, expires_in=300):
         """ Метод генерирует токен для пользователя """
         return jwt.encode({'user': self.nickname, 'exp': time.time() + expires_in},
@@ -86,14 +84,6 @@ class User(SqlAlchemyBase, UserMixin, SerializerMixin):
             return
         return user_id
 
-    def add_notification(self, session, name, data):
-        """ Метод создает уведомление с указанным названием и информацией """
-        notification = Notification(name=name, data=json.dumps(data), user=self)
-
-        session.add(notification)
-        session.commit()
-        return notification
-
     def age(self) -> str:
         """ Метод возвращает возраст пользователя, основываясь на его дне рождения """
         born = self.birthday
@@ -104,46 +94,61 @@ class User(SqlAlchemyBase, UserMixin, SerializerMixin):
         else:
             return 'Не указано'
 
+    @staticmethod
+    def light_options() -> list:
+        """ Метод возвращает опции "легкой" загрузки пользователя (одна строка, без связей) """
+        return [orm.lazyload('*')]
+
     def subscribers(self):
         """ Метод возвращает список подписчиков пользователя """
-        return [offer.user_from for offer in sorted(self._subscribers, key=lambda o: o.is_answered)]
+        return self.subscribers_query().order_by(FriendshipOffer.is_answered).all()
 
     def unanswered_subscribers(self):
         """ Метод возвращает список подписчиков пользователя, которые ожидают ответ на запрос """
         return [offer for offer in self._unanswered_ss if not offer.is_answered]
 
+    def unanswered_subscribers_amount(self) -> int:
+        """ Метод возвращает количество подписчиков, ожидающих ответ на запрос (COUNT запросом) """
+        return orm.object_session(self).query(FriendshipOffer.id).filter(
+            FriendshipOffer.id_to == self.id, FriendshipOffer.is_answered.is_(False)).count()
+
     def need_answer(self, user):
         """ Метод проверяет нужно ли пользователю отвечать на запрос User-а """
         for offer in self._unanswered_ss:
-            if offer.user_from == user and not offer.is_answered:
+            if offer.id_from == user.id and not offer.is_answered:
                 return True
         return False
 
     def offers(self):
         """ Метод возвращает список пользователей, которым отправлен запрос дружбы """
-        return [offer.user_to for offer in self._offers]
+        return self.offers_query().all()
 
     def friends(self):
         """ Метод возвращает список друзей пользователя """
-        return [friend.user1 if friend.user1 != self else friend.user2 for friend in self._friends]
+        return self.friends_query().all()
 
-    def unread_dialogs(self):
-        """ Метод возвращает словарь диалогов с непрочитанными сообщениями для каждого диалога """
+    def friends_query(self):
+        """ Метод возвращает запрос друзей пользователя (без загрузки самих пользователей) """
+        ids = sqlalchemy.union(sqlalchemy.select(Friend.id2).where(Friend.id1 == self.id),
+                               sqlalchemy.select(Friend.id1).where(Friend.id2 == self.id))
+        return orm.object_session(self).query(User).filter(User.id.in_(ids))
 
-        dialogs = {}
-        for mes in [message for message in self.messages if not message.is_read]:
-            if dialogs.get(mes.id_from):
-                dialogs.get(mes.id_from).append(mes)
-            else:
-                dialogs[mes.id_from] = [mes]
+    def subscribers_query(self):
+        """ Метод возвращает запрос подписчиков пользователя (соединенный с FriendshipOffer) """
+        return orm.object_session(self).query(User).join(
+            FriendshipOffer, FriendshipOffer.id_from == User.id).filter(FriendshipOffer.id_to == self.id)
 
-        return dialogs
+    def offers_query(self):
+        """ Метод возвращает запрос пользователей, которым отправлен запрос дружбы """
+        return orm.object_session(self).query(User).join(
+            FriendshipOffer, FriendshipOffer.id_to == User.id).filter(FriendshipOffer.id_from == self.id)
 
 
 class Notification(SqlAlchemyBase, SerializerMixin):
     """ Класс-модель для хранения уведомлений для обновления на стороне клиента """
 
     __tablename__ = 'notifications'
+    __table_args__ = (sqlalchemy.Index('ix_notifications_user_id_id', 'user_id', 'id'),)
 
     # Название уведомления
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
@@ -152,7 +157,7 @@ class Notification(SqlAlchemyBase, SerializerMixin):
 
     # Пользователь, которому отправлено уведомление
     user_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('users.id'))
-    user = orm.relationship('User', lazy='subquery')
+    user = orm.relationship('User')
     #
 
     # Data уведомления
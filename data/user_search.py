@@ -0,0 +1,66 @@
+import sqlalchemy
+
+from sqlalchemy import case, func, literal_column, select
+
+from .models.user import User
+
+FTS_TABLE = 'users_fts'  # Полнотекстовый индекс (FTS5, trigram) по никнеймам пользователей
+MIN_MATCH_LENGTH = 3  # Минимальная длина запроса для поиска по триграммам
+
+fts_available = False  # Создан ли индекс (FTS5 с токенизатором trigram есть только в SQLite 3.34+)
+
+fts = sqlalchemy.table(FTS_TABLE, sqlalchemy.column('rowid'), sqlalchemy.column('rank'))
+
+
+def init_search_index(engine) -> bool:
+    """
+    Функция проверяет наличие поискового индекса по никнеймам пользователей (создается миграцией
+    d3a7c5e9f412)
+    :param engine: Движок базы данных
+    :return: True, если индекс доступен, иначе False (поиск будет работать через LIKE)
+    """
+
+    global fts_available
+
+    if engine.dialect.name != 'sqlite':
+        return False
+
+    with engine.connect() as connection:
+        fts_available = connection.execute(
+            sqlalchemy.text("SELECT name FROM sqlite_master WHERE name = :name"),
+            {'name': FTS_TABLE}).first() is not None
+
+    if not fts_available:
+        print('Поисковый индекс по никнеймам не создан (alembic upgrade head), поиск через LIKE')
+    return fts_available
+
+
+def search_users(query, text: str) -> tuple:
+    """
+    Функция фильтрует запрос пользователей по вхождению text в никнейм
+    :param query: Запрос пользователей (session.query(User)...)
+    :param text: Искомая подстрока никнейма
+    :return: Кортеж (запрос найденных пользователей, порядок сортировки для пагинации).
+             Сначала идут пользователи, никнейм которых начинается с text, затем по релевантности
+    """
+
+    text = text.strip()
+    pattern = text.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+    # Встроенная lower в SQLite не меняет регистр кириллицы - используется unicode_lower,
+    # добавленная в соединения SQLite (db_session.set_sqlite_functions)
+    lower = func.unicode_lower if query.session.get_bind().dialect.name == 'sqlite' else func.lower
+    nickname = lower(User.nickname)
+    prefix_first = case((nickname.like(pattern + '%', escape='\\'), 0), else_=1)
+
+    if fts_available and len(text) >= MIN_MATCH_LENGTH:  # Поиск по триграммному индексу
+        phrase = '"' + text.replace('"', '""') + '"'
+        matches = select(fts.c.rowid.label('user_id'), fts.c.rank.label('rank')).where(
+            literal_column(FTS_TABLE).op('MATCH')(phrase)).subquery()
+
+        query = query.join(matches, matches.c.user_id == User.id)
+        return query, [(prefix_first, 'asc'), (matches.c.rank, 'asc'), (User.id, 'asc')]
+
+    # Короткий запрос (или нет индекса) - поиск через LIKE без учета регистра
+    query = query.filter(nickname.like('%' + pattern + '%', escape='\\'))
+    return query, [(prefix_first, 'asc'), (User.id, 'asc')]
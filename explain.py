@@ -0,0 +1,75 @@
+""" Скрипт проверяет, что запросы страниц сайта используют индексы (EXPLAIN QUERY PLAN SQLite) """
+
+import sys
+
+from sqlalchemy import event
+
+from main import app
+from data import db_session
+
+# Страницы, запросы которых проверяются ({user_id} и {other_id} заменяются на id пользователей)
+routes = ['/index', '/index?sort=likes', '/index?tags=1', '/home_page/{user_id}',
+          '/friends/{user_id}', '/subscribers/{user_id}', '/offers/{user_id}',
+          '/add_friend_list/{user_id}', '/dialogs/{user_id}', '/dialog/{user_id}/{other_id}']
+
+
+def collect_queries(client, route: str) -> list:
+    """ Функция возвращает список запросов SELECT (sql, параметры), выполненных страницей """
+
+    queries = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        """ Внутренняя функция сохранения запроса """
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            queries.append((statement, parameters))
+
+    engine = db_session.engines['primary']
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(route)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    print(f'{route} - {response.status_code}, запросов: {len(queries)}')
+    return queries
+
+
+def explain(connection, statement: str, parameters) -> list:
+    """ Функция возвращает строки плана запроса, в которых таблица читается целиком (SCAN) """
+
+    plan = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+    return [row[-1] for row in plan
+            if row[-1].startswith('SCAN') and 'USING' not in row[-1] and 'CONSTANT' not in row[-1]]
+
+
+def main():
+    """ Основная функция скрипта. Аргументы: id авторизованного пользователя и собеседника """
+
+    user_id = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    other_id = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+
+    db_session.global_init('db/website.db')
+    if db_session.engines['primary'].dialect.name != 'sqlite':
+        raise ValueError('EXPLAIN QUERY PLAN is supported only by SQLite')
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    client = app.test_client()
+    with client.session_transaction() as session:  # Авторизация пользователя
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+    problems = 0
+    with db_session.engines['primary'].connect() as connection:
+        for route in routes:
+            route = route.format(user_id=user_id, other_id=other_id)
+            for statement, parameters in collect_queries(client, route):
+                scans = explain(connection, statement, parameters)
+                if scans:
+                    problems += 1
+                    print(f'    {", ".join(scans)}:\n        {" ".join(statement.split())}')
+
+    print(f'Запросов без индексов: {problems}')
+
+
+if __name__ == '__main__':
+    main()
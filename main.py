@@ -3,7 +3,7 @@ eventlet.monkey_patch()  # Очистка путей
 
 import os
 import math
-import uuid
+import time
 import locale
 import logging
 import threading
@@ -12,25 +12,43 @@ from dotenv import load_dotenv
 load_dotenv()  # Загрузка виртуальных переменных
 
 from urllib.parse import unquote
-from sqlalchemy import asc, desc, or_, and_
+from sqlalchemy import or_, and_
+from sqlalchemy.orm import Query
 from datetime import datetime as dt
 from logging.handlers import SMTPHandler
 
 from flask import Flask
-from flask import send_from_directory, render_template, redirect, request, url_for, jsonify
+from flask import render_template, redirect, request, url_for, jsonify, abort
+from flask import session as flask_session
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_mail import Mail
 from flask_moment import Moment
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, join_room
 
 from data import db_session
-from data.models.user import User, Notification
+from data.models.user import User
 from data.models.post import Post, PostRate, Tag
 from data.models.friendship import FriendshipOffer, Friend
 from data.models.dialogs import Dialog, Message
+from data.user_search import search_users
 
 from app.config import Config
-from app.mail import send_email
+from app.mail import MailOutbox
+from app.feed import suitable_posts_query, post_card_options, post_tag_ids, feed_order, \
+    feed_state, feed_state_args
+from app.feed_cache import FeedCache
+from app.pagination import paginate
+from app.relations import get_relation_map, reset_relation_maps
+from app.notifications import NotificationCenter
+from app.unread import UnreadCounters
+from app.presence import PresenceTracker
+from app.rating import RatingEngine
+from app.socket_queue import socket_options, user_room
+from app.connections import ConnectionRegistry
+from app.images import ImagePipeline, ImageError, variant_name
+from app.media import MediaStore, create_backend, is_media_key
+from app.static_files import StaticFiles, precompress
+from app.template_cache import FragmentCache, init_bytecode_cache, precompile
 from app.forms import RegistrationForm, LoginForm, EditUserForm, AddEditPostForm, DisplayPostForm, \
     SendMessageForm, ConfirmEmailForm, EditPasswordForm, FindUserForm
 
@@ -39,6 +57,8 @@ locale.setlocale(locale.LC_ALL, ('ru_RU', 'UTF-8'))
 # Инициализация приложения
 app = Flask(__name__, template_folder='templates')
 app.config.from_object(Config)
+app.teardown_appcontext(db_session.remove_session)  # Закрытие сессии базы данных после запроса
+fragments = FragmentCache()  # Готовые части шаблона письма
 
 # Подключение app для авторизации
 login_manager = LoginManager()
@@ -46,15 +66,38 @@ login_manager.init_app(app)
 login_manager.login_view = 'login'
 #
 
-# Подключение WebSocket сервера
-socket = SocketIO(app, cors_allowed_origins='http://127.0.0.1:5000')
+# Подключение WebSocket сервера (через очередь сообщений, если запущено несколько процессов)
+socket_queue = app.config.get('SOCKETIO_MESSAGE_QUEUE')
+socket = SocketIO(app, cors_allowed_origins='http://127.0.0.1:5000',
+                  **socket_options(socket_queue, app.config.get('SOCKETIO_CHANNEL', 'socketio')))
 thread = None
 thread_lock = threading.Lock()
+notifications = NotificationCenter(socket, app.config.get('NOTIFICATIONS_BACKLOG_SIZE', 100),
+                                   app.config.get('NOTIFICATIONS_BACKLOG_TTL', 600),
+                                   clustered=bool(socket_queue))
+unread_counters = UnreadCounters(app.config.get('UNREAD_COUNTERS_TTL', 60))
+presence = PresenceTracker(app.config.get('PRESENCE_FLUSH_INTERVAL', 30),
+                           app.config.get('ONLINE_TIMEOUT', 300))
+connections = ConnectionRegistry()
+static_files = StaticFiles(app, app.config.get('STATIC_ACCEL'),
+                           app.config.get('STATIC_ACCEL_PREFIX', '/protected/'))
+media = MediaStore(create_backend(app.config, static_files.send))
+images = ImagePipeline(media, workers=app.config.get('IMAGE_WORKERS', 4),
+                       max_bytes=app.config.get('IMAGE_MAX_BYTES', 10 * 1024 * 1024),
+                       quality=app.config.get('IMAGE_QUALITY', 85))
+feed_cache = FeedCache(app.config.get('FEED_CACHE_SIZE', 256), app.config.get('FEED_CACHE_TTL', 30))
+rating = RatingEngine(app.config.get('RATING_BUFFER_INTERVAL', 0),
+                      on_flush=lambda session, post_ids: feed_cache.invalidate(
+                          post_tag_ids(session, post_ids), fields=('likes', 'dislikes')))
+notifications.init_app(app)
 #
 
 # Подключение mail и moment app
 mail = Mail(app)
 moment = Moment(app)
+outbox = MailOutbox(mail, app.config.get('MAIL_WORKERS', 2), app.config.get('MAIL_BATCH_SIZE', 20),
+                    app.config.get('MAIL_MAX_ATTEMPTS', 6))
+outbox.init_app(app)
 #
 #
 
@@ -85,9 +128,6 @@ if not app.debug and app.config['MAIL_SERVER']:
 # Глобальные переменные
 host = '127.0.0.1'
 port = 5000
-clients = []
-filter_by = {'tags': []}
-sort_by = {'field': 'create_date', 'type': 'desc'}
 #
 
 
@@ -107,33 +147,38 @@ def internal_error(e):
 def connect():
     """ Функция подключения клиента к WebSocket """
 
-    print('connect')
-    clients.append(request.sid)
+    user_id = current_user.id if current_user.is_authenticated else None
+    connections.add(request.sid, user_id, request.args.get('transport'))  # Без записи в БД
 
-    if current_user.is_authenticated:  # Изменение sid текущего пользователя
-        session = db_session.create_session()
-        user = session.query(User).get(current_user.id)
-        user.set_sid(request.sid)
-        session.commit()
+    if user_id is not None:
+        join_room(user_room(user_id))  # Комната всех вкладок и устройств пользователя
+        notifications.flush(user_id, request.sid)  # Доставка уведомлений, пришедших вне сети
 
 
 @socket.on('disconnect')
 def disconnect():
     """ Функция для отключения клиента от WebSocket """
 
-    print('Client disconnected', clients)
-    clients.remove(request.sid)
+    connections.remove(request.sid)
 
 
 def send(event: str, message: str, receivers: list):
-    """ Функция отправляет сообщение от сервера клиентам """
+    """ Функция отправляет сообщение от сервера всем сокетам пользователей (список id) """
+
+    for user_id in receivers:  # Для каждого пользователя из получателей
+        if not socket_queue and not is_connected(user_id):  # Пользователь не подключен
+            print_warning(f'User {user_id} is not connected')
+        socket.emit(event, message, room=user_room(user_id))  # Отправление сообщения в комнату
+
+
+def notify(user: User, name: str, data):
+    """ Функция отправляет уведомление пользователю (или сохраняет его, если пользователь не в сети) """
+    notifications.push(user.id, user_room(user.id), name, data, online=is_connected(user.id))
+
 
-    print(event, message)
-    print(receivers, clients)
-    for client in receivers:  # Для каждого клиента из получателей
-        if client not in clients:  # Вывод предупреждающего сообщения, если клиент неизвестен
-            print_warning(f'Unknown client: "{client}". All connected clients: {clients}')
-        socket.emit(event, message, room=client)  # Отправление сообщения клиенту
+def is_connected(user_id: int) -> bool:
+    """ Функция проверяет, подключен ли пользователь к WebSocket серверу этого процесса """
+    return connections.is_online(user_id)
 
 
 def print_warning(text):
@@ -141,10 +186,17 @@ def print_warning(text):
     print("\033[33m{}\033[0m".format(text))
 
 
-def get_user(session, user_id, check_auth=True) -> User:
-    """ Функция возвращает объект класса User по user_id. Порождает ValueError в случае ошибки """
+def get_user(session, user_id, check_auth=True, options=None) -> User:
+    """
+    Функция возвращает объект класса User по user_id. Порождает ValueError в случае ошибки
+    :param session: Сессия общения с базой данных
+    :param user_id: id пользователя
+    :param check_auth: Необходимость проверить, что пользователь совпадает с current_user
+    :param options: Опции загрузки связей пользователя (по умолчанию связи загружаются лениво)
+    :return: Объект класса User
+    """
 
-    user = session.query(User).get(user_id)
+    user = session.query(User).options(*(options or [])).get(user_id)
 
     if not user:
         raise ValueError(f'There are no users with id: {user_id}')
@@ -157,9 +209,15 @@ def get_user(session, user_id, check_auth=True) -> User:
 def get_user_status_info(questioner_user: User, target_user) -> dict:
     """ Функция возвращает информацию для карточки пользователя в виде json """
 
-    response = {'buttons': None, 'status_text': None, 'status_style_color': None, 'type': None}
+    response = {'buttons': None, 'status_text': None, 'status_style_color': None, 'type': None,
+                'need_answer': False}
 
-    if target_user in questioner_user.friends():  # Карточка друга
+    # Отношения пользователя загружаются один раз за запрос, проверка для карточки - O(1)
+    relations = get_relation_map(questioner_user.id)
+    relation = relations.relation(target_user.id)
+    #
+
+    if relation == 'friend':  # Карточка друга
         response['buttons'] = [
             f'''<a class="btn btn-primary" href="{url_for('users_dialog', id_from=questioner_user.id, id_to=target_user.id)}">Написать</a>''',
             f'''<a class="btn btn-danger" href="javascript:card_type('remove_friend', {questioner_user.id}, {target_user.id})">Удалить из друзей</a>'''
@@ -167,17 +225,18 @@ def get_user_status_info(questioner_user: User, target_user) -> dict:
         response['status_text'] = ' - Друг'
         response['status_style_color'] = 'green'
         response['type'] = 'friend'
-    elif target_user in questioner_user.subscribers():  # Карточка подписчика
+    elif relation == 'subscriber':  # Карточка подписчика
         response['buttons'] = [
             f'''<a class="btn btn-success" href="javascript:card_type('add_friend', {questioner_user.id}, {target_user.id})">Принять заявку</a>'''
             f'''<a class="btn btn-primary" href="{url_for('users_dialog', id_from=questioner_user.id, id_to=target_user.id)}">Написать</a>'''
         ]
-        if questioner_user.need_answer(target_user):  # Добавление кнопки "Оставить в подписчиках"
+        if relations.need_answer(target_user.id):  # Добавление кнопки "Оставить в подписчиках"
+            response['need_answer'] = True
             response['buttons'].append(f'''<a id="user_{target_user.id}_sub_btn" class="btn btn-secondary" href="javascript:answer_offer({questioner_user.id}, {target_user.id})">Оставить в подписчиках</a>''')
         response['status_text'] = ' - Подписчик'
         response['status_style_color'] = 'red'
         response['type'] = 'subscriber'
-    elif target_user in questioner_user.offers():  # Карточка запроса в друзья
+    elif relation == 'offer':  # Карточка запроса в друзья
         response['buttons'] = [
             f'''<a class="btn btn-primary" href="{url_for('users_dialog', id_from=questioner_user.id, id_to=target_user.id)}">Написать</a>'''
             f'''<a class="btn btn-danger" href="javascript:card_type('remove_req', {questioner_user.id}, {target_user.id})">Отменить заявку</a>'''
@@ -197,18 +256,73 @@ def get_user_status_info(questioner_user: User, target_user) -> dict:
     return response
 
 
-def get_user_pagination_info(objects, referrer):
-    """ Функция возвращает данные для пагинации объектов """
+def get_user_pagination_info(objects, referrer, order=None, args=None):
+    """
+    Функция возвращает данные для пагинации объектов (списка или запроса к базе данных).
+    Для запроса необходимо указать порядок сортировки order (список пар (колонка, направление)),
+    args - дополнительные параметры запроса, которые сохраняются в ссылках на страницы
+    """
 
-    obj_type = 'USERS' if objects and isinstance(objects[0], User) else 'POSTS'
+    if isinstance(objects, Query):
+        obj_type = 'USERS' if objects.column_descriptions[0]['entity'] is User else 'POSTS'
+    else:
+        obj_type = 'USERS' if objects and isinstance(objects[0], User) else 'POSTS'
     pp = app.config[f'{obj_type}_PER_PAGE']  # Объектов на страницу
     page = request.args.get('page', 1, type=int) - 1  # Текущая страница
-    pages_amount = math.ceil(len(objects) / pp)  # Количество страниц
     referrer = referrer  # предыдущая страница
-    objects = objects[page * pp:(page + 1) * pp]  # Объекты для пагинации
+    next_cursor = None  # Курсор следующей страницы
+
+    if isinstance(objects, Query):  # Пагинация на стороне базы данных (по курсору или по номеру)
+        # Страницы по курсору получают количество страниц из ссылки (без COUNT запроса)
+        cursor, pages = request.args.get('cursor'), request.args.get('pages', type=int)
+        try:
+            info = paginate(objects, order, page, pp, cursor=cursor, count=not (cursor and pages))
+        except ValueError:  # Испорченный курсор в ссылке
+            abort(400)
+        objects, pages_amount, next_cursor = info['objects'], info['pages_amount'], info['next_cursor']
+        if pages_amount is None:
+            pages_amount = pages
+    else:
+        pages_amount = math.ceil(len(objects) / pp)  # Количество страниц
+        objects = objects[page * pp:(page + 1) * pp]  # Объекты для пагинации
+
+    return {'pp': pp, 'cur_page': page, 'pages_amount': pages_amount, 'next_cursor': next_cursor,
+            'referrer': referrer, 'args': args or {},
+            obj_type.lower(): objects}  # json-представление пагинации
+
+
+def get_feed_pagination(session, posts: Query, order: list, state: dict) -> dict:
+    """
+    Функция возвращает данные для пагинации ленты новостей. Страница ленты (id постов и данные
+    пагинации) берется из кэша, поэтому фильтрация, сортировка и подсчет страниц выполняются
+    только при промахе кэша
+    :param session: Сессия общения с базой данных
+    :param posts: Запрос постов ленты
+    :param order: Порядок сортировки постов
+    :param state: Параметры отображения ленты (feed_state)
+    :return: Данные пагинации (как у get_user_pagination_info)
+    """
+
+    page = request.args.get('page', 1, type=int) - 1
+    key = feed_cache.key(state, page, request.args.get('cursor'))
+
+    cached = feed_cache.get(key)
+    if cached is None:  # Страницы нет в кэше - выборка постов и сохранение страницы в кэш
+        pagination = get_user_pagination_info(posts, 'index', order, feed_state_args(state))
+        feed_cache.put(key, {'ids': [post.id for post in pagination['posts']],
+                             'pages_amount': pagination['pages_amount'],
+                             'next_cursor': pagination['next_cursor']})
+        return pagination
+
+    # Загрузка постов страницы по id одним запросом (порядок берется из кэша)
+    loaded = {post.id: post for post in session.query(Post).options(*post_card_options()).filter(
+        Post.id.in_(cached['ids']))}
+    posts = [loaded[post_id] for post_id in cached['ids'] if post_id in loaded]
+    #
 
-    return {'pp': pp, 'cur_page': page, 'pages_amount': pages_amount,
-            'referrer': referrer, obj_type.lower(): objects}  # json-представление пагинации
+    return {'pp': app.config['POSTS_PER_PAGE'], 'cur_page': page,
+            'pages_amount': cached['pages_amount'], 'next_cursor': cached['next_cursor'],
+            'referrer': 'index', 'args': feed_state_args(state), 'posts': posts}
 
 
 def get_post(session, post_id) -> Post:
@@ -221,30 +335,52 @@ def get_post(session, post_id) -> Post:
     return post
 
 
-def get_suitable_posts(session) -> list:
-    """ Метод возвращает список постов, подходящих под условия отбора """
+def accepts_webp() -> bool:
+    """ Функция проверяет, что браузер явно указал поддержку WebP в заголовке Accept """
+    return any(mimetype == 'image/webp' for mimetype, quality in request.accept_mimetypes)
 
-    def suit_tag(p) -> bool:
-        """ Внутрення функция проверки поста на соответствие указанным тегам """
-        pt = [str(tag.id) for tag in p.tags]
-        if set(pt).intersection(filter_tags):
-            return True
-        return not len(filter_tags)
 
-    filter_tags = filter_by['tags']
-    sort_func = {'asc': asc, 'desc': desc}
+def user_image_url(user: User, variant='thumb') -> str:
+    """ Функция возвращает адрес аватара пользователя (thumb, medium, original) """
 
-    # Сортировка и фильтрация постов
-    posts = session.query(Post).order_by(sort_func[sort_by['type']](getattr(Post, sort_by['field'])))
-    posts = list(filter(suit_tag, posts.all()))
-    #
+    if not is_media_key(user.img):  # Стандартный аватар и аватары, загруженные до хранилища
+        return url_for('static', filename=f'img/users_img/{user.img}.jpg')
+    return url_for('media_file', key=user.img, name=variant_name(variant, accepts_webp()))
+
+
+def post_image_url(post: Post, variant='medium') -> str:
+    """ Функция возвращает адрес картинки поста (thumb, medium, original) """
 
-    return posts
+    if not is_media_key(post.img):  # Картинки, загруженные до хранилища
+        return url_for('static', filename=f'img/post_img/{post.id}_{post.img}.jpg')
+    return url_for('media_file', key=post.img, name=variant_name(variant, accepts_webp()))
+
+
+def release_image(session, name: str, legacy_path=None):
+    """
+    Функция освобождает изображение, на которое перестала ссылаться запись. Файлы хранилища
+    удаляются вместе с последней ссылкой на них, старые файлы из static удаляются сразу
+    :param session: Сессия общения с базой данных
+    :param name: Имя изображения (ключ хранилища или имя старого файла)
+    :param legacy_path: Путь к файлу изображения, загруженного до появления хранилища
+    """
+
+    if is_media_key(name):
+        media.release(session, name)
+    elif name and name != 'default' and legacy_path:
+        try:
+            os.remove(legacy_path)
+        except FileNotFoundError:
+            print_warning(f'File not found: {legacy_path}')
 
 
 def main():
     """ Основная функция сервера """
     db_session.global_init('db/website.db')  # Инициализация сессии обращения к базе данных
+    outbox.start()  # Отправка писем, оставшихся в очереди после прошлого запуска
+    precompress(app.static_folder)  # Сжатые копии CSS и JS, измененных после прошлого запуска
+    init_bytecode_cache(app)  # Байткод шаблонов сохраняется на диск между запусками
+    precompile(app)  # Компиляция всех шаблонов до первого запроса
     socket.run(app, host=host, port=port)  # Запуск WebSocket сервера вместе с app
 
 
@@ -252,21 +388,44 @@ def main():
 def load_user(user_id):
     """ Обработчик загрузки пользователя (при логине или обращении к current_user """
     session = db_session.create_session()
-    return session.query(User).get(user_id)
+    return session.query(User).options(*User.light_options()).get(user_id)
 
 
 @app.route('/favicon.ico')
 def favicon():
     """ Обработчик иконки социальной сети """
-    return send_from_directory(os.path.join(app.root_path, 'static/img'), 'favicon.ico',
-                               mimetype='image/vnd.microsoft.icon')
+    return static_files.send(os.path.join(app.static_folder, 'img', 'favicon.ico'),
+                             mimetype='image/vnd.microsoft.icon',
+                             max_age=app.get_send_file_max_age('favicon.ico'))
+
+
+@app.route('/media/<key>/<name>')
+def media_file(key, name):
+    """ Обработчик файлов хранилища медиафайлов (кэшируются браузером навсегда) """
+
+    try:
+        return media.response(key, name)
+    except FileNotFoundError:
+        abort(404)
+
+
+@app.route('/socket_stats')
+@login_required
+def socket_stats():
+    """ Обработчик счетчиков подключений к WebSocket серверу (для мониторинга) """
+
+    if current_user.email not in app.config['ADMINS']:
+        abort(403)  # Без ошибки сервера (и письма администраторам)
+    return jsonify(connections.stats())
 
 
 @app.context_processor
 def app_context():
     """ Обработчик для создания контекста в шаблонах """
     context = {'date': dt.utcnow, 'user_info': get_user_status_info, 'isinstance': isinstance,
-               'Post': Post}
+               'Post': Post, 'unread_dialogs_amount': unread_counters.get,
+               'last_seen': presence.get_last_seen, 'is_online': presence.is_online,
+               'user_image': user_image_url, 'post_image': post_image_url}
     return context
 
 
@@ -274,17 +433,27 @@ def app_context():
 def before_request():
     """ Обработчик для действий до запроса """
 
-    # Обновление времени последнего посещения пользователя
+    # Обновление времени последнего посещения пользователя (запишется в базу данных позже)
     if current_user.is_authenticated:
-        session = db_session.create_session()
-        user = session.query(User).get(current_user.id)
+        presence.touch(current_user.id)
+    #
 
-        user.last_seen = dt.utcnow()
-        session.commit()
-        print(current_user.sid, clients)
+    # После изменений пользователь некоторое время читает из основной базы данных, чтобы
+    # страница после перенаправления показала изменения, еще не дошедшие до реплик
+    if flask_session.get('db_primary_until', 0) > time.time():
+        db_session.use_primary()
     #
 
 
+@app.after_request
+def after_request(response):
+    """ Обработчик для действий после запроса """
+
+    if db_session.engines['replicas'] and db_session.has_writes():
+        flask_session['db_primary_until'] = time.time() + app.config.get('DB_READ_YOUR_WRITES', 10)
+    return response
+
+
 @app.route('/', methods=['GET', 'POST'])
 @app.route('/index', methods=['GET', 'POST'])
 def index():
@@ -294,40 +463,42 @@ def index():
     if not current_user.is_authenticated:
         return redirect(url_for('login'))
 
-    session = db_session.create_session()
-
-    # получение тегов, постов, и оценок посты
-    tags = session.query(Tag).all()
-    posts = get_suitable_posts(session)
-
-    rates = {post_rate.post.id: post_rate.value for post_rate in current_user.rates}
-    #
-
     form = DisplayPostForm()  # Инициализация формы
 
+    # Параметры фильтрации и сортировки хранятся в строке запроса (у каждого пользователя свои)
     if request.method == 'POST':  # Обработка POST запроса
         if request.form.get('apply_btn'):  # Фильтровать и сортировать посты по указанным значениям
-            filter_by['tags'] = form.tags.data
-            sort_by['field'] = form.sort_by.data
-            sort_by['type'] = form.sort_type.data
+            state = feed_state(form.tags.data, form.sort_by.data, form.sort_type.data)
+            return redirect(url_for('index', **feed_state_args(state)))
         elif request.form.get('default_btn'):  # Стандартный вариант постов (показать все посты)
-            filter_by['tags'] = []
-            sort_by['field'] = 'create_date'
-            sort_by['type'] = 'desc'
+            return redirect(url_for('index'))
         else:
             raise ValueError(f'Server got POST from form without any known buttons. POST data: '
                              f'{request.form}')
-        return redirect(url_for('index'))
+    state = feed_state(request.args.getlist('tags'), request.args.get('sort'),
+                       request.args.get('order'))
+    #
+
+    session = db_session.create_read_session()
+
+    # получение тегов и постов
+    tags = session.query(Tag).all()
+    posts = suitable_posts_query(session, state['tags'])
+    #
 
     # Загрузка данных, по которым фильтруются посты
     form.tags.choices = [(tag.id, tag.name) for tag in tags]
-    form.tags.data = filter_by['tags']
-    form.sort_by.data = sort_by['field']
-    form.sort_type.data = sort_by['type']
+    form.tags.data = [str(tag) for tag in state['tags']]
+    form.sort_by.data = state['sort']
+    form.sort_type.data = state['order']
     #
 
+    order = feed_order(state['sort'], state['order'])
+    pagination = get_feed_pagination(session, posts, order, state)
+    rates = rating.states(session, [post.id for post in pagination['posts']], current_user.id)
+
     return render_template('posts.html', title='Новости', form=form, rates=rates, referrer='index',
-                           pagination=get_user_pagination_info(posts, 'index'), id=0)
+                           pagination=pagination, id=0)
 
 
 @app.route('/registration', methods=["GET", "POST"])
@@ -355,12 +526,11 @@ def registration():
         # Отправка сообщения на указанную почту для подтверждения почты
         link = f'http://{host}:{port}/verifying_email/{user.nickname}/{user.email}' \
                f'/{user.password}/{user.get_token()}'
-        send_email(
-            app=app, mail=mail,
+        outbox.send_email(
             subject='Change email',
             sender=app.config['ADMINS'][0],
             recipients=[form.email.data],
-            html_body=render_template('email_template.html', username=user.nickname, link=link)
+            html_body=fragments.render('email_template.html', username=user.nickname, link=link)
         )
         #
 
@@ -404,16 +574,27 @@ def logout():
 def home_page(user_id):
     """ Обработчик для домашней страницы пользователя """
 
-    session = db_session.create_session()
+    session = db_session.create_read_session()
 
     # Получение пользователя, его постов и оценок этих постов
     us = get_user(session, user_id, check_auth=False)
-    posts = session.query(Post).filter(Post.user == us).order_by(desc(Post.create_date)).all()
-    rates = {post_rate.post.id: post_rate.value for post_rate in current_user.rates}
+    posts = session.query(Post).options(*post_card_options()).filter(Post.author == us.id)
+    order = [(Post.create_date, 'desc'), (Post.id, 'desc')]
+    pagination = get_user_pagination_info(posts, 'home_page', order)
+    rates = rating.states(session, [post.id for post in pagination['posts']], current_user.id)
+    #
+
+    # Количество друзей и подписчиков (COUNT запросами) и первые из них для карточки профиля
+    friends, subscribers = us.friends_query(), us.subscribers_query()
+    relations = {'friends_amount': friends.count(),
+                 'friends': friends.order_by(User.id).limit(4).all(),
+                 'subscribers_amount': subscribers.count(),
+                 'subscribers': subscribers.order_by(FriendshipOffer.is_answered,
+                                                     User.id).limit(4).all()}
     #
 
     return render_template('home.html', title='Моя страница', user=us, rates=rates, referrer='home',
-                           pagination=get_user_pagination_info(posts, 'home_page'), id=user_id)
+                           pagination=pagination, id=user_id, **relations)
 
 
 @app.route('/edit_user/<int:user_id>', methods=["GET", "POST"])
@@ -436,6 +617,14 @@ def edit_user(user_id):
         form.about_me.data       = user.about_me
 
     if form.validate_on_submit():  # Обновление информации у пользователя
+        filename = None
+        if form.avatar.data:  # Аватар обрабатывается до изменения пользователя
+            try:  # Создание всех размеров нового аватара
+                filename = images.process(session, request.files['avatar'])
+            except ImageError as e:
+                form.avatar.errors.append(str(e))
+                return render_template("edit_user.html", title='Редактирование', form=form)
+
         user.nickname       = form.nickname.data
         user.status         = form.status.data or 'Не указано'
         user.sex            = form.sex.data
@@ -450,18 +639,9 @@ def edit_user(user_id):
         if form.remove_birthday.data:  # События для сокрытия даты
             user.birthday   = dt(1800, 1, 1)
 
-        if form.avatar.data:  # Если выбран аватар пользователя
-            if user.img != 'default':
-                try:  # Если изображение не стандартное, то пытаемся удалить старое
-                    os.remove(f'static/img/users_img/{user.img}.jpg')
-                except FileNotFoundError:
-                    print_warning(f'File not found: static/img/users_img/{user.img}.jpg')
-
-            # Создание нового аватара
-            filename = str(uuid.uuid4())  # Генерация случайного имени файла
-            request.files['avatar'].save(f'static/img/users_img/{filename}.jpg')
+        if filename:  # Если выбран аватар пользователя
+            release_image(session, user.img, f'static/img/users_img/{user.img}.jpg')
             user.img = filename
-            #
 
         session.commit()
 
@@ -485,12 +665,11 @@ def change_email(user_id):
         form.email.data = user.email
     if form.validate_on_submit():  # Отправление письма на новую почту
         link = f'http://{host}:{port}/finish_changing/{user_id}/{form.email.data}/{user.get_token()}'
-        send_email(
-            app=app, mail=mail,
+        outbox.send_email(
             subject='Change email',
             sender=app.config['ADMINS'][0],
             recipients=[form.email.data],
-            html_body=render_template('email_template.html', username=user.nickname, link=link)
+            html_body=fragments.render('email_template.html', username=user.nickname, link=link)
         )
         return redirect(url_for('check_email'))
 
@@ -551,12 +730,11 @@ def recover_password():
     if form.validate_on_submit():  # Отправка письма для подтверждения почты
         user = session.query(User).filter(User.email == form.email.data).first()
         link = f'http://{host}:{port}/new_password/{user.id}/{user.get_token()}'
-        send_email(
-            app=app, mail=mail,
+        outbox.send_email(
             subject='Recover password',
             sender=app.config['ADMINS'][0],
             recipients=[form.email.data],
-            html_body=render_template('email_template.html', username=user.nickname, link=link)
+            html_body=fragments.render('email_template.html', username=user.nickname, link=link)
         )
         return redirect(url_for('check_email'))
 
@@ -612,9 +790,8 @@ def delete_user_avatar(user_id):
     session = db_session.create_session()
     user = get_user(session, user_id)
 
-    if user.img != 'default':  # Если изображение не стандартное, то удалить файл с аватаркой
-        os.remove(f'static/img/users_img/{user.img}.jpg')
-        user.img = 'default'
+    release_image(session, user.img, f'static/img/users_img/{user.img}.jpg')
+    user.img = 'default'
 
     session.commit()
 
@@ -629,67 +806,28 @@ def edit_post_rate():
     # Получение данных
     value = int(request.form['value'])
     post_id = int(request.form['id'])
+    #
 
     session = db_session.create_session()
-    post = get_post(session, post_id)
+    response = rating.rate(session, post_id, current_user.id, value)
 
-    response = {'is_like': 0, 'is_dislike': 0, 'likes': post.likes, 'dislikes': post.dislikes}
-    post_rate = session.query(PostRate).filter(PostRate.post == post,
-                                               PostRate.user == current_user).first()
-    #
+    # Порядок ленты меняется только при сортировке по лайкам или дизлайкам. Накопленные
+    # изменения счетчиков сбрасывают ленту после записи (RatingEngine.on_flush)
+    if not rating.buffer_interval:
+        feed_cache.invalidate(post_tag_ids(session, [post_id]), fields=('likes', 'dislikes'))
+    return jsonify(response)
 
-    if value == 2:  # Заглушка для начальной загрузки информации о лайках
-        if post_rate:
-            response['is_like'] = post_rate.value == 1
-            response['is_dislike'] = post_rate.value == -1
-        return jsonify(response)
-
-    if not post_rate:  # Если данный пользователь не оценивал пост, то создаем новый объект PostRate
-        post_rate = PostRate(
-            post_id=post_id,
-            user_id=current_user.id,
-            value=value
-        )
-        session.add(post_rate)
-        if value == 1:  # Добавляем лайк
-            post.likes += 1
-        elif value == -1:  # Добавляем дизлайк
-            post.dislikes += 1
-        else:
-            raise ValueError(f"Incorrect value. Expected -1 or 1, got {value}")
-    else:  # Если пользователь уже оценивал пост, то изменяем его оценку
-        if value == 1:  # Если ставится и лайк и ..
-            if post_rate.value == 1:  # .. стоял лайк - убираем лайк
-                post_rate.value = 0
-                post.likes -= 1
-            elif post_rate.value in (0, -1):  # .. ничего не стояло или стоял дизлайк - ставим лайк
-                if post_rate.value == -1:  # Убираем запись о дизлайке, если такая была
-                    post.dislikes -= 1
-                post_rate.value = 1
-                post.likes += 1
-            else:
-                raise ValueError(f"Incorrect post_rate.value. Expected -1 or 0 or 1, got "
-                                 f"{post_rate.value}")
-        elif value == -1:  # Если ставится дизлайк и ..
-            if post_rate.value == -1:  # .. стоял дизлайк - убираем дизлайк
-                post_rate.value = 0
-                post.dislikes -= 1
-            elif post_rate.value in (0, 1):  # .. ничего не стояло или стоял лайк - ставим дизлайк
-                if post_rate.value == 1:  # Убираем запись о лайке, если такая была
-                    post.likes -= 1
-                post_rate.value = -1
-                post.dislikes += 1
-            else:
-                raise ValueError(f"Incorrect post_rate.value. Expected -1 or 0 or 1, got "
-                                 f"{post_rate.value}")
-        else:
-            raise ValueError(f"Incorrect value. Expected -1 or 1, got {value}")
 
-    response = {'is_like': post_rate.value == 1, 'is_dislike': post_rate.value == -1,
-                'likes': post.likes, 'dislikes': post.dislikes}
-    session.commit()
+@app.route('/post_rates', methods=['POST'])
+@login_required
+def post_rates():
+    """ Обработчик для получения состояния лайков/дизлайков сразу нескольких постов """
 
-    return jsonify(response)
+    post_ids = [int(post_id) for post_id in request.form.getlist('ids')]
+    session = db_session.create_read_session()
+
+    states = rating.states(session, post_ids, current_user.id)
+    return jsonify({str(post_id): state for post_id, state in states.items()})
 
 
 @app.route('/add_post', methods=['GET', 'POST'])
@@ -711,10 +849,20 @@ def add_post():
             return render_template('add_edit_post.html', title='Создать пост', form=form,
                                    message='Хотя бы одно поле должно быть заполнено')
 
+        image_name = None
+        if request.files.get('img'):  # Картинка обрабатывается до создания поста
+            try:
+                image_name = images.process(session, request.files['img'])
+            except ImageError as e:
+                form.img.errors.append(str(e))
+                return render_template('add_edit_post.html', title='Создать пост', form=form,
+                                       post=0)
+
         # Создание нового поста и тегов к нему
         post = Post(
             title=title,
             content=content,
+            img=image_name,
             author=current_user.id
         )
         post.tags = [session.query(Tag).filter(Tag.name == tag).first() for tag in form.tags.data]
@@ -722,12 +870,7 @@ def add_post():
         session.commit()
         #
 
-        if request.files.get('img'):  # Если добавлена картинка, то сохраняем ее
-            image_path = str(uuid.uuid4())  # Генерация случайного имени файла
-            post.img = image_path
-            session.commit()
-
-            request.files['img'].save(f'static/img/post_img/{post.id}_{image_path}.jpg')
+        feed_cache.invalidate([tag.id for tag in post.tags])  # Сброс страниц ленты с тегами поста
 
         return redirect(url_for('home_page', user_id=current_user.id))
 
@@ -751,24 +894,30 @@ def edit_post(post_id):
         form.tags.data    = [tag.name for tag in post.tags]
 
     if form.validate_on_submit():  # Сохранение измененной информации в post
+        image_name = None
+        if request.files.get('img'):  # Картинка обрабатывается до изменения поста
+            try:
+                image_name = images.process(session, request.files['img'])
+            except ImageError as e:
+                form.img.errors.append(str(e))
+                return render_template('add_edit_post.html', title='Изменить пост', form=form,
+                                       post=post)
+
+        old_tags = {tag.id for tag in post.tags}
+
         post.title   = form.title.data
         post.content = form.content.data
         post.tags    = [session.query(Tag).filter(Tag.name == tag).first() for tag in form.tags.data]
 
-        if request.files.get('img'):  # Если изменяли картинку ..
-            try:  # Удалить старую картинку, если возможно
-                os.remove(f'static/img/post_img/{post.id}_{post.img}.jpg')
-            except FileNotFoundError:
-                print_warning(f'File not found: static/img/post_img/{post.id}_{post.img}.jpg')
-
-            # .. то добавляем новую
-            filename = str(uuid.uuid4())  # Генерация случайного имени файла
-            request.files['img'].save(f'static/img/post_img/{post.id}_{filename}.jpg')
-            post.img = filename
-            #
+        if image_name:  # Если изменяли картинку, то добавляем новую
+            release_image(session, post.img, f'static/img/post_img/{post.id}_{post.img}.jpg')
+            post.img = image_name
 
         session.commit()
 
+        # Пост появляется или пропадает только в лентах с добавленными или удаленными тегами
+        feed_cache.invalidate(old_tags ^ {tag.id for tag in post.tags}, unfiltered=False)
+
         return redirect(url_for('home_page', user_id=post.author, _anchor=post_id))
 
     return render_template('add_edit_post.html', title='Изменить пост', form=form, post=post)
@@ -782,12 +931,17 @@ def delete_post(post_id):
     session = db_session.create_session()
     post = get_post(session, post_id)
 
+    tags = [tag.id for tag in post.tags]
+
     # Удаление всей информации поста
-    post.rates.clear()
+    session.query(PostRate).filter(PostRate.post_id == post.id).delete(synchronize_session=False)
+    release_image(session, post.img, f'static/img/post_img/{post.id}_{post.img}.jpg')
     session.delete(post)
     session.commit()
     #
 
+    feed_cache.invalidate(tags)  # Сброс страниц ленты, в которых был пост
+
     return redirect(url_for('home_page', user_id=current_user.id, _anchor='news'))
 
 
@@ -796,20 +950,26 @@ def delete_post(post_id):
 def friends(user_id):
     """ Обработчик отображения всех друзей """
 
-    session = db_session.create_session()
+    session = db_session.create_read_session()
 
     user = get_user(session, user_id, check_auth=False)
-    users = user.friends()
+    users = user.friends_query()
+    order = [(User.id, 'asc')]
     title = 'Мои друзья' if user == current_user else f'Друзья {user.nickname}'
 
     form = FindUserForm()
-    if form.validate_on_submit():  # Поиск среди всех друзей по nickname
-        if not form.nickname.data:
-            return redirect(url_for('friends', user_id=user_id))
-        users = list(filter(lambda u: form.nickname.data.lower() in u.nickname.lower(), users))
+    submitted = form.validate_on_submit()
+    if submitted and not form.nickname.data:
+        return redirect(url_for('friends', user_id=user_id))
+
+    nickname = form.nickname.data if submitted else request.args.get('nickname')
+    if nickname:  # Поиск среди всех друзей по nickname (через поисковый индекс)
+        users, order = search_users(users, nickname)
 
-    return render_template('users_list.html', title=title, users=users, form=form,
-                           method=request.method, c_user=user)
+    return render_template('users_list.html', title=title, form=form,
+                           method='POST' if nickname else request.method, c_user=user,
+                           pagination=get_user_pagination_info(users, 'friends', order,
+                                                               {'nickname': nickname}), id=user_id)
 
 
 @app.route('/subscribers/<int:user_id>', methods=['GET', 'POST'])
@@ -817,20 +977,26 @@ def friends(user_id):
 def subscribers(user_id):
     """ Обработчик отображения всех подписчиков """
 
-    session = db_session.create_session()
+    session = db_session.create_read_session()
 
     user = get_user(session, user_id, check_auth=False)
-    users = user.subscribers()
+    users = user.subscribers_query()
+    order = [(FriendshipOffer.is_answered, 'asc'), (User.id, 'asc')]
     title = 'Мои подписчики' if user == current_user else f'Подписчики {user.nickname}'
 
     form = FindUserForm()
-    if form.validate_on_submit():  # Поиск среди всех подписчиков по nickname
-        if not form.nickname.data:
-            return redirect(url_for('subscribers', user_id=user_id))
-        users = list(filter(lambda u: form.nickname.data.lower() in u.nickname.lower(), users))
+    submitted = form.validate_on_submit()
+    if submitted and not form.nickname.data:
+        return redirect(url_for('subscribers', user_id=user_id))
 
-    return render_template('users_list.html', title=title, users=users, form=form,
-                           method=request.method, c_user=user)
+    nickname = form.nickname.data if submitted else request.args.get('nickname')
+    if nickname:  # Поиск среди всех подписчиков по nickname (через поисковый индекс)
+        users, order = search_users(users, nickname)
+
+    return render_template('users_list.html', title=title, form=form,
+                           method='POST' if nickname else request.method, c_user=user,
+                           pagination=get_user_pagination_info(users, 'subscribers', order,
+                                                               {'nickname': nickname}), id=user_id)
 
 
 @app.route('/offers/<int:user_id>', methods=['GET', 'POST'])
@@ -838,19 +1004,25 @@ def subscribers(user_id):
 def offers(user_id):
     """ Обработчик отображения всех заявок в друзья """
 
-    session = db_session.create_session()
+    session = db_session.create_read_session()
 
     user = get_user(session, user_id, check_auth=False)
-    users = user.offers()
+    users = user.offers_query()
+    order = [(User.id, 'asc')]
 
     form = FindUserForm()
-    if form.validate_on_submit():  # Поиск среди всех заявок в друзья по nickname
-        if not form.nickname.data:
-            return redirect(url_for('offers', user_id=user_id))
-        users = list(filter(lambda u: form.nickname.data.lower() in u.nickname.lower(), users))
+    submitted = form.validate_on_submit()
+    if submitted and not form.nickname.data:
+        return redirect(url_for('offers', user_id=user_id))
+
+    nickname = form.nickname.data if submitted else request.args.get('nickname')
+    if nickname:  # Поиск среди всех заявок в друзья по nickname (через поисковый индекс)
+        users, order = search_users(users, nickname)
 
-    return render_template('users_list.html', title='Мои заявки', users=users, form=form,
-                           method=request.method, c_user=user)
+    return render_template('users_list.html', title='Мои заявки', form=form,
+                           method='POST' if nickname else request.method, c_user=user,
+                           pagination=get_user_pagination_info(users, 'offers', order,
+                                                               {'nickname': nickname}), id=user_id)
 
 
 @app.route('/add_friend_list/<int:user_id>', methods=['GET', 'POST'])
@@ -858,18 +1030,24 @@ def offers(user_id):
 def add_friend_page(user_id):
     """ Обработчик отображения всех пользователей социальной сети """
 
-    session = db_session.create_session()
+    session = db_session.create_read_session()
     user = get_user(session, user_id, check_auth=False)
 
-    users = session.query(User).filter(User.id != user_id).all()
+    users = session.query(User).filter(User.id != user_id)
+    order = [(User.id, 'asc')]
 
     form = FindUserForm()
-    if form.validate_on_submit():  # Поиск среди всех пользователей по nickname
-        users = list(filter(lambda u: form.nickname.data.lower() in u.nickname.lower(), users))
+    submitted = form.validate_on_submit()
+
+    nickname = form.nickname.data if submitted else request.args.get('nickname')
+    if nickname:  # Поиск среди всех пользователей по nickname (через поисковый индекс)
+        users, order = search_users(users, nickname)
 
     return render_template('users_list.html', title='Добавить друга', form=form,
-                           method=request.method, c_user=user,
-                           pagination=get_user_pagination_info(users, 'add_friend_page'), id=user_id)
+                           method='POST' if nickname else request.method, c_user=user,
+                           pagination=get_user_pagination_info(users, 'add_friend_page', order,
+                                                               {'nickname': nickname}),
+                           id=user_id)
 
 
 @app.route('/friendship_requests', methods=['POST'])
@@ -919,10 +1097,9 @@ def friendship_requests():
             #
 
             # Отправляем информацию о новом запросе дружбы на клиент
-            count = len(user_to.unanswered_subscribers())
+            count = user_to.unanswered_subscribers_amount()
             info = get_user_status_info(user_to, user_from)
-            user_to.add_notification(session, 'new_friendship_request', f'{count}+{info}')
-            send('update', 'add friendship request', [user_to.sid])
+            notify(user_to, 'new_friendship_request', f'{count}+{info}')
             #
         elif request_type == 'remove_req':  # Если удаляем запрос дружбы
             # Проверяем существование запроса и удаляем его (если запрос найден)
@@ -935,10 +1112,9 @@ def friendship_requests():
             # Если указанный пользователь ожидал ответ, то отправляем уведомление об изменении
             # пользователей, ожидающих ответ на запрос, на клиент
             if update_uns:
-                k, user_id = len(user_to.unanswered_subscribers()), user_from.id
+                k, user_id = user_to.unanswered_subscribers_amount(), user_from.id
                 info = get_user_status_info(user_to, user_from)
-                user_to.add_notification(session, 'new_friendship_request', f'{k}+{info}+{user_id}')
-                send('update', 'delete friendship request', [user_to.sid])
+                notify(user_to, 'new_friendship_request', f'{k}+{info}+{user_id}')
         elif request_type == 'add_friend':  # Если добавляем в друзья
             # Проверяем наличие запроса дружбы и удаляем его
             offer = get_offer_by_ids([id_from, id_to], [id_to, id_from])
@@ -978,9 +1154,10 @@ def friendship_requests():
         print_warning(e.__str__())
         text = '''При отправке запроса произошла ошибка.</br>Другой пользователь поменял состояние 
                   вашей дружбы.</br>Сейчас вы видите актуальное состояние дружбы.'''
-        send('warning', text, [user_from.sid])
+        send('warning', text, [user_from.id])
 
     session.commit()
+    reset_relation_maps()  # Дружба могла измениться, карты отношений нужно построить заново
 
     response = get_user_status_info(user_from, user_to)  # Получение информации для карточки
     return jsonify(response)
@@ -1002,7 +1179,7 @@ def answer_for_friendship_offer():
         print_warning(f'There are no FriendshipOffer between {user_from.id} and {user_to.id}')
         text = '''При отправке запроса произошла ошибка.</br>Другой пользователь поменял состояние 
                   вашей дружбы.</br>Обновите страницу, для получения актуальной информации.'''
-        send('error', text, [user_to.sid])  # Отправка ошибки на клиент
+        send('error', text, [user_to.id])  # Отправка ошибки на клиент
         return {'response': 'fail'}
 
     offer.is_answered = True
@@ -1016,16 +1193,13 @@ def answer_for_friendship_offer():
 def user_dialogs(user_id):
     """ Обработчик для отображения всех диалогов пользователя """
 
-    session = db_session.create_session()
+    session = db_session.create_read_session()
     user = get_user(session, user_id, check_auth=False)
 
-    # Информация о диалоге и его последнем сообщении
-    data = {dialog: dialog.messages[-1] for dialog in user.dialogs if list(dialog.messages)}
-    data = {dialog: data[dialog] for dialog in
-            sorted(data, key=lambda d: data[d].send_date, reverse=True)}
-    #
+    # Диалоги со сводкой о последнем сообщении (отсортированы по последней активности)
+    dialogs = Dialog.user_dialogs(session, user.id)
 
-    return render_template('dialogs.html', title='Диалоги', data=data, sender=current_user)
+    return render_template('dialogs.html', title='Диалоги', dialogs=dialogs, sender=current_user)
 
 
 @app.route('/dialog/<int:id_from>/<int:id_to>', methods=['GET', 'POST'])
@@ -1050,20 +1224,30 @@ def users_dialog(id_from, id_to):
     for message in dialog.unread_messages(id_from):
         message.is_read = True
         msg_ids.append(str(message.id))
+    dialog.read_messages(id_from)
     data = f'{user_from.id} {user_to.id},{" ".join(msg_ids)}'
 
     session.commit()
 
     # Отправка всех уведомлений на клиент
-    unm = len(user_from.unread_dialogs())
-    user_from.add_notification(session, 'unread_messages', unm)
-    user_to.add_notification(session, 'messages_read', data)
-    send('update', 'messages read (user opened dialog)', [user_to.sid, user_from.sid])
+    unm = unread_counters.refresh(user_from)
+    notify(user_from, 'unread_messages', unm)
+    notify(user_to, 'messages_read', data)
+    #
+
+    # Загрузка последних сообщений диалога (или более старых, если указан курсор)
+    order = [(Message.send_date, 'desc'), (Message.id, 'desc')]
+    try:
+        page = paginate(dialog.messages, order, 0, app.config.get('MESSAGES_PER_PAGE', 50),
+                        cursor=request.args.get('cursor'), count=False)
+    except ValueError:  # Испорченный курсор в ссылке
+        abort(400)
     #
 
     form = SendMessageForm()  # Инициализация формы для отправки сообщений
-    return render_template('dialog_page.html', title='Диалоги', messages=list(dialog.messages),
-                           user_to=user_to, form=form, dialog=dialog, unm=unm)
+    return render_template('dialog_page.html', title='Диалоги', messages=page['objects'][::-1],
+                           older_cursor=page['next_cursor'], user_to=user_to, form=form,
+                           dialog=dialog, unm=unm)
 
 
 @app.route('/append_message', methods=['POST'])
@@ -1085,7 +1269,11 @@ def append_message():
     user_to = get_user(session, id_to, check_auth=False)
     #
 
-    # Создание нового сообщения
+    dialog = session.query(Dialog).get(dialog_id)
+    if not dialog:
+        raise ValueError(f'There are no dialogs with id: {dialog_id}')
+
+    # Создание нового сообщения и обновление сводки диалога в одной транзакции
     message = Message(
         dialog_id=dialog_id,
         id_from=id_from,
@@ -1093,6 +1281,7 @@ def append_message():
         content=content
     )
     session.add(message)
+    dialog.add_message(message)
     session.commit()
 
     # Создание блоков сообщения для обоих пользователей
@@ -1105,21 +1294,15 @@ def append_message():
                   {message.content}</div>'''
     #
 
-    # Создание информации о диалоге и его последнем сообщении у пользователя
-    data = {dialog: dialog.messages[-1] for dialog in user_to.dialogs if list(dialog.messages)}
-    data = {dialog: data[dialog] for dialog in
-            sorted(data, key=lambda d: data[d].send_date, reverse=True)}
-    #
+    dialogs = Dialog.user_dialogs(session, user_to.id)  # Диалоги получателя со сводкой
 
     # Отправка всех уведомлений на клиент
-    user_to.add_notification(session, 'unread_messages', len(user_to.unread_dialogs()))
-    user_to.add_notification(session, 'need_update_dialogs',
-                             render_template('_dialogs_card.html', data=data, sender=user_to))
-    user_to.add_notification(session, 'need_add_message',
-                             f'{message.id}+++{message.send_date}+++{rec_msg}+++{id_from}')
-    user_from.add_notification(session, 'need_add_message',
-                               f'{message.id}+++{message.send_date}+++{own_msg}')
-    send('update', 'new user message', [user_to.sid, user_from.sid])
+    notify(user_to, 'unread_messages', unread_counters.refresh(user_to))
+    notify(user_to, 'need_update_dialogs',
+           render_template('_dialogs_card.html', dialogs=dialogs, sender=user_to))
+    notify(user_to, 'need_add_message',
+           f'{message.id}+++{message.send_date}+++{rec_msg}+++{id_from}')
+    notify(user_from, 'need_add_message', f'{message.id}+++{message.send_date}+++{own_msg}')
     #
 
     return {'response': 'success'}
@@ -1139,41 +1322,19 @@ def messages_read():
 
     # Изменение состояния сообщения (становится прочитанным)
     message = session.query(Message).get(request.form['id'])
-    message.is_read = True
+    if not message.is_read:
+        message.is_read = True
+        message.dialog.read_messages(message.id_to, 1)
     session.commit()
     #
 
     # Отправка всех уведомлений на клиент
-    user.add_notification(session, 'messages_read', f',{message.id}')
-    c_user.add_notification(session, 'unread_messages', len(c_user.unread_dialogs()))
-    send('update', 'messages read (user in dialog page)', [user.sid])
+    notify(user, 'messages_read', f',{message.id}')
+    notify(c_user, 'unread_messages', unread_counters.refresh(c_user))
     #
 
     return {'response': 'success'}
 
 
-@app.route('/notifications')
-@login_required
-def notifications():
-    """ Обработчик для получения всех уведомлений для пользователя """
-
-    session = db_session.create_session()
-    since = request.args.get('since', 0.0, type=float)
-
-    # Получение всех подходящих уведомлений
-    n = session.query(Notification).filter(Notification.timestamp > since, Notification.user ==
-                                           current_user).order_by(Notification.timestamp)
-    response = [{'name': ntf.name, 'data': ntf.get_data(), 'timestamp': ntf.timestamp}
-                for ntf in n]
-
-    # Удаление всех просмотренных уведомлений
-    for ntf in n:
-        session.delete(ntf)
-    session.commit()
-    #
-
-    return jsonify(response)
-
-
 if __name__ == '__main__':
     main()
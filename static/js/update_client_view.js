@@ -6,33 +6,47 @@ function like_state(post_id, value) {
         value: value
     })
         .done(function (response) {
-            if (response['is_like']) { // Изменение состояния лайка
-                $(`#like_${post_id}`).removeClass('btn-outline-success')
-                $(`#like_${post_id}`).addClass('btn-success')
-                $(`#like_${post_id} span`).text('+' + response['likes'])
-                $(`#like_${post_id} span`).css('color', 'black')
-            } else {
-                $(`#like_${post_id}`).removeClass('btn-success')
-                $(`#like_${post_id}`).addClass('btn-outline-success')
-                $(`#like_${post_id} span`).text('+' + response['likes'])
-                $(`#like_${post_id} span`).css('color', 'green')
-            }
+            set_like_state(post_id, response)
+        })
+}
 
-            if (response['is_dislike']) { // Изменение состояния дизлайка
-                $(`#dislike_${post_id}`).removeClass('btn-outline-danger')
-                $(`#dislike_${post_id}`).addClass('btn-danger')
-                $(`#dislike_${post_id} span`).text('-' + response['dislikes'])
-                $(`#dislike_${post_id} span`).css('color', 'black')
-            } else {
-                $(`#dislike_${post_id}`).removeClass('btn-danger')
-                $(`#dislike_${post_id}`).addClass('btn-outline-danger')
-                $(`#dislike_${post_id} span`).text('-' + response['dislikes'])
-                $(`#dislike_${post_id} span`).css('color', 'red')
+function update_like_states(post_ids) {
+    // Функция загружает состояние лайков сразу для нескольких постов одним запросом
+    $.post('/post_rates', $.param({ids: post_ids}, true))
+        .done(function (response) {
+            for (const post_id in response) {
+                set_like_state(post_id, response[post_id])
             }
-
         })
 }
 
+function set_like_state(post_id, response) {
+    // Функция отображает состояние лайка и дизлайка у поста
+    if (response['is_like']) { // Изменение состояния лайка
+        $(`#like_${post_id}`).removeClass('btn-outline-success')
+        $(`#like_${post_id}`).addClass('btn-success')
+        $(`#like_${post_id} span`).text('+' + response['likes'])
+        $(`#like_${post_id} span`).css('color', 'black')
+    } else {
+        $(`#like_${post_id}`).removeClass('btn-success')
+        $(`#like_${post_id}`).addClass('btn-outline-success')
+        $(`#like_${post_id} span`).text('+' + response['likes'])
+        $(`#like_${post_id} span`).css('color', 'green')
+    }
+
+    if (response['is_dislike']) { // Изменение состояния дизлайка
+        $(`#dislike_${post_id}`).removeClass('btn-outline-danger')
+        $(`#dislike_${post_id}`).addClass('btn-danger')
+        $(`#dislike_${post_id} span`).text('-' + response['dislikes'])
+        $(`#dislike_${post_id} span`).css('color', 'black')
+    } else {
+        $(`#dislike_${post_id}`).removeClass('btn-danger')
+        $(`#dislike_${post_id}`).addClass('btn-outline-danger')
+        $(`#dislike_${post_id} span`).text('-' + response['dislikes'])
+        $(`#dislike_${post_id} span`).css('color', 'red')
+    }
+}
+
 function card_type(request_type, id_from, id_to) {
     // Функция изменяет внешний вид карточки пользователя
     $.post('/friendship_requests', {
@@ -88,74 +102,77 @@ function set_unanswered_offers_count(id, n) {
     $('#unanswered_subscribers_count' + id).css('visibility', Number.parseInt(n) ? 'visible' : 'hidden')
 }
 
+function handle_notification(notification) {
+    // Функция обрабатывает уведомление, полученное от сервера
+    if (notification.name === 'unread_messages') { // Обработка уведомления об изменении количества непрочитанных диалогов
+        set_unread_dialogs_count(notification.data)
+    }
+    if (notification.name === 'new_friendship_request') { // Обработка уведомления о новом запросе дружбы
+        let data = notification.data.split('+')
+
+        set_unanswered_offers_count('1', data[0])
+        set_unanswered_offers_count('2', data[0])
+
+        if (document.location.href.split('/')[3] === 'subscribers') {
+            $(`#user_${data[2]}`).remove()
+        }
+    }
+    if (notification.name === 'need_update_dialogs') { // Обработка уведомления о необходимости обновить диалоги
+        if (document.location.href.split('/')[3] === 'dialogs') { // Изменение блока диалогов
+            $('#dialogs').html(notification.data)
+        }
+    }
+    if (notification.name === 'need_add_message') { // Обработка уведомления о добавлении сообщения
+        if (document.location.href.split('/')[3] === 'dialog') { // Добавление сообщение в диалог (на странице диалога между пользователями)
+            let data = notification.data.split('+++')
+            if ($(`#message_${data[0]}`).length) { // Сообщение уже отображено на странице
+                return
+            }
+            $('#messages').append(data[2])
+            set_time(`time_${data[0]}`, data[1], 'LLL')
+
+            if (data.length === 4) { // Обновление прочитанных сообщений
+                $.post('/messages_read', {id: data[0], user: data[3]})
+                set_unread_dialogs_count(Number.parseInt($('#dialogs_count').text()) - 1)
+            }
+        }
+    }
+    if (notification.name === 'messages_read') { // Обработка уведомления о прочитанных сообщений
+        if (document.location.href.split('/')[3] === 'dialogs') { // Обновление прочитанного диалога (если пользователь на странице всех диалогов)
+            let data = notification.data.split(',')
+            let ids = data[0].split(' ')
+            let target = $(`#${ids[0]}_${ids[1]}_dialog`).length ? $(`#${ids[0]}_${ids[1]}_dialog`) : $(`#${ids[1]}_${ids[0]}_dialog`)
+
+            $(target).text('Прочитано')
+            $(target).css('color', 'deepskyblue')
+        }
+        if (document.location.href.split('/')[3] === 'dialog') { // Обновление прочитанных сообщений в диалоге (если пользователь на странице диалога с пользователем)
+            let data = notification.data.split(',')
+            let msg_ids = data[1].split(' ')
+            for (let id in msg_ids) {
+                $(`#message_text_${msg_ids[id]}`).remove()
+            }
+        }
+    }
+}
+
 $(function () {
     // Подключение в WebSocket серверу
     let socket = io()
-    let since = 0
 
     console.log(socket)
     socket.on('connect', function() { // Обработка подключения к сессии
         console.log('connect complete!')
     });
 
-    socket.on('update', function (msg) { // Обработка всех уведомлений для пользователя
-        console.log('receive message from server: "' + msg + '"')
-        $.ajax('/notifications?since=' + since)
-            .done(function (notifications) { // Получение всех уведомлений для пользователя
-                for (let i = 0; i < notifications.length; i++) {
-                    if (notifications[i].name === 'unread_messages') { // Обработка уведомления об изменении количества непрочитанных диалогов
-                        console.log(notifications[i].data, 'aaa')
-                        set_unread_dialogs_count(notifications[i].data)
-                    }
-                    if (notifications[i].name === 'new_friendship_request') { // Обработка уведомления о новом запросе дружбы
-                        let data = notifications[i].data.split('+')
-
-                        set_unanswered_offers_count('1', data[0])
-                        set_unanswered_offers_count('2', data[0])
-
-                        if (document.location.href.split('/')[3] === 'subscribers') {
-                            $(`#user_${data[2]}`).remove()
-                        }
-                    }
-                    if (notifications[i].name === 'need_update_dialogs') { // Обработка уведомления о необходимости обновить диалоги
-                        if (document.location.href.split('/')[3] === 'dialogs') { // Изменение блока диалогов
-                            $('#dialogs').html(notifications[i].data)
-                        }
-                    }
-                    if (notifications[i].name === 'need_add_message') { // Обработка уведомления о добавлении сообщения
-                        if (document.location.href.split('/')[3] === 'dialog') { // Добавление сообщение в диалог (на странице диалога между пользователями)
-                            let data = notifications[i].data.split('+++')
-                            $('#messages').append(data[2])
-                            set_time(`time_${data[0]}`, data[1], 'LLL')
-
-                            if (data.length === 4) { // Обновление прочитанных сообщений
-                                $.post('/messages_read', {id: data[0], user: data[3]})
-                                console.log(Number.parseInt($('#dialogs_count').text()) - 1, 'bbb')
-                                set_unread_dialogs_count(Number.parseInt($('#dialogs_count').text()) - 1)
-                            }
-                        }
-                    }
-                    if (notifications[i].name === 'messages_read') { // Обработка уведомления о прочитанных сообщений
-                        if (document.location.href.split('/')[3] === 'dialogs') { // Обновление прочитанного диалога (если пользователь на странице всех диалогов)
-                            let data = notifications[i].data.split(',')
-                            let ids = data[0].split(' ')
-                            let target = $(`#${ids[0]}_${ids[1]}_dialog`).length ? $(`#${ids[0]}_${ids[1]}_dialog`) : $(`#${ids[1]}_${ids[0]}_dialog`)
-
-                            $(target).text('Прочитано')
-                            $(target).css('color', 'deepskyblue')
-                            console.log($(target).text(), ids)
-                        }
-                        if (document.location.href.split('/')[3] === 'dialog') { // Обновление прочитанных сообщений в диалоге (если пользователь на странице диалога с пользователем)
-                            let data = notifications[i].data.split(',')
-                            let msg_ids = data[1].split(' ')
-                            for (let id in msg_ids) {
-                                $(`#message_text_${msg_ids[id]}`).remove()
-                            }
-                        }
-                    }
-                    since = notifications[i].timestamp
-                }
-            })
+    socket.on('notification', function (notification) { // Обработка уведомления для пользователя
+        handle_notification(notification)
+    })
+
+    socket.on('notifications', function (notifications) { // Обработка уведомлений, пришедших, пока пользователь был не в сети
+        for (let i = 0; i < notifications.length; i++) {
+            handle_notification(notifications[i])
+        }
     })
 
     socket.on('error', function (msg) { // Обработка уведомлений об ошибках
@@ -203,3 +220,19 @@ function append_message(dialog_id, id_from, id_to) {
         }
     })
 }
+
+window.addEventListener('pageshow', function (event) {
+    // При возврате на страницу кнопками "назад"/"вперед" браузер показывает ее из кэша, и
+    // состояния лайков могли устареть - они загружаются заново одним запросом
+    const navigation = performance.getEntriesByType('navigation')[0]
+    if (!event.persisted && !(navigation && navigation.type === 'back_forward')) {
+        return
+    }
+
+    const post_ids = $('[id^=like_]').map(function () {
+        return this.id.split('_')[1]
+    }).get()
+    if (post_ids.length) {
+        update_like_states(post_ids)
+    }
+})
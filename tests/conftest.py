@@ -0,0 +1,73 @@
+import os
+import sys
+import uuid
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from app.config import Config
+except ImportError:  # app/config.py не хранится в репозитории (ключи и пароли), в тестах - свои настройки
+    class Config:
+        SECRET_KEY = 'test'
+        ADMINS = ['admin@test']
+        POSTS_PER_PAGE = 6
+        USERS_PER_PAGE = 5
+
+    config_module = types.ModuleType('app.config')
+    config_module.Config = Config
+    sys.modules['app.config'] = config_module
+
+# Тесты всегда работают с временной базой данных SQLite, а не с базой из настроек
+Config.DATABASE_URL = None
+Config.DATABASE_REPLICA_URLS = []
+
+
+@pytest.fixture(scope='session')
+def database(tmp_path_factory):
+    """ Фикстура инициализирует временную базу данных (одну на все тесты) """
+
+    from data import db_session
+
+    db_session.global_init(str(tmp_path_factory.mktemp('db') / 'test.db'))
+    return db_session
+
+
+@pytest.fixture
+def session(database):
+    """ Фикстура возвращает сессию общения с базой данных (закрывается после теста) """
+
+    yield database.create_session()
+    database.remove_session()
+
+
+@pytest.fixture
+def make_user(session):
+    """ Фикстура-фабрика пользователей с уникальной почтой """
+
+    from data.models.user import User
+
+    def make(nickname='user'):
+        user = User(nickname=nickname, email=f'{uuid.uuid4().hex}@test', password='-')
+        session.add(user)
+        session.commit()
+        return user
+
+    return make
+
+
+@pytest.fixture
+def make_post(session):
+    """ Фикстура-фабрика постов """
+
+    from data.models.post import Post
+
+    def make(author, **fields):
+        post = Post(author=author.id, title='title', content='content', **fields)
+        session.add(post)
+        session.commit()
+        return post
+
+    return make
@@ -0,0 +1,66 @@
+import pytest
+
+from data import db_session
+from data.db_session import SqlAlchemyBase
+from data.models.post import Tag
+
+
+@pytest.fixture
+def databases(database, tmp_path, monkeypatch):
+    """ Фикстура подключает основную базу данных и реплику (два файла SQLite) """
+
+    primary = db_session.create_engine(f'sqlite:///{tmp_path / "primary.db"}')
+    replica = db_session.create_engine(f'sqlite:///{tmp_path / "replica.db"}')
+    for engine, name in ((primary, 'primary'), (replica, 'replica')):
+        SqlAlchemyBase.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(Tag.__table__.insert(), {'name': name})
+
+    database.remove_session()
+    monkeypatch.setitem(db_session.engines, 'primary', primary)
+    monkeypatch.setitem(db_session.engines, 'replicas', [replica])
+    yield primary, replica
+    database.remove_session()
+
+
+def tag_names(session):
+    return [name for name, in session.query(Tag.name).order_by(Tag.id)]
+
+
+def test_reads_go_to_replica_and_writes_to_primary(databases):
+    primary, replica = databases
+
+    assert tag_names(db_session.create_read_session()) == ['replica']
+    assert tag_names(db_session.create_session()) == ['primary']
+    assert not db_session.has_writes()
+
+    session = db_session.create_session()
+    session.add(Tag(name='new'))
+    session.commit()
+
+    assert db_session.has_writes()
+    with primary.connect() as connection:
+        assert [row.name for row in connection.execute(Tag.__table__.select())] == \
+               ['primary', 'new']
+    assert tag_names(db_session.create_read_session()) == ['replica']  # Реплика отстает
+
+
+def test_bulk_update_counts_as_write(databases):
+    session = db_session.create_session()
+    session.query(Tag).filter(Tag.name == 'primary').update({Tag.name: 'updated'})
+    session.commit()
+
+    assert db_session.has_writes()
+    assert tag_names(db_session.create_read_session()) == ['replica']
+
+
+def test_use_primary_reads_own_writes(databases):
+    session = db_session.create_session()
+    session.add(Tag(name='new'))
+    session.commit()
+
+    db_session.use_primary()
+    assert tag_names(db_session.create_read_session()) == ['primary', 'new']
+
+    db_session.remove_session()  # Следующий запрос снова читает из реплики
+    assert tag_names(db_session.create_read_session()) == ['replica']
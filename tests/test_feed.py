@@ -0,0 +1,63 @@
+import time
+
+from app.feed import feed_state, post_tag_ids, suitable_posts_query
+from app.feed_cache import FeedCache
+from data.models.post import Post, Tag
+
+
+def test_feed_state_replaces_incorrect_values():
+    assert feed_state(['3', 1, 'x', '3'], 'password', 'up') == {
+        'tags': [1, 3], 'sort': 'create_date', 'order': 'desc'}
+
+
+def test_posts_filtered_by_any_tag(session, make_user, make_post):
+    author = make_user()
+    first, second = Tag(name=f'first-{author.id}'), Tag(name=f'second-{author.id}')
+    tagged = [make_post(author, tags=[first]), make_post(author, tags=[first, second]),
+              make_post(author, tags=[second])]
+    make_post(author)
+
+    query = suitable_posts_query(session, [first.id]).filter(Post.author == author.id)
+    assert sorted(post.id for post in query) == [tagged[0].id, tagged[1].id]
+
+    query = suitable_posts_query(session, [first.id, second.id]).filter(Post.author == author.id)
+    assert query.count() == 3  # Пост с обоими тегами не дублируется
+
+    assert post_tag_ids(session, [tagged[0].id, tagged[1].id]) == {first.id, second.id}
+    assert post_tag_ids(session, [tagged[2].id]) == {second.id}
+
+
+def page(cache, tags=(), sort='create_date'):
+    key = cache.key({'tags': list(tags), 'sort': sort, 'order': 'desc'}, 0)
+    cache.put(key, {'ids': []})
+    return key
+
+
+def test_invalidate_by_tags_and_fields():
+    cache = FeedCache()
+    unfiltered, first, second = page(cache), page(cache, [1]), page(cache, [2])
+    by_likes = page(cache, [1], 'likes')
+
+    cache.invalidate([1], fields=['likes'])
+    assert cache.get(by_likes) is None
+    assert cache.get(first) is not None and cache.get(unfiltered) is not None
+
+    cache.invalidate([1], unfiltered=False)
+    assert cache.get(first) is None
+    assert cache.get(unfiltered) is not None and cache.get(second) is not None
+
+    cache.invalidate([])
+    assert cache.get(unfiltered) is None and cache.get(second) is not None
+
+
+def test_ttl_and_size_limit():
+    cache = FeedCache(max_size=2, ttl=0.05)
+    first, second = page(cache, [1]), page(cache, [2])
+    cache.get(first)
+    third = page(cache, [3])  # Вытесняется давно не использованная страница
+
+    assert cache.get(second) is None
+    assert cache.get(first) is not None and cache.get(third) is not None
+
+    time.sleep(0.1)
+    assert cache.get(first) is None
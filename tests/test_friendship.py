@@ -0,0 +1,18 @@
+from data.models.friendship import Friend, FriendshipOffer
+
+
+def test_friend_and_subscriber_counts(session, make_user):
+    user, first, second, third = (make_user() for _ in range(4))
+    session.add_all([Friend(id1=user.id, id2=first.id), Friend(id1=second.id, id2=user.id),
+                     FriendshipOffer(id_from=third.id, id_to=user.id),
+                     FriendshipOffer(id_from=first.id, id_to=user.id, is_answered=True),
+                     FriendshipOffer(id_from=user.id, id_to=third.id)])
+    session.commit()
+
+    assert sorted(friend.id for friend in user.friends_query()) == [first.id, second.id]
+    assert user.friends_query().count() == 2
+    assert user.subscribers_query().count() == 2
+    assert user.unanswered_subscribers_amount() == 1
+    assert [offer.id_from for offer in user.unanswered_subscribers()] == [third.id]
+    assert [other.id for other in user.offers()] == [third.id]
+    assert third.unanswered_subscribers_amount() == 1
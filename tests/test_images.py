@@ -0,0 +1,94 @@
+import io
+import time
+import threading
+
+import pytest
+from PIL import Image
+
+from app import images
+from app.images import ImagePipeline, ImageError, variants, variant_name
+
+
+class FakeStore:
+    """ Класс-заменитель хранилища медиафайлов: файлы сохраняются в словарь """
+
+    def __init__(self):
+        self.files = {}
+
+    def put(self, session, data, build):
+        self.files = build(data)
+        return 'key'
+
+
+class Upload(io.BytesIO):
+    pass
+
+
+def image_bytes(size=(3000, 1500), image_format='PNG', mode='RGBA') -> bytes:
+    buffer = io.BytesIO()
+    Image.new(mode, size, (255, 0, 0, 0) if mode == 'RGBA' else 'red').save(buffer, image_format)
+    return buffer.getvalue()
+
+
+def noise_bytes() -> bytes:
+    buffer = io.BytesIO()
+    Image.effect_noise((200, 200), 50).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def test_all_variants_are_encoded():
+    store = FakeStore()
+    assert ImagePipeline(store).process(None, Upload(image_bytes())) == 'key'
+
+    assert set(store.files) == {variant_name(variant, webp) for variant in variants
+                                for webp in (False, True)}
+    for variant, size in variants.items():
+        jpeg = Image.open(io.BytesIO(store.files[variant_name(variant)]))
+        webp = Image.open(io.BytesIO(store.files[variant_name(variant, True)]))
+        assert (jpeg.format, webp.format) == ('JPEG', 'WEBP')
+        assert jpeg.size == webp.size == (size, size // 2)  # Пропорции сохраняются
+        assert jpeg.info.get('progressive')
+
+    thumb = Image.open(io.BytesIO(store.files['thumb.jpg'])).convert('RGB')
+    assert thumb.getpixel((0, 0)) > (240, 240, 240)  # Прозрачный фон заменяется белым
+
+
+@pytest.mark.parametrize('data, message', [
+    (b'', 'пустой'), (b'not an image', 'не является изображением'),
+    (image_bytes((10, 10), 'TIFF', 'RGB'), 'Неподдерживаемый формат'),
+    (noise_bytes()[:5000], 'поврежден')])
+def test_incorrect_files(data, message):
+    with pytest.raises(ImageError, match=message):
+        ImagePipeline(FakeStore()).process(None, Upload(data))
+
+
+def test_size_limits():
+    with pytest.raises(ImageError):
+        ImagePipeline(FakeStore(), max_bytes=100).process(None, Upload(image_bytes()))
+    with pytest.raises(ImageError, match='разрешение'):
+        ImagePipeline(FakeStore(), max_pixels=1000).process(None, Upload(image_bytes()))
+
+
+def test_workers_limit_concurrent_encoding(monkeypatch):
+    pipeline = ImagePipeline(FakeStore(), workers=2)
+    lock, active, peak = threading.Lock(), [0], [0]
+
+    def encode(data):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return {}
+
+    monkeypatch.setattr(pipeline, 'encode_variants', encode)
+    # Пул eventlet ждет результат через hub, поэтому в обычных потоках функция вызывается напрямую
+    monkeypatch.setattr(images.tpool, 'execute', lambda function, *args: function(*args))
+    threads = [threading.Thread(target=pipeline.build, args=(b'',)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert peak[0] == 2
@@ -0,0 +1,155 @@
+import json
+import time
+import socket
+import threading
+
+import pytest
+from flask import Flask
+from flask_mail import Mail
+from aiosmtpd.controller import Controller
+
+from app.mail import MailOutbox
+from data.models.mail import OutgoingMail
+
+
+class Sink:
+    """ Класс-обработчик SMTP сервера, сохраняющий полученные письма """
+
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return '250 OK'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp():
+    sink = Sink()
+    controller = Controller(sink, hostname='127.0.0.1', port=free_port())
+    controller.start()
+    yield controller
+    controller.stop()
+
+
+def create_outbox(port, **options):
+    app = Flask(__name__)
+    app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=port, MAIL_USE_TLS=False,
+                      MAIL_SUPPRESS_SEND=False)
+    outbox = MailOutbox(Mail(app), **options)
+    outbox.init_app(app)
+    return outbox
+
+
+@pytest.fixture
+def queue(session):
+    """ Фикстура очищает очередь писем и возвращает функцию добавления писем """
+
+    session.query(OutgoingMail).delete()
+    session.commit()
+
+    def add(amount):
+        rows = [OutgoingMail(subject=f'letter {i}', sender='site@test',
+                             recipients=json.dumps(['user@test']), html=f'<b>{i}</b>')
+                for i in range(amount)]
+        session.add_all(rows)
+        session.commit()
+        return [row.id for row in rows]
+
+    return add
+
+
+def states(session):
+    session.expire_all()
+    return {row.id: row for row in session.query(OutgoingMail)}
+
+
+def test_batch_is_sent_through_smtp(session, queue, smtp):
+    ids = queue(3)
+    outbox = create_outbox(smtp.port)
+
+    with outbox.app.app_context():
+        connection = outbox.send_batch(outbox.claim(), None)
+        outbox.close(connection)
+
+    assert len(smtp.handler.messages) == 3
+    assert all(b'<b>' in message.content for message in smtp.handler.messages)
+    rows = states(session)
+    assert [rows[i].status for i in ids] == ['sent'] * 3
+    assert all(rows[i].html is None and rows[i].sent_date for i in ids)
+
+
+def test_retry_with_backoff_while_server_is_down(session, queue):
+    first, *others = queue(3)
+    outbox = create_outbox(free_port(), retry_delay=10, max_attempts=2)  # Сервер не запущен
+
+    with outbox.app.app_context():
+        start = time.time()
+        assert outbox.send_batch(outbox.claim(), None) is None
+
+        rows = states(session)
+        assert rows[first].status == 'pending' and rows[first].attempts == 1
+        assert start + 8 <= rows[first].next_attempt <= time.time() + 12
+        assert 'ConnectionRefusedError' in rows[first].last_error
+        # Остальные письма пачки возвращаются в очередь без потери попытки
+        assert [(rows[i].status, rows[i].attempts, rows[i].locked_by) for i in others] == \
+               [('pending', 0, None)] * 2
+
+        # Письмо с ошибкой не берется до истечения задержки
+        claimed = outbox.claim()
+        assert first not in {row.id for row in claimed}
+
+        session.query(OutgoingMail).filter(OutgoingMail.id == first).update(
+            {OutgoingMail.next_attempt: 0})
+        session.commit()
+        outbox.send_batch([row for row in outbox.claim() if row.id == first], None)
+
+    row = states(session)[first]
+    assert row.status == 'failed' and row.attempts == 2
+
+
+def test_mail_is_claimed_by_one_worker(session, queue, database):
+    ids = queue(40)
+    outboxes = [create_outbox(free_port(), batch_size=7) for _ in range(2)]
+    claimed = [[] for _ in outboxes]
+    barrier = threading.Barrier(len(outboxes))
+
+    def work(outbox, result):
+        barrier.wait()
+        try:
+            while True:
+                rows = outbox.claim()
+                if not rows:
+                    return
+                result.extend(row.id for row in rows)
+        finally:
+            database.remove_session()
+
+    threads = [threading.Thread(target=work, args=args) for args in zip(outboxes, claimed)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    first, second = map(set, claimed)
+    assert not first & second  # Одно письмо не отправляется двумя обработчиками
+    assert sorted(first | second) == ids
+    assert len(claimed[0]) + len(claimed[1]) == len(ids)
+
+
+def test_stale_mail_is_claimed_again(session, queue):
+    mail_id, = queue(1)
+    outbox = create_outbox(free_port(), lock_timeout=60)
+
+    assert [row.id for row in outbox.claim()] == [mail_id]
+    assert outbox.claim() == []  # Письмо отправляется другим обработчиком
+
+    session.query(OutgoingMail).update({OutgoingMail.locked_at: time.time() - 120})
+    session.commit()
+    assert [row.id for row in outbox.claim()] == [mail_id]  # Обработчик остановился
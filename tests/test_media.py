@@ -0,0 +1,165 @@
+import io
+import os
+
+import pytest
+from flask import Flask
+
+from app.media import MediaStore, LocalBackend, S3Backend, media_key, shard
+from data.models.media import Media
+
+
+class ClientError(Exception):
+    pass
+
+
+class NoSuchKey(ClientError):
+    pass
+
+
+class FakeS3Client:
+    """ Класс-заменитель клиента boto3 для S3: объекты хранятся в словаре """
+
+    class exceptions:
+        ClientError = ClientError
+        NoSuchKey = NoSuchKey
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **options):
+        self.objects[Bucket, Key] = Body
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise ClientError(Key)
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise NoSuchKey(Key)
+        body = self.objects[Bucket, Key]
+        return {'Body': Body(body), 'ContentLength': len(body)}
+
+    def list_objects_v2(self, Bucket, Prefix):
+        return {'Contents': [{'Key': key} for bucket, key in self.objects
+                             if bucket == Bucket and key.startswith(Prefix)]}
+
+    def delete_objects(self, Bucket, Delete):
+        for item in Delete['Objects']:
+            self.objects.pop((Bucket, item['Key']))
+
+
+class Body(io.BytesIO):
+    def iter_chunks(self, chunk_size=1024):
+        return iter(lambda: self.read(chunk_size), b'')
+
+
+def build(data):
+    return {'full.png': data, 'thumb.png': data[:4]}
+
+
+@pytest.fixture(params=['local', 's3'])
+def store(request, tmp_path):
+    if request.param == 's3':
+        backend = S3Backend('bucket', 'media/', client=FakeS3Client())
+    else:
+        backend = LocalBackend(str(tmp_path))
+    store = MediaStore(backend)
+    yield store
+
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+    event.remove(Session, 'after_commit', store.delete_released)
+    event.remove(Session, 'after_transaction_end', store.delete_written)
+
+
+def refcount(session, key):
+    session.expire_all()
+    media = session.query(Media).get(key)
+    return media.refcount if media else 0
+
+
+def test_same_content_is_stored_once(session, store):
+    data = os.urandom(32)
+    key = store.put(session, data, build)
+    assert store.put(session, data, lambda data: pytest.fail('Файл создается повторно')) == key
+    session.commit()
+
+    assert key == media_key(data) and refcount(session, key) == 2
+    assert store.backend.exists(key, 'full.png') and store.backend.exists(key, 'thumb.png')
+
+    store.release(session, key)
+    session.commit()
+    assert refcount(session, key) == 1 and store.backend.exists(key, 'full.png')
+
+    store.release(session, key)
+    assert store.backend.exists(key, 'full.png')  # Файлы удаляются только после сохранения
+    session.commit()
+    assert refcount(session, key) == 0 and not store.backend.exists(key, 'full.png')
+
+
+def test_rollback_keeps_released_and_deletes_written(session, store):
+    kept, written = os.urandom(32), os.urandom(32)
+    kept_key = store.put(session, kept, build)
+    session.commit()
+
+    store.release(session, kept_key)
+    written_key = store.put(session, written, build)
+    session.rollback()
+
+    assert refcount(session, kept_key) == 1 and store.backend.exists(kept_key, 'full.png')
+    assert refcount(session, written_key) == 0
+    assert not store.backend.exists(written_key, 'full.png')
+
+
+def test_closed_session_deletes_written(database, store):
+    session = database.create_session()
+    key = store.put(session, os.urandom(32), build)
+    database.remove_session()  # Запрос завершился ошибкой, изменения не сохранены
+
+    assert not store.backend.exists(key, 'full.png')
+
+
+def test_files_of_reused_key_are_kept(session, store):
+    key = store.put(session, os.urandom(32), build)
+    session.commit()
+    store.release(session, key)
+    session.flush()
+
+    # Другой запрос загрузил тот же файл, пока удаление записи ключа сохранялось: запись снова
+    # есть в таблице, и файлы удалять нельзя
+    store.delete_unused(session, [key])
+    assert store.backend.exists(key, 'full.png')
+
+    session.commit()
+    assert not store.backend.exists(key, 'full.png')
+
+
+def test_response_headers(session, store):
+    data = os.urandom(256)
+    key = store.put(session, data, build)
+    session.commit()
+
+    app = Flask(__name__)
+    app.add_url_rule('/media/<key>/<name>', 'media', store.response)
+    client = app.test_client()
+
+    response = client.get(f'/media/{key}/full.png')
+    assert response.status_code == 200 and response.data == data
+    assert response.headers['Content-Type'] == 'image/png'
+    assert 'immutable' in response.headers['Cache-Control']
+
+    etag = response.headers['ETag']
+    response = client.get(f'/media/{key}/full.png', headers={'If-None-Match': etag})
+    assert response.status_code == 304 and response.data == b''
+
+    if isinstance(store.backend, LocalBackend):  # Частичная загрузка отдается через send_file
+        response = client.get(f'/media/{key}/full.png', headers={'Range': 'bytes=2-5'})
+        assert response.status_code == 206 and response.data == data[2:6]
+
+
+def test_incorrect_names(store):
+    with pytest.raises(FileNotFoundError):
+        store.response('x' * 64, 'full.png')
+    with pytest.raises(FileNotFoundError):
+        store.response(media_key(b'nothing'), '../full.png')
+    assert shard('abcdef') == 'ab/cd/abcdef'
@@ -0,0 +1,78 @@
+import time
+
+from flask import Flask
+
+from app.notifications import NotificationCenter
+from data.models.post import Tag
+from data.models.user import Notification
+
+
+class FakeSocket:
+    """ Класс-заменитель WebSocket сервера, сохраняющий отправленные сообщения """
+
+    def __init__(self, error=None):
+        self.sent = []
+        self.error = error
+
+    def emit(self, event, data, room=None):
+        if self.error:
+            raise self.error
+        self.sent.append((event, data, room))
+
+
+def test_offline_notifications_are_stored_and_flushed(session, make_user):
+    user = make_user()
+    socket = FakeSocket()
+    center = NotificationCenter(socket, backlog_size=2)
+
+    for i in range(3):
+        center.push(user.id, 'room', 'new_message', {'i': i}, online=False)
+    assert socket.sent == []
+
+    center.flush(user.id, 'sid')
+    (event, payloads, room), = socket.sent
+    assert (event, room) == ('notifications', 'sid')
+    assert [payload['data'] for payload in payloads] == [{'i': 1}, {'i': 2}]  # Только последние
+    assert session.query(Notification).filter(Notification.user_id == user.id).count() == 0
+
+
+def test_store_does_not_commit_request_session(session, make_user):
+    user = make_user()
+    session.add(Tag(name=f'uncommitted-{user.id}'))  # Несохраненное изменение запроса
+
+    NotificationCenter(FakeSocket()).store([(user.id, {'name': 'x', 'data': 1,
+                                                       'timestamp': time.time()})])
+    session.rollback()
+
+    assert session.query(Notification).filter(Notification.user_id == user.id).count() == 1
+    assert session.query(Tag).filter(Tag.name == f'uncommitted-{user.id}').count() == 0
+
+
+def test_online_notifications_are_sent_after_request(database):
+    app = Flask(__name__)
+    socket = FakeSocket()
+    center = NotificationCenter(socket)
+    center.init_app(app)
+
+    @app.route('/')
+    def index():
+        center.push(1, 'room', 'like', 1, online=True)
+        assert socket.sent == []  # Уведомление отправляется после обработки запроса
+        return 'ok'
+
+    assert app.test_client().get('/').status_code == 200
+    assert [(event, room) for event, data, room in socket.sent] == [('notification', 'room')]
+
+
+def test_delivery_errors_are_logged(database, caplog):
+    app = Flask(__name__)
+    center = NotificationCenter(FakeSocket(ConnectionError('queue is down')))
+    center.init_app(app)
+
+    @app.route('/')
+    def index():
+        center.push(1, 'room', 'like', 1, online=True)
+        return 'ok'
+
+    assert app.test_client().get('/').status_code == 200
+    assert 'Notification delivery error' in caplog.text
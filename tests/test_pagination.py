@@ -0,0 +1,59 @@
+import datetime as dt
+
+import pytest
+
+from app.pagination import decode_cursor, encode_cursor, paginate
+from data.models.post import Post
+
+
+def pages(query, order, per_page):
+    """ Функция обходит все страницы запроса по курсорам и возвращает их id """
+
+    result, cursor = [], None
+    while True:
+        page = paginate(query, order, 0, per_page, cursor=cursor, count=False)
+        result.append([post.id for post in page['objects']])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return result
+
+
+def test_cursor_round_trip():
+    values = [dt.datetime(2021, 4, 23, 18, 52, 24, 640102), 10, 'text']
+    assert decode_cursor(encode_cursor(values), 3) == values
+
+
+@pytest.mark.parametrize('cursor', ['garbage', encode_cursor([1, 2, 3]), encode_cursor('x')])
+def test_incorrect_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, 2)
+
+
+def test_keyset_pages_match_offset_pages(session, make_user, make_post):
+    author = make_user()
+    start = dt.datetime(2021, 1, 1)
+    for i in range(11):  # Одинаковые даты у пар постов - порядок определяет id
+        make_post(author, create_date=start + dt.timedelta(days=i // 2))
+
+    query = session.query(Post).filter(Post.author == author.id)
+    order = [(Post.create_date, 'desc'), (Post.id, 'desc')]
+    expected = [post.id for post in query.order_by(Post.create_date.desc(), Post.id.desc())]
+
+    by_cursor = pages(query, order, 4)
+    by_offset = [[post.id for post in paginate(query, order, page, 4)['objects']]
+                 for page in range(3)]
+
+    assert by_cursor == by_offset == [expected[0:4], expected[4:8], expected[8:]]
+    assert paginate(query, order, 0, 4)['pages_amount'] == 3
+
+
+def test_keyset_mixed_directions(session, make_user, make_post):
+    author = make_user()
+    for likes in (3, 1, 3, 2, 1):
+        make_post(author, likes=likes)
+
+    query = session.query(Post).filter(Post.author == author.id)
+    order = [(Post.likes, 'desc'), (Post.id, 'asc')]
+    expected = [post.id for post in query.order_by(Post.likes.desc(), Post.id.asc())]
+
+    assert sum(pages(query, order, 2), []) == expected
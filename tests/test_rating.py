@@ -0,0 +1,94 @@
+import pytest
+
+from app.rating import RatingEngine
+from data.models.post import Post, PostRate
+
+
+def counters(session, post):
+    session.expire_all()
+    return session.query(Post.likes, Post.dislikes).filter(Post.id == post.id).one()
+
+
+def test_rate_toggles_and_switches(session, make_user, make_post):
+    post, user = make_post(make_user()), make_user()
+    rating = RatingEngine()
+
+    assert rating.rate(session, post.id, user.id, 1) == {'is_like': True, 'is_dislike': False,
+                                                         'likes': 1, 'dislikes': 0}
+    assert rating.rate(session, post.id, user.id, -1)['is_dislike']  # Лайк меняется на дизлайк
+    assert tuple(counters(session, post)) == (0, 1)
+
+    assert rating.rate(session, post.id, user.id, -1)['is_dislike'] is False  # Повтор снимает
+    assert tuple(counters(session, post)) == (0, 0)
+    assert session.query(PostRate).filter(PostRate.post_id == post.id).count() == 1
+
+
+def test_create_rate_is_upsert(session, make_user, make_post):
+    post, user = make_post(make_user()), make_user()
+
+    assert RatingEngine.create_rate(session, post.id, user.id, 1)
+    assert not RatingEngine.create_rate(session, post.id, user.id, -1)  # Оценка уже есть
+    session.commit()
+    assert session.query(PostRate.value).filter(PostRate.post_id == post.id).all() == [(1,)]
+
+
+def test_rate_rejects_incorrect_values(session, make_user, make_post):
+    post, user = make_post(make_user()), make_user()
+
+    with pytest.raises(ValueError):
+        RatingEngine().rate(session, post.id, user.id, 2)
+    with pytest.raises(ValueError):
+        RatingEngine().rate(session, 10 ** 9, user.id, 1)
+
+
+def test_buffered_counters(session, make_user, make_post):
+    post = make_post(make_user())
+    rating = RatingEngine(buffer_interval=3600)
+
+    for _ in range(3):
+        result = rating.rate(session, post.id, make_user().id, 1)
+    assert result['likes'] == 3  # Ответ учитывает незаписанные изменения
+    assert tuple(counters(session, post)) == (0, 0)
+
+    rating.flush()
+    assert tuple(counters(session, post)) == (3, 0)
+    assert rating.pending == {}
+
+
+def test_failed_flush_keeps_changes(session, make_user, make_post, monkeypatch):
+    post = make_post(make_user())
+    rating = RatingEngine(buffer_interval=3600)
+    rating.buffer(post.id, 2, 1)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('database is locked')
+
+    monkeypatch.setattr(RatingEngine, 'apply', staticmethod(fail))
+    with pytest.raises(RuntimeError):
+        rating.flush()
+    rating.buffer(post.id, 1, 0)  # Изменение во время неудачной записи
+    assert rating.pending == {post.id: [3, 1]}
+
+    monkeypatch.undo()
+    rating.flush()
+    assert tuple(counters(session, post)) == (3, 1)
+
+
+def test_on_flush_is_called_after_commit(session, make_user, make_post, monkeypatch):
+    post, other = make_post(make_user()), make_post(make_user())
+    flushed = []
+    rating = RatingEngine(buffer_interval=3600,
+                          on_flush=lambda session, post_ids: flushed.append(sorted(post_ids)))
+
+    rating.rate(session, post.id, make_user().id, 1)
+    rating.rate(session, other.id, make_user().id, -1)
+    assert flushed == []  # Счетчики еще не записаны
+
+    rating.flush()
+    assert flushed == [sorted([post.id, other.id])]
+
+    monkeypatch.setattr(RatingEngine, 'apply', staticmethod(lambda *args: 1 / 0))
+    rating.buffer(post.id, 1, 0)
+    with pytest.raises(ZeroDivisionError):
+        rating.flush()
+    assert len(flushed) == 1  # Изменения не записаны - кэш не сбрасывается
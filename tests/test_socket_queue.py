@@ -0,0 +1,85 @@
+import time
+import uuid
+import threading
+
+import socketio
+
+from app.socket_queue import LocalQueueManager, user_room
+
+
+def create_server(channel: str):
+    """ Функция создает WebSocket сервер, подключенный к очереди внутри процесса """
+
+    manager = LocalQueueManager(channel=channel)
+    manager.ack_timeout = 0.5
+    server = socketio.Server(client_manager=manager, async_mode='threading')
+
+    # Чтение очереди (сервер запускает его при первом подключении клиента)
+    threading.Thread(target=manager._thread, daemon=True).start()
+
+    sent = []  # Сообщения, отправленные клиентам этого сервера
+    server._emit_internal = lambda eio_sid, event, data, namespace, id=None: sent.append(
+        (eio_sid, event, data))
+    return server, manager, sent
+
+
+def connect(manager: LocalQueueManager, eio_sid: str, user_id: int):
+    """ Функция подключает клиента пользователя к серверу (как обработчик connect) """
+
+    manager.server.eio.generate_id = lambda: uuid.uuid4().hex
+    sid = manager.connect(eio_sid, '/')
+    manager.enter_room(sid, '/', user_room(user_id), eio_sid=eio_sid)
+
+
+def wait(condition, timeout=2):
+    """ Функция ждет выполнения условия """
+
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_emit_reaches_client_of_other_server():
+    channel = uuid.uuid4().hex
+    first, _, first_sent = create_server(channel)
+    _, second_manager, second_sent = create_server(channel)
+    connect(second_manager, 'eio-1', 1)
+
+    first.emit('message', {'text': 'hi'}, room=user_room(1))
+
+    assert wait(lambda: second_sent)
+    assert second_sent == [('eio-1', 'message', {'text': 'hi'})]
+    assert first_sent == []
+
+
+def test_deliver_acknowledged_by_owner_is_not_missed():
+    channel = uuid.uuid4().hex
+    _, first_manager, first_sent = create_server(channel)
+    _, second_manager, second_sent = create_server(channel)
+    connect(second_manager, 'eio-1', 1)
+
+    missed = []
+    first_manager.deliver([(user_room(1), 'notification', {'name': 'offer'}),
+                           (user_room(2), 'notification', {'name': 'offer'})], missed.append)
+
+    assert wait(lambda: missed)
+    assert missed == [[1]]  # Пользователь 2 не подключен ни к одному серверу
+    assert second_sent == [('eio-1', 'notification', {'name': 'offer'})]
+    assert first_sent == []
+
+
+def test_deliver_to_all_servers_of_user_is_sent_once_per_client():
+    channel = uuid.uuid4().hex
+    _, first_manager, first_sent = create_server(channel)
+    _, second_manager, second_sent = create_server(channel)
+    connect(first_manager, 'eio-1', 1)
+    connect(second_manager, 'eio-2', 1)
+
+    missed = []
+    first_manager.deliver([(user_room(1), 'notification', {'name': 'badge'})], missed.append)
+    time.sleep(first_manager.ack_timeout + 0.2)
+
+    assert missed == []
+    assert first_sent == [('eio-1', 'notification', {'name': 'badge'})]
+    assert second_sent == [('eio-2', 'notification', {'name': 'badge'})]
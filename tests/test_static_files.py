@@ -0,0 +1,66 @@
+import gzip
+
+import pytest
+from flask import Flask
+
+from app.static_files import StaticFiles, precompress
+
+
+@pytest.fixture
+def app(tmp_path):
+    static = tmp_path / 'static'
+    (static / 'css').mkdir(parents=True)
+    (static / 'css' / 'main.css').write_text('body { color: red; }\n' * 100)
+    (static / 'logo.png').write_bytes(bytes(range(256)) * 4)
+
+    app = Flask(__name__, root_path=str(tmp_path), static_folder=str(static))
+    app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 60
+    return app
+
+
+def test_precompressed_copy_is_sent(app):
+    StaticFiles(app)
+    assert precompress(app.static_folder) >= 1  # Копия .gz (и .br, если установлен brotli)
+    assert precompress(app.static_folder) == 0  # Копии актуальны
+    client = app.test_client()
+
+    response = client.get('/static/css/main.css', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data).startswith(b'body')
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+    response = client.get('/static/css/main.css', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in response.headers and response.data.startswith(b'body')
+
+
+def test_conditional_and_range_requests(app):
+    StaticFiles(app)
+    client = app.test_client()
+
+    response = client.get('/static/logo.png')
+    assert response.status_code == 200 and response.headers['Cache-Control'] == 'public, max-age=60'
+
+    etag = response.headers['ETag']
+    assert client.get('/static/logo.png', headers={'If-None-Match': etag}).status_code == 304
+
+    response = client.get('/static/logo.png', headers={'Range': 'bytes=10-19'})
+    assert response.status_code == 206 and response.data == bytes(range(10, 20))
+    assert client.get('/static/missing.png').status_code == 404
+
+
+@pytest.mark.parametrize('accel, header, value', [
+    ('x-accel-redirect', 'X-Accel-Redirect', '/protected/static/logo.png'),
+    ('x-sendfile', 'X-Sendfile', 'static/logo.png')])
+def test_file_is_passed_to_proxy(app, accel, header, value):
+    StaticFiles(app, accel)
+    client = app.test_client()
+
+    response = client.get('/static/logo.png')
+    assert response.data == b'' and response.headers[header].endswith(value)
+    etag = response.headers['ETag']
+    assert client.get('/static/logo.png', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_unknown_accel_mode():
+    with pytest.raises(ValueError):
+        StaticFiles(accel='sendfile')
@@ -0,0 +1,41 @@
+import os
+
+import pytest
+from flask import Flask
+
+from app.template_cache import FragmentCache, init_bytecode_cache, precompile
+
+
+@pytest.fixture
+def app(tmp_path):
+    templates = tmp_path / 'templates'
+    templates.mkdir()
+    (templates / 'letter.html').write_text('<p>Привет, {{ name }}! {{ link }}</p>')
+    (templates / 'conditional.html').write_text('{% if name %}<b>{{ name }}</b>{% endif %}')
+
+    app = Flask(__name__, root_path=str(tmp_path))
+    app.config['TEMPLATE_CACHE_DIR'] = str(tmp_path / 'cache')
+    return app
+
+
+def test_bytecode_cache_is_created_on_init(app):
+    assert not os.path.exists(app.config['TEMPLATE_CACHE_DIR'])
+
+    init_bytecode_cache(app)
+    assert precompile(app) == 2
+    assert len(os.listdir(app.config['TEMPLATE_CACHE_DIR'])) == 2
+
+
+def test_fragments_match_render_template(app):
+    from flask import render_template
+
+    cache = FragmentCache()
+    with app.test_request_context():
+        for template, context in [('letter.html', {'name': '<Иван>', 'link': 'https://x/?a=1&b'}),
+                                  ('letter.html', {'name': 'Олег', 'link': ''}),
+                                  ('conditional.html', {'name': ''}),
+                                  ('conditional.html', {'name': 'Анна'})]:
+            assert cache.render(template, **context) == render_template(template, **context)
+
+    assert cache.fragments[('conditional.html', ('name',))] is None  # Зависит от значений
+    assert cache.fragments[('letter.html', ('link', 'name'))] is not None
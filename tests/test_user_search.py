@@ -0,0 +1,70 @@
+import os
+import glob
+import importlib.util
+
+import pytest
+from sqlalchemy import text
+
+from data import db_session, user_search
+from data.models.user import User
+from data.user_search import search_users
+
+
+@pytest.fixture(scope='module')
+def search_index(database):
+    """ Фикстура создает поисковый индекс так же, как миграция d3a7c5e9f412 """
+
+    path, = glob.glob(os.path.join(os.path.dirname(__file__), '..', 'alembic', 'versions',
+                                   'd3a7c5e9f412_*.py'))
+    spec = importlib.util.spec_from_file_location('fts_migration', path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+
+    engine = db_session.engines['primary']
+    if not user_search.init_search_index(engine):
+        with engine.begin() as connection:
+            for statement in migration.index_ddl:
+                connection.execute(text(statement))
+    assert user_search.init_search_index(engine)
+
+
+@pytest.fixture
+def users(session, make_user):
+    return [make_user(nickname) for nickname in ('Мишка', 'Большой МИШКА', 'Misha', 'Тест_1')]
+
+
+def found(session, users, text):
+    query = session.query(User).filter(User.id.in_([user.id for user in users]))
+    query, order = search_users(query, text)
+    return [users.index(user) for user in query.order_by(*(
+        column.asc() if direction == 'asc' else column.desc() for column, direction in order))]
+
+
+@pytest.mark.parametrize('fts', [True, False])
+def test_search_ignores_case_of_any_alphabet(session, users, search_index, monkeypatch, fts):
+    monkeypatch.setattr(user_search, 'fts_available', fts)
+
+    assert found(session, users, 'ми') == found(session, users, 'МИ') == [0, 1]
+    assert found(session, users, 'мишка') == [0, 1]  # Сначала никнеймы, начинающиеся с запроса
+    assert found(session, users, 'ШКА') == [0, 1]
+    assert found(session, users, 'mIs') == [2]
+
+
+def test_like_special_characters(session, users, search_index, monkeypatch):
+    monkeypatch.setattr(user_search, 'fts_available', False)
+
+    assert found(session, users, '_') == [3]
+    assert found(session, users, '%') == []
+
+
+def test_index_follows_nickname_changes(session, users, search_index):
+    users[2].nickname = 'Михаил'
+    session.commit()
+
+    assert found(session, users, 'мих') == [2]
+    assert found(session, users, 'misha') == []
+
+
+def test_builtin_lower_is_not_replaced(session):
+    assert session.execute(text("SELECT lower('МИШКА'), unicode_lower('МИШКА')")).one() == \
+           ('МИШКА', 'мишка')